@@ -6,6 +6,7 @@ from backup.config.loader import load_config
 from backup.config.logger import initialize_logger
 from backup.config.models import Config
 from backup.run import run_backup
+from backup.transport import close_sessions
 from backup.utils import format_object
 
 
@@ -23,9 +24,15 @@ def run_backups():
         logger.info("backup is disabled for configuration: '%s'", config.name)
         logger.info("backup will not be performed, exiting now")
     else:
-        run_backup(
-            config=config,
-        )
+        # the http sessions shared by the azure clients are closed once the backup
+        # has finished (or failed), closing every pooled connection.
+
+        try:
+            run_backup(
+                config=config,
+            )
+        finally:
+            close_sessions()
 
 
 # this is the main entry point for the application
@@ -0,0 +1,395 @@
+import grp
+import hashlib
+import io
+import json
+import logging
+import os
+import pwd
+import stat
+import tarfile
+import time
+
+from backup.archive.exclude import ExcludeMatcher
+from backup.archive.sparse import SparseReader, data_regions, sparse_tarinfo
+from backup.archive.walk import walk
+
+# the name of the archive member that lists the entries deleted since the
+# previous backup, this member is only present in incremental archives.
+
+DELETIONS_NAME = "./.backup-deletions.json"
+
+# the holes of sparse files are hashed as zeros, in blocks of this size, so large
+# holes are hashed without allocating a buffer as large as the hole.
+
+ZEROS = memoryview(bytes(1024 * 1024))
+
+
+class HashingReader(object):
+    """A readable file-like object that hashes all data read through it.
+
+    Args:
+        fileobj: The readable file-like object to wrap.
+
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.update(data)
+
+        return data
+
+    def update(self, data):
+        self.hash.update(data)
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+class SparseHashingReader(HashingReader):
+    """A readable file-like object that hashes the logical contents of a sparse file.
+
+    The sparse map read before the data regions is left out of the hash, and the holes
+    between the data regions are hashed as zeros (without being read), so the hash of
+    a sparse file matches the hash of the same contents archived without holes.
+
+    Args:
+        fileobj (SparseReader): The sparse reader to wrap, before anything is read.
+        size (int): The real size of the file.
+
+    """
+
+    def __init__(self, fileobj, size):
+        super().__init__(fileobj)
+        self.skip = len(fileobj.sparse_map)
+        self.regions = list(fileobj.regions)
+        self.size = size
+        self.region = 0
+        self.offset = 0
+        self.position = 0
+
+    def update(self, data):
+        view = memoryview(data)
+
+        if self.skip:
+            skipped = min(self.skip, len(view))
+            self.skip -= skipped
+            view = view[skipped:]
+
+        while view and self.region < len(self.regions):
+            start, length = self.regions[self.region]
+
+            if self.offset >= length:
+                self.region += 1
+                self.offset = 0
+                continue
+
+            self.update_zeros(start + self.offset - self.position)
+
+            size = min(len(view), length - self.offset)
+            self.hash.update(view[:size])
+            self.offset += size
+            self.position = start + self.offset
+            view = view[size:]
+
+    def update_zeros(self, length):
+        self.position += max(length, 0)
+
+        while length > 0:
+            self.hash.update(ZEROS[:length])
+            length -= len(ZEROS)
+
+    def hexdigest(self):
+        self.update_zeros(self.size - self.position)
+
+        return super().hexdigest()
+
+
+class Archiver(object):
+    """Write an uncompressed tar stream of a local directory.
+
+    The archiver walks the source directory, leaving out any entries that match the
+    exclude patterns, and adds every remaining entry to the archive. Compression is
+    left to the caller, the tar stream is written sequentially, so the file-like object
+    only needs to support `write`.
+
+    When a `manifest` is provided, the archiver records the state of every entry it
+    walks into the manifest, and a content hash of every file it archives. When a
+    `previous` manifest is also provided, the archive is incremental, only files
+    that are new or have changed since the previous manifest are archived, and a
+    list of the entries deleted since the previous manifest is added to the archive.
+
+    Files with holes are archived as GNU PAX 1.0 sparse members, so the holes are neither
+    read nor stored, and files with several hard links (identified by their device and
+    inode) are only stored once, any other links are archived as hard links.
+
+    Args:
+        src (str): The path to the directory to archive.
+        exclude (List[str]): The glob patterns of entries to exclude.
+        manifest (Manifest): An optional manifest to record the archived entries in.
+        previous (Manifest): An optional manifest of the previous backup, used to
+            create an incremental archive.
+        policy (CompressibilityPolicy): An optional policy used to store files that
+            aren't worth compressing without compression, this only has an effect when
+            the archive is written to a writer that supports `set_compress`.
+
+    """
+
+    def __init__(self, src, exclude=None, manifest=None, previous=None, policy=None):
+        self.src = src
+        self.matcher = ExcludeMatcher(exclude, root=src)
+        self.manifest = manifest
+        self.previous = previous
+        self.policy = policy
+
+        self._links = {}
+        self._set_compress = None
+        self._unames = {}
+        self._gnames = {}
+
+    def write(self, file):
+        """Write the archive to a file-like object.
+
+        Args:
+            file: A writable file-like object to write the tar stream to.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        if self.policy is not None:
+            self._set_compress = getattr(file, "set_compress", None)
+
+        with tarfile.open(fileobj=file, mode="w|") as tar:
+            for entry in walk(self.src, matcher=self.matcher):
+                self.add(tar, entry)
+
+            if self.previous is not None:
+                deleted = self.previous.deleted(self.manifest)
+
+                logger.info(
+                    "adding %s deleted entries to incremental archive", len(deleted)
+                )
+
+                self.add_deletions(tar, deleted)
+
+    def tarinfo(self, tar, entry):
+        """Create the tar header of a walked entry from its stat result.
+
+        This mirrors `tarfile.TarFile.gettarinfo`, but uses the stat result collected
+        while walking instead of stat'ing the entry again, and caches user and group
+        name lookups, which would otherwise be repeated for every entry.
+
+        Args:
+            tar (tarfile.TarFile): The archive the entry will be added to.
+            entry (WalkEntry): The entry to create the header of.
+
+        Returns:
+            tarfile.TarInfo: The header of the entry, or None if the entry is a type
+                of file that can't be archived (a socket, for example).
+
+        """
+        st = entry.stat
+        mode = st.st_mode
+
+        tarinfo = tarfile.TarInfo(entry.arcname)
+        tarinfo.tarfile = tar
+
+        if stat.S_ISREG(mode):
+            link = (st.st_dev, st.st_ino)
+
+            # files with more than one link are only archived the first time one
+            # of their links is walked, every other link is archived as a hard link
+            # to the first, so the contents are only stored once.
+
+            if st.st_nlink > 1 and link in self._links:
+                tarinfo.type = tarfile.LNKTYPE
+                tarinfo.linkname = self._links[link]
+            else:
+                tarinfo.type = tarfile.REGTYPE
+                tarinfo.size = st.st_size
+
+                if st.st_nlink > 1:
+                    self._links[link] = entry.arcname
+        elif stat.S_ISDIR(mode):
+            tarinfo.type = tarfile.DIRTYPE
+        elif stat.S_ISFIFO(mode):
+            tarinfo.type = tarfile.FIFOTYPE
+        elif stat.S_ISLNK(mode):
+            tarinfo.type = tarfile.SYMTYPE
+            tarinfo.linkname = os.readlink(entry.path)
+        elif stat.S_ISCHR(mode) or stat.S_ISBLK(mode):
+            tarinfo.type = tarfile.CHRTYPE if stat.S_ISCHR(mode) else tarfile.BLKTYPE
+            tarinfo.devmajor = os.major(st.st_rdev)
+            tarinfo.devminor = os.minor(st.st_rdev)
+        else:
+            return None
+
+        tarinfo.mode = stat.S_IMODE(mode)
+        tarinfo.uid = st.st_uid
+        tarinfo.gid = st.st_gid
+        tarinfo.mtime = st.st_mtime
+        tarinfo.uname = self._get_name(self._unames, pwd.getpwuid, st.st_uid)
+        tarinfo.gname = self._get_name(self._gnames, grp.getgrgid, st.st_gid)
+
+        return tarinfo
+
+    @staticmethod
+    def _get_name(cache, lookup, id):
+        if id not in cache:
+            try:
+                cache[id] = lookup(id)[0]
+            except KeyError:
+                cache[id] = ""
+
+        return cache[id]
+
+    def add(self, tar, entry):
+        """Add a single walked entry to the archive.
+
+        Args:
+            tar (tarfile.TarFile): The archive to add the entry to.
+            entry (WalkEntry): The entry to add.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        st = entry.stat
+
+        # unchanged files are left out of incremental archives before their header
+        # is created, so they're never registered as the target of a hard link.
+
+        if (
+            self.previous is not None
+            and stat.S_ISREG(st.st_mode)
+            and not self.previous.changed(entry.arcname, st)
+        ):
+            self.manifest.entries[entry.arcname] = self.previous.get(entry.arcname)
+            return
+
+        tarinfo = self.tarinfo(tar, entry)
+
+        if tarinfo is None:
+            logger.warning("skipping unsupported file type: '%s'", entry.path)
+            return
+
+        # directories, symbolic links and any other special files have no contents,
+        # they're cheap to archive, so they're always archived.
+
+        if not tarinfo.isreg() and not tarinfo.islnk():
+            tar.addfile(tarinfo)
+
+            if self.manifest is not None:
+                self.manifest.add(entry.arcname, st)
+            return
+
+        if tarinfo.islnk():
+            logger.debug("archiving hard link: '%s'", entry.path)
+            tar.addfile(tarinfo)
+
+            if self.manifest is not None:
+                linked = self.manifest.get(tarinfo.linkname)
+                self.manifest.add(entry.arcname, st, linked.hash if linked else None)
+            return
+
+        with open(entry.path, "rb") as file:
+            compress = self.compressible(entry, file)
+            reader = self.reader(tarinfo, file, st)
+
+            # the manifest records a hash of the logical contents of every file, so
+            # the hash of a file doesn't depend on whether it was archived sparse.
+
+            if self.manifest is not None and isinstance(reader, SparseReader):
+                reader = SparseHashingReader(reader, st.st_size)
+            elif self.manifest is not None:
+                reader = HashingReader(reader)
+
+            if not compress:
+                logger.debug("storing incompressible file: '%s'", entry.path)
+                self._set_compress(False)
+
+            try:
+                tar.addfile(tarinfo, fileobj=reader)
+            finally:
+                if not compress:
+                    self._set_compress(True)
+
+            if self.manifest is not None:
+                self.manifest.add(entry.arcname, st, reader.hexdigest())
+
+    def compressible(self, entry, file):
+        """Check whether the contents of a regular file are worth compressing.
+
+        Note that tarfile buffers up to a record (10 KiB) of the stream before writing it,
+        so compression is switched a little ahead of the file contents, which is why only
+        files of at least the policy `min_size` are ever stored without compression.
+
+        Args:
+            entry (WalkEntry): The entry of the file.
+            file: The opened file.
+
+        Returns:
+            bool: True if the file should be compressed, False otherwise.
+
+        """
+        if self.policy is None or self._set_compress is None:
+            return True
+
+        return self.policy.compressible(
+            entry.arcname,
+            fd=file.fileno(),
+            size=entry.stat.st_size,
+        )
+
+    def reader(self, tarinfo, file, st):
+        """Get a reader for the archived data of a regular file.
+
+        Files that have fewer blocks allocated than their size have holes, the holes
+        of these files are found without reading them, and the file is archived as a
+        sparse member, so only its data regions are read and stored.
+
+        Args:
+            tarinfo (tarfile.TarInfo): The header of the file, updated in place when
+                the file is archived as a sparse member.
+            file: The opened file.
+            st (os.stat_result): The stat result of the file.
+
+        Returns:
+            A readable file-like object of the data to archive for the file.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        if st.st_blocks * 512 >= tarinfo.size:
+            return file
+
+        regions = data_regions(file.fileno(), tarinfo.size)
+
+        if regions is None:
+            return file
+
+        logger.debug(
+            "archiving sparse file: '%s' (%s data regions)", tarinfo.name, len(regions)
+        )
+
+        sparse_map = sparse_tarinfo(tarinfo, regions)
+
+        return SparseReader(file.fileno(), sparse_map, regions)
+
+    def add_deletions(self, tar, deleted):
+        """Add the list of deleted entries to the archive.
+
+        Args:
+            tar (tarfile.TarFile): The archive to add the deletions to.
+            deleted (List[str]): The archive names of the deleted entries.
+
+        """
+        data = json.dumps(deleted).encode("utf-8")
+
+        tarinfo = tarfile.TarInfo(DELETIONS_NAME)
+        tarinfo.size = len(data)
+        tarinfo.mtime = int(time.time())
+
+        tar.addfile(tarinfo, fileobj=io.BytesIO(data))
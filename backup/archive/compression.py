@@ -0,0 +1,437 @@
+import collections
+import gzip
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from backup import settings
+
+
+def compress_gzip_member(data, level):
+    """Compress a block of data into a single, complete gzip member.
+
+    Gzip files may contain any number of members, and decompressing a file
+    made up of concatenated members yields the concatenation of the members
+    uncompressed data, this allows blocks of a stream to be compressed
+    independently (and concurrently), while still producing a valid gzip file.
+
+    Args:
+        data (bytes): The data to compress.
+        level (int): The compression level to use (0-9).
+
+    Returns:
+        bytes: The compressed gzip member.
+
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    return compressor.compress(data) + compressor.flush()
+
+
+class ParallelGzipWriter(object):
+    """A writable file-like object that compresses data written to it using
+    multiple threads, and writes the compressed data to an underlying file.
+
+    Data written is split into blocks of `block_size` bytes, each block is compressed
+    into its own gzip member on a thread pool, and the members are written to the underlying
+    file in the order they were written. The result is a valid multi-member gzip file, that
+    can be read by any gzip decompressor.
+
+    The `zlib` module releases the GIL while compressing, so a thread pool is able to use
+    multiple cores without the overhead of copying blocks between processes. At most two blocks
+    per worker are held in memory at once, writes block until a compressed block has been written
+    to the underlying file when this limit is reached.
+
+    Every gzip member carries its own deflate blocks, so compression can be switched off
+    and on between members with `set_compress`, data written while compression is off is
+    stored in uncompressed deflate blocks, which any gzip decompressor reads as usual.
+
+    Note that closing the writer does not close the underlying file.
+
+    Args:
+        fileobj: The writable file-like object to write compressed data to.
+        level (int): The compression level to use (0-9).
+        workers (int): The number of threads to compress blocks with, defaults
+            to `settings.BACKUP_COMPRESSION_CONCURRENCY`.
+        block_size (int): The size of the blocks to compress, defaults to
+            `settings.BACKUP_COMPRESSION_BLOCK_SIZE`.
+
+    Examples:
+        >>> with open("archive.tar.gz", "wb") as file:
+        ...     with ParallelGzipWriter(file, level=6) as writer:
+        ...         writer.write(b"data")
+
+    """
+
+    def __init__(self, fileobj, level=9, workers=None, block_size=None):
+        self.fileobj = fileobj
+        self.level = level
+        self.workers = workers or settings.BACKUP_COMPRESSION_CONCURRENCY
+        self.block_size = block_size or settings.BACKUP_COMPRESSION_BLOCK_SIZE
+
+        self._level = level
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        self._members = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        """Write data to be compressed.
+
+        Args:
+            data (bytes): The data to compress.
+
+        Returns:
+            int: The number of bytes written.
+
+        """
+        if self._closed:
+            raise ValueError("write to closed file")
+
+        self._buffer.extend(data)
+
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[: self.block_size])
+            del self._buffer[: self.block_size]
+            self._submit(block)
+
+        return len(data)
+
+    def set_compress(self, compress):
+        """Switch compression on or off for the data written next.
+
+        Any data written so far is compressed as its own block with the previous
+        setting, so switching only affects data written after this call.
+
+        Args:
+            compress (bool): Whether to compress data, when False data is stored
+                without compression.
+
+        """
+        level = self.level if compress else 0
+
+        if level == self._level:
+            return
+
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+
+        self._level = level
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Compress any remaining data, and wait for all pending blocks to be
+        written to the underlying file."""
+        if self._closed:
+            return
+
+        self._closed = True
+
+        try:
+            # an empty gzip member is still written when no data was written
+            # at all, so that the underlying file is always a valid gzip file.
+
+            if self._buffer or not self._members:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+
+            while self._pending:
+                self._drain()
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+        self.fileobj.flush()
+
+    def _submit(self, block):
+        while len(self._pending) >= self.workers * 2:
+            self._drain()
+
+        self._pending.append(
+            self._executor.submit(compress_gzip_member, block, self._level)
+        )
+        self._members += 1
+
+    def _drain(self):
+        self.fileobj.write(self._pending.popleft().result())
+
+
+class UncompressedWriter(object):
+    """A writable file-like object that writes data to an underlying file as is.
+
+    This is used as the writer for uncompressed archives, so that all codecs share
+    the same interface, note that closing the writer does not close the underlying file.
+
+    Args:
+        fileobj: The writable file-like object to write data to.
+
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.fileobj.write(data)
+
+    def set_compress(self, compress):
+        pass
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        self.fileobj.flush()
+
+
+class Codec(object):
+    """Base class for the compression codecs that archives can be compressed with.
+
+    A codec knows how to compress a stream of data locally, by wrapping a file-like object
+    in a compressing writer, and how to compress a stream of data on a remote machine, by
+    providing a shell command that can be used with `tar --use-compress-program`.
+
+    Attributes:
+        name (str): The name of the codec, as used in the directory configuration.
+        extension (str): The extension of archives compressed with the codec.
+        default_level (int): The compression level used when none is configured.
+        min_level (int): The lowest compression level supported by the codec.
+        max_level (int): The highest compression level supported by the codec.
+
+    """
+
+    name = None
+    extension = None
+    default_level = None
+    min_level = None
+    max_level = None
+
+    def open(self, fileobj, level=None, threads=None):
+        """Wrap a file-like object in a writer that compresses data written to it.
+
+        Args:
+            fileobj: The writable file-like object to write compressed data to.
+            level (int): The compression level to use, defaults to the codec default.
+            threads (int): The number of threads to compress with, defaults to
+                `settings.BACKUP_COMPRESSION_CONCURRENCY`.
+
+        Returns:
+            A writable file-like object, closing the writer flushes any remaining
+                compressed data, but does not close the underlying file-like object.
+
+        Raises:
+            NotImplementedError: If this method is called without
+                being overridden in a subclass.
+
+        """
+        raise NotImplementedError  # pragma: no cover
+
+    def reader(self, fileobj):
+        """Wrap a file-like object in a reader that decompresses data read from it.
+
+        Archives written by this application may be made up of several compressed
+        members or frames, the reader decompresses all of them as a single stream.
+
+        Args:
+            fileobj: The readable file-like object to read compressed data from.
+
+        Returns:
+            A readable file-like object of the decompressed data.
+
+        Raises:
+            NotImplementedError: If this method is called without
+                being overridden in a subclass.
+
+        """
+        raise NotImplementedError  # pragma: no cover
+
+    def command(self, level=None, threads=None):
+        """Get the shell command that compresses standard input with this codec.
+
+        Args:
+            level (int): The compression level to use, defaults to the codec default.
+            threads (int): The number of threads to compress with, where supported.
+
+        Returns:
+            str: The compression command, or None if no compression should be used.
+
+        Raises:
+            NotImplementedError: If this method is called without
+                being overridden in a subclass.
+
+        """
+        raise NotImplementedError  # pragma: no cover
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+    extension = "tar.gz"
+    default_level = 6
+    min_level = 1
+    max_level = 9
+
+    def open(self, fileobj, level=None, threads=None):
+        return ParallelGzipWriter(
+            fileobj,
+            level=self.default_level if level is None else level,
+            workers=threads,
+        )
+
+    def reader(self, fileobj):
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+
+    def command(self, level=None, threads=None):
+        return "gzip -%d" % (self.default_level if level is None else level)
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    extension = "tar.zst"
+    default_level = 3
+    min_level = 1
+    max_level = 19
+
+    def _import(self):
+        # zstandard is an optional dependency, we import it only when the codec
+        # is used, so the application doesn't require it unless an archive is
+        # actually configured to be compressed with zstd.
+
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                "the 'zstandard' package is required to use the zstd codec, "
+                "please install it with: pip install backup[compression]"
+            )
+
+        return zstandard
+
+    def open(self, fileobj, level=None, threads=None):
+        compressor = self._import().ZstdCompressor(
+            level=self.default_level if level is None else level,
+            threads=threads or settings.BACKUP_COMPRESSION_CONCURRENCY,
+        )
+
+        return compressor.stream_writer(fileobj, closefd=False)
+
+    def reader(self, fileobj):
+        decompressor = self._import().ZstdDecompressor()
+
+        return decompressor.stream_reader(
+            fileobj,
+            read_across_frames=True,
+            closefd=False,
+        )
+
+    def command(self, level=None, threads=None):
+        return "zstd -%d -T%d" % (
+            self.default_level if level is None else level,
+            threads or 0,
+        )
+
+
+class Lz4Codec(Codec):
+    name = "lz4"
+    extension = "tar.lz4"
+    default_level = 1
+    min_level = 1
+    max_level = 12
+
+    def _import(self):
+        # lz4 is an optional dependency, we import it only when the codec
+        # is used, so the application doesn't require it unless an archive is
+        # actually configured to be compressed with lz4.
+
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError(
+                "the 'lz4' package is required to use the lz4 codec, "
+                "please install it with: pip install backup[compression]"
+            )
+
+        return lz4.frame
+
+    def open(self, fileobj, level=None, threads=None):
+        # lz4 is fast enough that a single thread is rarely the bottleneck,
+        # so the threads setting is ignored for this codec.
+
+        return self._import().LZ4FrameFile(
+            fileobj,
+            mode="wb",
+            compression_level=self.default_level if level is None else level,
+        )
+
+    def reader(self, fileobj):
+        return self._import().LZ4FrameFile(fileobj, mode="rb")
+
+    def command(self, level=None, threads=None):
+        return "lz4 -%d" % (self.default_level if level is None else level)
+
+
+class NoneCodec(Codec):
+    name = "none"
+    extension = "tar"
+    default_level = None
+
+    def open(self, fileobj, level=None, threads=None):
+        return UncompressedWriter(fileobj)
+
+    def reader(self, fileobj):
+        return fileobj
+
+    def command(self, level=None, threads=None):
+        return None
+
+
+CODECS = {
+    codec.name: codec()
+    for codec in [
+        GzipCodec,
+        ZstdCodec,
+        Lz4Codec,
+        NoneCodec,
+    ]
+}
+
+
+def get_codec(name):
+    """Get a compression codec by name.
+
+    Args:
+        name (str): The name of the codec, one of 'gzip', 'zstd', 'lz4' or 'none'.
+
+    Returns:
+        Codec: The compression codec.
+
+    Raises:
+        ValueError: If no codec exists with the specified name.
+
+    Examples:
+        >>> get_codec("zstd").extension
+        'tar.zst'
+
+    """
+    if name not in CODECS:
+        raise ValueError("unknown compression codec: '%s'" % name)
+
+    return CODECS[name]
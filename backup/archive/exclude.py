@@ -0,0 +1,154 @@
+import os
+import re
+
+
+def translate(pattern):
+    """Translate a glob pattern into a regular expression.
+
+    Unlike `fnmatch.translate`, wildcards in the pattern never match across
+    path separators, with the exception of `**`, which matches any number of
+    directories, following the same rules as `.gitignore` files.
+
+    Args:
+        pattern (str): The glob pattern to translate.
+
+    Returns:
+        str: A regular expression that matches the glob pattern.
+
+    Examples:
+        >>> translate("*.log")
+        '[^/]*\\\\.log'
+
+        >>> translate("**/cache")
+        '(?:.*/)?cache'
+
+    """
+    i, n = 0, len(pattern)
+    result = []
+
+    while i < n:
+        char = pattern[i]
+
+        if pattern.startswith("**/", i):
+            result.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            result.append(".*")
+            i += 2
+        elif char == "*":
+            result.append("[^/]*")
+            i += 1
+        elif char == "?":
+            result.append("[^/]")
+            i += 1
+        elif char == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1 : end]
+
+            if chars[0] in "!^":
+                chars = "^" + chars[1:]
+
+            result.append("[%s]" % chars.replace("\\", "\\\\"))
+            i = end + 1
+        else:
+            result.append(re.escape(char))
+            i += 1
+
+    return "".join(result)
+
+
+class ExcludeMatcher(object):
+    """A precompiled matcher for the exclude patterns of a directory configuration.
+
+    Patterns use glob syntax, and are matched against paths relative to the `root`
+    directory being archived, similar to the rules used by `.gitignore` files:
+
+    - A pattern without a separator (`node_modules`, `*.pyc`) matches a file or
+      directory with that name at any depth.
+    - A pattern with a separator (`app/cache`, `/build`) is anchored to the root
+      directory. Absolute patterns inside the root directory (`/home/www/app/uploads`),
+      as used by the ssh directory interface, are anchored the same way.
+    - A pattern ending with a separator (`build/`) only matches directories.
+    - `**` matches any number of directories (`**/tmp`, `logs/**`).
+
+    All patterns are compiled into at most four regular expressions up front, so the
+    cost of matching a path doesn't grow with the number of exclude patterns.
+
+    Args:
+        patterns (List[str]): The glob patterns to exclude.
+        root (str): The directory that paths will be matched relative to.
+
+    Examples:
+        >>> matcher = ExcludeMatcher(["node_modules", "/app/cache/"], root="/app")
+        >>> matcher.match("src/node_modules", is_dir=True)
+        True
+
+        >>> matcher.match("cache", is_dir=False)
+        False
+
+    """
+
+    def __init__(self, patterns, root):
+        self.patterns = list(patterns or [])
+        self.root = os.path.normpath(root).replace(os.sep, "/")
+
+        names, paths, dir_names, dir_paths = [], [], [], []
+
+        for pattern in self.patterns:
+            pattern = pattern.replace(os.sep, "/")
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+
+            if not pattern:
+                continue
+
+            if pattern == self.root or pattern.startswith(self.root + "/"):
+                pattern = pattern[len(self.root) :]
+
+            if "/" in pattern:
+                regex = translate(pattern.lstrip("/"))
+                (dir_paths if dir_only else paths).append(regex)
+            else:
+                regex = translate(pattern)
+                (dir_names if dir_only else names).append(regex)
+
+        self._names = self._compile(names)
+        self._paths = self._compile(paths)
+        self._dir_names = self._compile(dir_names)
+        self._dir_paths = self._compile(dir_paths)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    @staticmethod
+    def _compile(regexes):
+        if not regexes:
+            return None
+
+        return re.compile("(?:%s)\\Z" % "|".join(regexes))
+
+    def match(self, path, is_dir=False):
+        """Check whether a path should be excluded.
+
+        Args:
+            path (str): The path to check, relative to the root directory.
+            is_dir (bool): Whether the path is a directory.
+
+        Returns:
+            bool: True if the path should be excluded, False otherwise.
+
+        """
+        path = path.replace(os.sep, "/")
+        name = path.rsplit("/", 1)[-1]
+
+        if self._names and self._names.match(name):
+            return True
+        if self._paths and self._paths.match(path):
+            return True
+        if is_dir:
+            if self._dir_names and self._dir_names.match(name):
+                return True
+            if self._dir_paths and self._dir_paths.match(path):
+                return True
+
+        return False
@@ -0,0 +1,143 @@
+import gzip
+import json
+from typing import NamedTuple, Optional
+
+
+class ManifestEntry(NamedTuple):
+    size: int
+    mtime: int
+    inode: int
+    hash: Optional[str] = None
+
+
+class Manifest(object):
+    """A record of the state of every entry in a directory at the time it was archived.
+
+    Manifests are used by incremental backups to determine which files have changed
+    since the previous backup. A file is considered unchanged when its size, modification
+    time (in nanoseconds) and inode all match the previous manifest, in which case it's left
+    out of the archive, and its previous entry (including its content hash) is carried over.
+
+    Manifests are stored as gzip compressed JSON, with each entry stored as a compact
+    list of values rather than an object, to keep manifests of large directories small.
+
+    Args:
+        entries (dict): A mapping of archive names to manifest entries.
+        incrementals (int): The number of incremental backups taken since the
+            last full backup.
+
+    """
+
+    version = 1
+
+    def __init__(self, entries=None, incrementals=0):
+        self.entries = entries or {}
+        self.incrementals = incrementals
+
+    def __contains__(self, arcname):
+        return arcname in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, arcname):
+        return self.entries.get(arcname)
+
+    def add(self, arcname, st, hash=None):
+        """Record the state of an entry in the manifest.
+
+        Args:
+            arcname (str): The name of the entry within the archive.
+            st (os.stat_result): The stat result of the entry.
+            hash (str): The hex digest of the entry contents, if it's a file.
+
+        """
+        self.entries[arcname] = ManifestEntry(
+            size=st.st_size,
+            mtime=st.st_mtime_ns,
+            inode=st.st_ino,
+            hash=hash,
+        )
+
+    def changed(self, arcname, st):
+        """Check whether an entry has changed since this manifest was recorded.
+
+        Args:
+            arcname (str): The name of the entry within the archive.
+            st (os.stat_result): The current stat result of the entry.
+
+        Returns:
+            bool: True if the entry is new or has changed, False otherwise.
+
+        """
+        entry = self.entries.get(arcname)
+
+        if entry is None:
+            return True
+
+        return (entry.size, entry.mtime, entry.inode) != (
+            st.st_size,
+            st.st_mtime_ns,
+            st.st_ino,
+        )
+
+    def deleted(self, manifest):
+        """Get the entries in this manifest that are missing from another manifest.
+
+        Args:
+            manifest (Manifest): The newer manifest to compare against.
+
+        Returns:
+            List[str]: The sorted archive names of the deleted entries.
+
+        """
+        return sorted(set(self.entries) - set(manifest.entries))
+
+    def dump(self, file):
+        """Write the manifest to a binary file-like object.
+
+        Args:
+            file: The writable file-like object to write the manifest to.
+
+        """
+        with gzip.GzipFile(fileobj=file, mode="wb", mtime=0) as compressed:
+            compressed.write(
+                json.dumps(
+                    {
+                        "version": self.version,
+                        "incrementals": self.incrementals,
+                        "entries": self.entries,
+                    },
+                    separators=(",", ":"),
+                ).encode("utf-8")
+            )
+
+    @classmethod
+    def load(cls, file):
+        """Read a manifest from a binary file-like object.
+
+        Args:
+            file: The readable file-like object to read the manifest from.
+
+        Returns:
+            Manifest: The manifest that was read.
+
+        Raises:
+            ValueError: If the manifest version is not supported.
+
+        """
+        with gzip.GzipFile(fileobj=file, mode="rb") as compressed:
+            data = json.loads(compressed.read().decode("utf-8"))
+
+        if data.get("version") != cls.version:
+            raise ValueError(
+                "unsupported manifest version: '%s'" % data.get("version"),
+            )
+
+        return cls(
+            entries={
+                arcname: ManifestEntry(*values)
+                for arcname, values in data["entries"].items()
+            },
+            incrementals=data["incrementals"],
+        )
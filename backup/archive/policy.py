@@ -0,0 +1,158 @@
+import collections
+import math
+import os
+
+# extensions of file formats that are already compressed, these are stored in
+# archives without being compressed again, since compressing them again costs a
+# lot of time and rarely saves any space.
+
+STORE_EXTENSIONS = [
+    # images
+    "jpg",
+    "jpeg",
+    "png",
+    "gif",
+    "webp",
+    "heic",
+    "avif",
+    # audio and video
+    "mp3",
+    "aac",
+    "ogg",
+    "opus",
+    "flac",
+    "m4a",
+    "mp4",
+    "m4v",
+    "mkv",
+    "mov",
+    "avi",
+    "webm",
+    # archives and compressed files
+    "zip",
+    "gz",
+    "tgz",
+    "bz2",
+    "xz",
+    "zst",
+    "lz4",
+    "7z",
+    "rar",
+    "jar",
+    "whl",
+    # documents and data formats that are compressed containers
+    "docx",
+    "xlsx",
+    "pptx",
+    "odt",
+    "ods",
+    "pdf",
+    "parquet",
+    "orc",
+    "avro",
+]
+
+
+def entropy(data):
+    """Calculate the shannon entropy of a block of data.
+
+    Args:
+        data (bytes): The data to calculate the entropy of.
+
+    Returns:
+        float: The entropy of the data in bits per byte, between 0 (a single
+            repeated byte) and 8 (uniformly random bytes).
+
+    Examples:
+        >>> entropy(b"aaaa")
+        0.0
+
+        >>> entropy(bytes(range(256)))
+        8.0
+
+    """
+    if not data:
+        return 0.0
+
+    size = len(data)
+
+    return -sum(
+        count / size * math.log2(count / size)
+        for count in collections.Counter(data).values()
+    )
+
+
+class CompressibilityPolicy(object):
+    """Decide whether the contents of a file are worth compressing.
+
+    Files with an extension in `store_extensions` are never compressed, and files
+    with an extension in `compress_extensions` are always compressed. The first
+    `sample_size` bytes of any other file are sampled, and the file is only compressed
+    when the entropy of the sample is below `entropy_threshold` bits per byte.
+
+    Files smaller than `min_size` are always compressed, switching compression on and
+    off costs more than compressing a small file that doesn't shrink.
+
+    Args:
+        store_extensions (List[str]): The extensions of files that are never compressed,
+            defaults to `STORE_EXTENSIONS`.
+        compress_extensions (List[str]): The extensions of files that are always compressed.
+        entropy_threshold (float): The entropy (in bits per byte) at which a sampled
+            file is considered incompressible, None disables sampling.
+        sample_size (int): The number of bytes to sample from the start of a file.
+        min_size (int): The minimum size of files that may be stored uncompressed.
+
+    Examples:
+        >>> policy = CompressibilityPolicy()
+        >>> policy.compressible("./photo.JPG", fd=None, size=1024 * 1024)
+        False
+
+    """
+
+    def __init__(
+        self,
+        store_extensions=None,
+        compress_extensions=None,
+        entropy_threshold=7.5,
+        sample_size=64 * 1024,
+        min_size=64 * 1024,
+    ):
+        if store_extensions is None:
+            store_extensions = STORE_EXTENSIONS
+
+        self.store_extensions = {e.lower().lstrip(".") for e in store_extensions}
+        self.compress_extensions = {
+            e.lower().lstrip(".") for e in compress_extensions or []
+        }
+        self.entropy_threshold = entropy_threshold
+        self.sample_size = sample_size
+        self.min_size = min_size
+
+    def compressible(self, name, fd, size):
+        """Check whether a file is worth compressing.
+
+        Args:
+            name (str): The name of the file.
+            fd (int): The file descriptor of the opened file, used to sample the
+                contents of the file without changing its offset.
+            size (int): The size of the file.
+
+        Returns:
+            bool: True if the file should be compressed, False otherwise.
+
+        """
+        if size < self.min_size:
+            return True
+
+        extension = os.path.splitext(name)[1].lower().lstrip(".")
+
+        if extension in self.compress_extensions:
+            return True
+        if extension in self.store_extensions:
+            return False
+        if self.entropy_threshold is None or fd is None:
+            return True
+
+        sample = os.pread(fd, self.sample_size, 0)
+
+        return entropy(sample) < self.entropy_threshold
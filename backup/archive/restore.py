@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import shutil
+import tarfile
+
+from backup.archive.archiver import DELETIONS_NAME
+from backup.archive.compression import CODECS
+from backup.interfaces.interface import VOLUMES_SUFFIX
+from backup.streams import pipeline
+
+
+def get_codec_for_path(path):
+    """Get the compression codec of an archive from its path.
+
+    Args:
+        path (str): The path of the archive, or of a volume set manifest.
+
+    Returns:
+        Codec: The compression codec of the archive.
+
+    Raises:
+        ValueError: If the path doesn't have the extension of any codec.
+
+    Examples:
+        >>> get_codec_for_path("backups/source_20240101.tar.zst.volumes").name
+        'zstd'
+
+    """
+    if path.endswith(VOLUMES_SUFFIX):
+        path = path[: -len(VOLUMES_SUFFIX)]
+
+    # the longest extensions are checked first, so `tar.gz` is matched before
+    # the `tar` extension of uncompressed archives.
+
+    for codec in sorted(CODECS.values(), key=lambda c: len(c.extension), reverse=True):
+        if path.endswith("." + codec.extension):
+            return codec
+
+    raise ValueError("unable to determine compression codec of archive: '%s'" % path)
+
+
+def extract(file, dst, codec):
+    """Extract an archive into a directory.
+
+    The archive is read sequentially, so the file-like object only needs to support
+    `read`. Archives with stored (uncompressed) members, sparse members, and archives
+    made up of several compressed members or frames are all extracted as usual.
+
+    When the archive is incremental, the entries deleted since the previous backup
+    are removed from the directory once the archive has been extracted, so extracting
+    a full backup followed by each of its incremental backups in order restores the
+    directory as it was at the time of the last incremental backup.
+
+    Args:
+        file: A readable file-like object of the compressed archive.
+        dst (str): The directory to extract the archive into.
+        codec (Codec): The compression codec of the archive.
+
+    """
+    logger = logging.getLogger(__name__)
+
+    dst = os.path.abspath(dst)
+    deleted = []
+
+    # extraction filters are only available in recent python releases, when
+    # available, the tar filter is used to refuse members outside of the
+    # destination directory.
+
+    extract_kwargs = {}
+
+    if hasattr(tarfile, "tar_filter"):
+        extract_kwargs["filter"] = "tar"
+
+    with tarfile.open(fileobj=codec.reader(file), mode="r|") as tar:
+        for member in tar:
+            if member.name == DELETIONS_NAME:
+                deleted = json.loads(tar.extractfile(member).read().decode("utf-8"))
+                continue
+
+            tar.extract(member, dst, **extract_kwargs)
+
+    for arcname in reversed(deleted):
+        path = os.path.abspath(os.path.join(dst, arcname))
+
+        if os.path.commonpath([dst, path]) != dst or path == dst:
+            logger.warning("skipping deletion outside of directory: '%s'", arcname)
+            continue
+
+        logger.debug("removing deleted entry: '%s'", path)
+
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+
+def restore(storage, paths, dst):
+    """Restore one or more backups from a storage interface into a directory.
+
+    Each backup is downloaded and extracted concurrently through a bounded pipe, so
+    nothing but the extracted files is written to disk. Volume sets are downloaded
+    volume by volume, in order, as a single archive.
+
+    Args:
+        storage (StorageInterface): The storage interface to download backups from.
+        paths (List[str]): The storage paths of the backups to restore, a full backup
+            followed by any incremental backups taken after it, in order.
+        dst (str): The directory to restore the backups into.
+
+    """
+    logger = logging.getLogger(__name__)
+
+    os.makedirs(dst, exist_ok=True)
+
+    for path in paths:
+        logger.info("restoring backup: '%s' into: '%s'", path, dst)
+
+        codec = get_codec_for_path(path)
+
+        if path.endswith(VOLUMES_SUFFIX):
+            volumes = storage.download_volumes(path)
+        else:
+            volumes = [path]
+
+        def download(pipe):
+            for volume in volumes:
+                storage.download(path=volume, file=pipe)
+
+        pipeline(
+            producer=download,
+            consumer=lambda pipe: extract(pipe, dst, codec),
+        )
@@ -0,0 +1,162 @@
+import errno
+import os
+import tarfile
+
+
+def data_regions(fd, size):
+    """Find the regions of a file that contain data, skipping over any holes.
+
+    Holes are found with `SEEK_DATA` and `SEEK_HOLE`, which only inspect the file's
+    block allocation, so none of the file contents are read.
+
+    Args:
+        fd (int): The file descriptor of the file, its offset is left undefined.
+        size (int): The size of the file.
+
+    Returns:
+        List[Tuple[int, int]]: The offset and length of every data region, or None
+            if the file has no holes, or the platform or filesystem can't report them.
+
+    """
+    if not hasattr(os, "SEEK_DATA"):
+        return None
+
+    regions = []
+    offset = 0
+
+    try:
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as exc:
+                # ENXIO is returned when there's no more data after the offset,
+                # meaning the rest of the file is a hole.
+                if exc.errno == errno.ENXIO:
+                    break
+                raise
+
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+
+            if end > start:
+                regions.append((start, end - start))
+
+            offset = end
+    except OSError:
+        return None
+
+    if regions == [(0, size)]:
+        return None
+
+    return regions
+
+
+def sparse_tarinfo(tarinfo, regions):
+    """Turn the header of a regular file into a GNU PAX 1.0 sparse header.
+
+    In the 1.0 format the member data starts with the sparse map, the number of data
+    regions followed by the offset and length of every region, as decimal numbers on
+    separate lines, padded to a whole block. The data regions follow the map. The real
+    name and size of the file are stored in pax headers, so tar implementations that
+    don't understand sparse members still extract the data under a placeholder name.
+
+    Args:
+        tarinfo (tarfile.TarInfo): The header of the file, its size is the real size.
+        regions (List[Tuple[int, int]]): The data regions of the file.
+
+    Returns:
+        bytes: The sparse map to write before the data regions.
+
+    """
+    # a trailing hole is recorded as an empty region at the end of the file,
+    # matching the sparse maps written by gnu tar.
+
+    if not regions or sum(regions[-1]) < tarinfo.size:
+        regions = regions + [(tarinfo.size, 0)]
+
+    lines = [str(len(regions))]
+
+    for offset, length in regions:
+        lines.extend([str(offset), str(length)])
+
+    sparse_map = ("\n".join(lines) + "\n").encode("ascii")
+    remainder = len(sparse_map) % tarfile.BLOCKSIZE
+
+    if remainder:
+        sparse_map += tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+
+    dirname, basename = os.path.split(tarinfo.name)
+
+    tarinfo.pax_headers = {
+        "GNU.sparse.major": "1",
+        "GNU.sparse.minor": "0",
+        "GNU.sparse.name": tarinfo.name,
+        "GNU.sparse.realsize": str(tarinfo.size),
+    }
+
+    tarinfo.name = "/".join([dirname, "GNUSparseFile.0", basename])
+    tarinfo.size = len(sparse_map) + sum(length for _, length in regions)
+
+    return sparse_map
+
+
+class SparseReader(object):
+    """A readable file-like object over the sparse map and data regions of a file.
+
+    Args:
+        fd (int): The file descriptor of the file to read the data regions from.
+        sparse_map (bytes): The sparse map to read before the data regions.
+        regions (List[Tuple[int, int]]): The data regions of the file.
+
+    """
+
+    def __init__(self, fd, sparse_map, regions):
+        self.fd = fd
+        self.sparse_map = sparse_map
+        self.regions = list(regions)
+        self.region = 0
+        self.offset = 0
+
+    def _read(self, size):
+        if self.sparse_map:
+            data = self.sparse_map[:size]
+            self.sparse_map = self.sparse_map[size:]
+            return data
+
+        while self.region < len(self.regions):
+            start, length = self.regions[self.region]
+
+            if self.offset >= length:
+                self.region += 1
+                self.offset = 0
+                continue
+
+            data = os.pread(
+                self.fd, min(size, length - self.offset), start + self.offset
+            )
+            self.offset += len(data)
+
+            return data
+
+        return b""
+
+    def read(self, size=-1):
+        # tarfile expects every read to return exactly the requested size, so
+        # reads are filled across the sparse map and region boundaries. a file
+        # that shrinks while it's being archived returns a short read, which is
+        # reported as an error by tarfile.
+
+        if size < 0:
+            size = len(self.sparse_map) + sum(length for _, length in self.regions)
+
+        chunks = []
+
+        while size > 0:
+            data = self._read(size)
+
+            if not data:
+                break
+
+            chunks.append(data)
+            size -= len(data)
+
+        return b"".join(chunks)
@@ -0,0 +1,93 @@
+import logging
+
+
+class VolumeWriter(object):
+    """A writable file-like object that splits everything written to it into volumes.
+
+    Data is written to files named `<path>.partNNNN` (numbered from `0001`), once a
+    volume reaches `volume_size` bytes it's closed, and `on_volume` is called with the
+    path and number of the finished volume before the next volume is started. The
+    volumes are a plain split of the data written, concatenating the volumes in order
+    gives back the original data.
+
+    Args:
+        path (str): The base path of the volume files.
+        volume_size (int): The size of every volume, except for the last volume.
+        on_volume (Callable[[str, int], None]): Called with the path and number of
+            every finished volume, raising an exception aborts the writer.
+
+    """
+
+    def __init__(self, path, volume_size, on_volume):
+        self.path = path
+        self.volume_size = volume_size
+        self.on_volume = on_volume
+        self.volumes = []
+
+        self._file = None
+        self._written = 0
+
+    @staticmethod
+    def get_volume_name(path, number):
+        return "%s.part%04d" % (path, number)
+
+    def _open(self):
+        volume_path = self.get_volume_name(self.path, len(self.volumes) + 1)
+
+        self._file = open(volume_path, "wb")
+        self._written = 0
+        self.volumes.append(volume_path)
+
+    def _finish(self):
+        logger = logging.getLogger(__name__)
+        logger.debug("finished archive volume: '%s'", self.volumes[-1])
+
+        self._file.close()
+        self._file = None
+
+        self.on_volume(self.volumes[-1], len(self.volumes))
+
+    def write(self, data):
+        view = memoryview(data)
+
+        while view:
+            if self._file is None:
+                self._open()
+
+            size = min(len(view), self.volume_size - self._written)
+
+            self._file.write(view[:size])
+            self._written += size
+            view = view[size:]
+
+            if self._written >= self.volume_size:
+                self._finish()
+
+        return len(data)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """Finish the last volume, an empty archive is still written as a single
+        (empty) volume."""
+        if self._file is None and not self.volumes:
+            self._open()
+        if self._file is not None:
+            self._finish()
+
+    def abort(self):
+        """Close the current volume without finishing it."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
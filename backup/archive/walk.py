@@ -0,0 +1,165 @@
+import logging
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from backup import settings
+
+
+class WalkEntry(NamedTuple):
+    path: str
+    arcname: str
+    is_dir: bool
+    stat: os.stat_result
+
+
+class WalkFrame(object):
+    """A directory on the stack of a walk, along with the position of the next entry
+    to yield and the position of the next subdirectory to prefetch."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.position = 0
+        self.cursor = 0
+
+
+def scandir(path, relpath, matcher=None):
+    """List and stat the contents of a single directory.
+
+    Args:
+        path (str): The path of the directory to list.
+        relpath (str): The path of the directory relative to the root of the walk,
+            with a trailing separator, or an empty string for the root itself.
+        matcher (ExcludeMatcher): An optional matcher for entries to exclude.
+
+    Returns:
+        List[WalkEntry]: The entries of the directory that aren't excluded, sorted
+            by name.
+
+    """
+    logger = logging.getLogger(__name__)
+
+    try:
+        with os.scandir(path) as iterator:
+            entries = sorted(iterator, key=lambda e: e.name)
+    except OSError as exc:
+        logger.warning("unable to list directory: '%s': %s", path, exc)
+        return []
+
+    results = []
+
+    for entry in entries:
+        entry_relpath = relpath + entry.name
+
+        try:
+            entry_stat = entry.stat(follow_symlinks=False)
+        except OSError as exc:
+            logger.warning("unable to stat path: '%s': %s", entry.path, exc)
+            continue
+
+        entry_is_dir = stat.S_ISDIR(entry_stat.st_mode)
+
+        if matcher and matcher.match(entry_relpath, is_dir=entry_is_dir):
+            logger.debug("excluding path from archive: '%s'", entry.path)
+            continue
+
+        results.append(
+            WalkEntry(entry.path, "./" + entry_relpath, entry_is_dir, entry_stat)
+        )
+
+    return results
+
+
+def walk(root, matcher=None, workers=None):
+    """Walk a directory tree, yielding every entry that should be archived.
+
+    Entries are yielded in the order they should be added to an archive, each directory
+    is yielded before its contents, and the contents of a directory are yielded in sorted
+    order. The root directory itself is yielded first with an arcname of `.`.
+
+    Directories are listed and stat'ed ahead of the walk by a pool of `workers` threads
+    (defaults to `settings.BACKUP_WALK_CONCURRENCY`), while entries are still yielded in
+    the same order as a sequential walk. The stat result of every entry is included, so
+    the archiver never has to stat an entry again.
+
+    When a directory is excluded by the matcher, the directory is pruned from the walk,
+    so none of its contents are ever listed or stat'ed.
+
+    Args:
+        root (str): The path of the directory to walk.
+        matcher (ExcludeMatcher): An optional matcher for entries to exclude.
+        workers (int): The number of threads used to list directories.
+
+    Yields:
+        WalkEntry: The path, archive name, type and stat result of each entry.
+
+    Examples:
+        >>> [entry.arcname for entry in walk("/path/to/source")]
+        ['.', './file.txt', './subdirectory', './subdirectory/file.txt']
+
+    """
+    workers = workers or settings.BACKUP_WALK_CONCURRENCY
+
+    yield WalkEntry(root, os.curdir, True, os.stat(root))
+
+    # the walk is depth first, a directory is listed as soon as it's yielded,
+    # and its contents are yielded before its siblings, matching the order used
+    # by tarfile when adding a directory recursively. subdirectories are listed
+    # ahead of the walk, in the order the walk will reach them (the deepest
+    # directories on the stack first). the number of listings that are in
+    # progress or waiting to be yielded is bounded, so memory use doesn't grow
+    # with the number of directories in very wide trees.
+
+    limit = workers * 4
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def prefetch():
+        if executor is None:
+            return
+
+        for frame in reversed(stack):
+            frame.cursor = max(frame.cursor, frame.position)
+
+            while frame.cursor < len(frame.entries):
+                if len(pending) >= limit:
+                    return
+
+                entry = frame.entries[frame.cursor]
+                frame.cursor += 1
+
+                if entry.is_dir:
+                    pending[entry.path] = executor.submit(
+                        scandir, entry.path, entry.arcname[2:] + "/", matcher
+                    )
+
+    try:
+        stack = [WalkFrame(scandir(root, "", matcher))]
+        prefetch()
+
+        while stack:
+            frame = stack[-1]
+
+            if frame.position >= len(frame.entries):
+                stack.pop()
+                continue
+
+            entry = frame.entries[frame.position]
+            frame.position += 1
+
+            yield entry
+
+            if entry.is_dir:
+                future = pending.pop(entry.path, None)
+
+                if future is not None:
+                    entries = future.result()
+                else:
+                    entries = scandir(entry.path, entry.arcname[2:] + "/", matcher)
+
+                stack.append(WalkFrame(entries))
+                prefetch()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
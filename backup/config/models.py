@@ -1,7 +1,9 @@
 from enum import Enum
 from typing import List, Literal, Optional
 
-from pydantic import BaseModel, ConfigDict, Field, PositiveInt, conint
+from pydantic import BaseModel, ConfigDict, Field, PositiveInt, conint, model_validator
+
+from backup.archive.compression import get_codec
 
 
 class BaseModelExtra(BaseModel):
@@ -12,12 +14,51 @@ class RetentionConfig(BaseModel):
     count: PositiveInt
 
 
+class CompressionConfig(BaseModel):
+    codec: Literal["gzip", "zstd", "lz4", "none"] = "gzip"
+    level: Optional[int] = None
+    threads: Optional[PositiveInt] = None
+    skip_incompressible: bool = True
+    store_extensions: Optional[List[str]] = None
+    compress_extensions: List[str] = []
+    entropy_threshold: Optional[float] = 7.5
+
+    @model_validator(mode="after")
+    def validate_level(self):
+        # the level is checked against the levels supported by both the codec's
+        # library and its command (used for remote directories), so a level that
+        # only one of them supports is rejected before any backup is started.
+
+        codec = get_codec(self.codec)
+
+        if self.level is None:
+            return self
+        if codec.min_level is None:
+            raise ValueError(
+                "codec: '%s' does not support compression levels" % codec.name
+            )
+        if not codec.min_level <= self.level <= codec.max_level:
+            raise ValueError(
+                "compression level: %s is out of range for codec: '%s' (%s-%s)"
+                % (self.level, codec.name, codec.min_level, codec.max_level)
+            )
+
+        return self
+
+
+class IncrementalConfig(BaseModel):
+    full_every: PositiveInt = 7
+
+
 class DirectoryConfig(BaseModel):
     src: str
     dest: str
     name: str
     exclude: Optional[List[str]] = []
     retention: Optional[RetentionConfig] = None
+    compression: CompressionConfig = CompressionConfig()
+    incremental: Optional[IncrementalConfig] = None
+    volume_size: Optional[PositiveInt] = None
 
 
 class BaseInterfaceConfig(BaseModelExtra):
@@ -30,6 +71,7 @@ class BackupInterfaceConfig(BaseInterfaceConfig):
 
 class DirectoryBackupInterfaceConfig(BackupInterfaceConfig):
     directories: List[DirectoryConfig]
+    concurrency: PositiveInt = 1
 
 
 class VaultInterfaceConfig(BaseInterfaceConfig):
@@ -1,3 +1,4 @@
+import io
 import logging
 import os
 import platform
@@ -5,13 +6,22 @@ import shutil
 import tarfile
 from typing import List
 
+from backup.archive.archiver import Archiver
+from backup.archive.compression import get_codec
+from backup.archive.manifest import Manifest
+from backup.archive.policy import CompressibilityPolicy
 from backup.config.models import DirectoryBackupInterfaceConfig, DirectoryConfig
 from backup.decorators import log_execution
-from backup.interfaces.interface import BackupInterface
+from backup.interfaces.interface import BackupInterface, DirectoryInterfaceMixin
+from backup.streams import pipeline
 from backup.utils import format_object, get_backup_name
 
 
-class LocalDirectoryBackupInterface(BackupInterface):
+class LocalDirectoryBackupInterfaceConfig(DirectoryBackupInterfaceConfig):
+    stream: bool = False
+
+
+class LocalDirectoryBackupInterface(DirectoryInterfaceMixin, BackupInterface):
     """Concrete implementation of a backup interface for backing up directories
     located on the local machine.
 
@@ -27,9 +37,19 @@ class LocalDirectoryBackupInterface(BackupInterface):
         This is a list of directories to back up on the local machine. Each directory
         must have a source path on the local machine and a destination path for the backup.
 
+    - stream (bool): Whether to stream archives directly into the storage interface.
+        When enabled, archives are never written to disk, the archive is created in memory
+        and uploaded to the storage interface as it's being created, with at most
+        `settings.BACKUP_STREAM_BUFFER_SIZE` bytes buffered in between. Defaults to False.
+
+    - concurrency (int): The number of directories to back up concurrently. Defaults to 1.
+
+    Directories with a `volume_size` are archived as a set of volumes of that size, which are
+    uploaded while the rest of the archive is created, streaming is not used for these directories.
+
     """
 
-    config_cls = DirectoryBackupInterfaceConfig
+    config_cls = LocalDirectoryBackupInterfaceConfig
 
     def _validate_directories(self):
         """Validate the directories to be backed up.
@@ -55,6 +75,17 @@ class LocalDirectoryBackupInterface(BackupInterface):
                     "application does not have read access to directory: %s"
                     % directory.src
                 )
+            if (
+                directory.incremental
+                and directory.retention
+                and directory.retention.count < directory.incremental.full_every
+            ):
+                logger.warning(
+                    "retention count for directory: %s is lower than its incremental "
+                    "full_every setting, retention may delete the full backup that "
+                    "retained incremental backups depend on",
+                    directory.src,
+                )
 
     def validate(self):
         """Validate the local directory backup interface.
@@ -69,15 +100,20 @@ class LocalDirectoryBackupInterface(BackupInterface):
         __name__,
         prefix="created archive of local directory",
     )
-    def archive(self, directory, src):
+    def archive(self, directory, src, manifest=None, previous=None):
         """Create an archive file of the specified local directory.
 
         This method creates an archive of the specified local directory, which
-        can then be uploaded to the configured storage interface.
+        can then be uploaded to the configured storage interface. The archive is
+        created alongside the source directory, and compressed with the codec
+        configured for the directory.
 
         Args:
             directory: The directory configuration to archive.
             src (str): The path to the directory to archive.
+            manifest (Manifest): An optional manifest to record the archived entries in.
+            previous (Manifest): An optional manifest of the previous backup, when
+                provided, only entries changed since the previous backup are archived.
 
         Returns:
             Tuple[str, str]: A tuple containing the path to the archive file and
@@ -87,13 +123,87 @@ class LocalDirectoryBackupInterface(BackupInterface):
         logger = logging.getLogger(__name__)
         logger.info("creating archive of local directory: '%s'", src)
 
-        file = shutil.make_archive(
-            base_name=src,
-            root_dir=src,
-            format="gztar",
+        extension = get_codec(directory.compression.codec).extension
+        file = "%s.%s" % (os.path.normpath(src), extension)
+
+        with open(file, "wb") as file_obj:
+            self._write_archive(directory, src, file_obj, manifest, previous)
+
+        return file, extension
+
+    @log_execution(
+        __name__,
+        prefix="streamed archive of local directory",
+    )
+    def archive_stream(self, directory, src, file, manifest=None, previous=None):
+        """Stream an archive of the specified local directory into a file-like object.
+
+        Unlike the `archive` method, no archive file is created on the local machine,
+        the archive is written sequentially to the file-like object as it's created, which
+        allows the archive to be consumed (uploaded) while the archive is still being built.
+
+        Args:
+            directory: The directory configuration to archive.
+            src (str): The path to the directory to archive.
+            file: A writable file-like object to stream the archive into.
+            manifest (Manifest): An optional manifest to record the archived entries in.
+            previous (Manifest): An optional manifest of the previous backup, when
+                provided, only entries changed since the previous backup are archived.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("streaming archive of local directory: '%s'", src)
+
+        self._write_archive(directory, src, file, manifest, previous)
+
+    def _write_archive(self, directory, src, file, manifest=None, previous=None):
+        """Write a compressed archive of a local directory to a file-like object.
+
+        The tar stream is compressed with the codec, level and threads configured in
+        the directory `compression` configuration, the gzip codec compresses blocks of
+        the archive concurrently, and the result is a standard (multi-member) tar.gz archive.
+
+        With the gzip codec, files that aren't worth compressing (already compressed
+        formats, or files that look random when sampled) are stored without compression
+        when the `skip_incompressible` compression setting is enabled, the archive is still
+        a standard tar.gz archive, since every gzip member carries its own compression.
+
+        Any paths matching the directory `exclude` patterns are left out of the archive,
+        excluded directories are pruned while walking the directory, so their contents
+        are never listed.
+
+        Args:
+            directory: The directory configuration to archive.
+            src (str): The path to the directory to archive.
+            file: A writable file-like object to write the archive to.
+            manifest (Manifest): An optional manifest to record the archived entries in.
+            previous (Manifest): An optional manifest of the previous backup.
+
+        """
+        compression = directory.compression
+        compression_codec = get_codec(compression.codec)
+        archiver = Archiver(
+            src,
+            exclude=directory.exclude,
+            manifest=manifest,
+            previous=previous,
+            policy=(
+                CompressibilityPolicy(
+                    store_extensions=compression.store_extensions,
+                    compress_extensions=compression.compress_extensions,
+                    entropy_threshold=compression.entropy_threshold,
+                )
+                if compression.skip_incompressible
+                else None
+            ),
         )
 
-        return file, ".".join(file.rsplit(".")[1:])
+        with compression_codec.open(
+            file,
+            level=compression.level,
+            threads=compression.threads,
+        ) as compressed:
+            archiver.write(compressed)
 
     def backup(self):
         """Backup the specified local directories.
@@ -102,59 +212,262 @@ class LocalDirectoryBackupInterface(BackupInterface):
         and is responsible for backing up the specified directories to the configured
         storage interface.
 
-        For local directory backups, the directories are first compressed into a zip
-        archive, and then uploaded to the storage interface, where they are stored
-        as individual files.
+        For local directory backups, the directories are first compressed into a tar
+        archive using the configured compression codec, and then uploaded to the
+        storage interface, where they are stored as individual files.
+
+        When the backup is complete, the temporary archive is removed from the
+        local machine to free up disk space. If streaming is enabled, no temporary
+        archive is created, the archive is uploaded to the storage interface while
+        it's being created.
 
-        When the backup is complete, the temporary zip archive is removed from the
-        local machine to free up disk space.
+        If incremental backups are enabled for a directory, a manifest of the directory
+        is stored alongside the backups, and only files that have changed since the
+        previous backup are archived, with a full backup taken every `full_every` backups.
+
+        Directories are backed up concurrently when the interface `concurrency` is
+        greater than one, a failure while backing up one directory doesn't stop the
+        other directories from being backed up.
 
         """
         logger = logging.getLogger(__name__)
         logger.debug("backing up local directories")
 
-        for directory in self.config.directories:
-            logger.info("backing up directory: '%s'", directory.src)
-            logger.debug("directory configuration: %s" % format_object(directory))
+        self.backup_directories()
+
+    def backup_directory(self, directory):
+        """Backup a single local directory to the storage interface.
+
+        Args:
+            directory: The directory configuration to back up.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("backing up directory: '%s'", directory.src)
+        logger.debug("directory configuration: %s" % format_object(directory))
+
+        src, dst, name = (
+            directory.src,
+            directory.dest,
+            directory.name,
+        )
+
+        dst_name = get_backup_name(name)
+        dst = os.path.join(dst, name)
+
+        if not self.storage.exists(path=dst):
+            self.storage.create(path=dst)
+
+        manifest, previous = None, None
 
-            src, dst, name = (
-                directory.src,
-                directory.dest,
-                directory.name,
+        if directory.incremental:
+            manifest, previous = self._get_manifests(directory)
+
+            if previous is not None:
+                dst_name += ".incr"
+
+        if directory.volume_size:
+            self._backup_volumes(directory, src, dst, dst_name, manifest, previous)
+        elif self.config.stream:
+            self._backup_stream(directory, src, dst, dst_name, manifest, previous)
+        else:
+            self._backup_archive(directory, src, dst, dst_name, manifest, previous)
+
+        # the manifest is only stored once the backup has been uploaded, so a failed
+        # backup never becomes the base of the next incremental backup.
+
+        if manifest is not None:
+            self._save_manifest(directory, manifest)
+
+        if directory.retention:
+            self.storage.retention(
+                path=dst,
+                config=directory.retention,
             )
-            archive, extension = self.archive(
-                directory,
-                src,
+
+    def _get_manifest_path(self, directory):
+        """Get the storage path of the manifest for a directory.
+
+        The manifest is stored alongside the directory backups, rather than in
+        the same path as the backups, so it's never affected by retention.
+
+        Args:
+            directory: The directory configuration to get the manifest path for.
+
+        Returns:
+            str: The storage path of the manifest.
+
+        """
+        return os.path.join(directory.dest, "%s.manifest.gz" % directory.name)
+
+    def _get_manifests(self, directory):
+        """Get the manifests to use for an incremental backup of a directory.
+
+        The previous manifest is loaded from the storage interface, if no previous
+        manifest exists, or a full backup is due, no previous manifest is returned,
+        and a full backup should be taken.
+
+        Args:
+            directory: The directory configuration to get the manifests for.
+
+        Returns:
+            Tuple[Manifest, Manifest]: A tuple containing the new manifest to record
+                the backup in, and the manifest of the previous backup (or None).
+
+        """
+        logger = logging.getLogger(__name__)
+
+        manifest_path = self._get_manifest_path(directory)
+
+        if not self.storage.exists(path=manifest_path):
+            logger.info("no manifest found for directory, taking a full backup")
+            return Manifest(), None
+
+        manifest_file = io.BytesIO()
+
+        self.storage.download(path=manifest_path, file=manifest_file)
+        manifest_file.seek(0)
+
+        previous = Manifest.load(manifest_file)
+
+        if previous.incrementals + 1 >= directory.incremental.full_every:
+            logger.info("full backup is due for directory, taking a full backup")
+            return Manifest(), None
+
+        logger.info(
+            "taking incremental backup %s of %s since the last full backup",
+            previous.incrementals + 1,
+            directory.incremental.full_every - 1,
+        )
+
+        return Manifest(incrementals=previous.incrementals + 1), previous
+
+    def _save_manifest(self, directory, manifest):
+        """Upload the manifest of a directory backup to the storage interface.
+
+        Args:
+            directory: The directory configuration the manifest belongs to.
+            manifest (Manifest): The manifest to upload.
+
+        """
+        manifest_file = io.BytesIO()
+        manifest.dump(manifest_file)
+        manifest_file.seek(0)
+
+        self.storage.upload(
+            file=manifest_file,
+            file_size=len(manifest_file.getvalue()),
+            dst=self._get_manifest_path(directory),
+        )
+
+    def _backup_archive(
+        self, directory, src, dst, dst_name, manifest=None, previous=None
+    ):
+        """Create a temporary archive of a local directory and upload it to the
+        storage interface.
+
+        Args:
+            directory: The directory configuration to back up.
+            src (str): The path to the directory to back up.
+            dst (str): The storage path to upload the backup to.
+            dst_name (str): The name of the backup, without an extension.
+            manifest (Manifest): An optional manifest to record the archived entries in.
+            previous (Manifest): An optional manifest of the previous backup.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        archive, extension = self.archive(
+            directory,
+            src,
+            manifest=manifest,
+            previous=previous,
+        )
+        dst_backup = os.path.join(dst, dst_name + ".%s" % extension)
+
+        with open(archive, "rb") as file_obj:
+            file_obj_size = os.path.getsize(archive)
+            file_obj_progress = {
+                "total": file_obj_size,
+                "unit": "B",
+                "unit_scale": True,
+                "desc": "Uploading from local directory",
+            }
+            self.storage.upload(
+                file=file_obj,
+                file_size=file_obj_size,
+                dst=dst_backup,
+                progress=file_obj_progress,
             )
 
-            dst_name = get_backup_name(name)
-            dst = os.path.join(dst, name)
-            dst_backup = os.path.join(dst, dst_name + ".%s" % extension)
+        logger.info("removing temporary archive of local directory: '%s'", archive)
+
+        os.remove(archive)
+
+    def _backup_stream(
+        self, directory, src, dst, dst_name, manifest=None, previous=None
+    ):
+        """Stream an archive of a local directory directly into the storage interface.
 
-            if not self.storage.exists(path=dst):
-                self.storage.create(path=dst)
+        The archive is created on a background thread and written to a bounded
+        in-memory pipe, which is read by the storage interface on the current thread,
+        so archiving and uploading overlap, and nothing is written to the local disk.
 
-            with open(archive, "rb") as file_obj:
-                file_obj_size = os.path.getsize(archive)
-                file_obj_progress = {
-                    "total": file_obj_size,
+        Args:
+            directory: The directory configuration to back up.
+            src (str): The path to the directory to back up.
+            dst (str): The storage path to upload the backup to.
+            dst_name (str): The name of the backup, without an extension.
+            manifest (Manifest): An optional manifest to record the archived entries in.
+            previous (Manifest): An optional manifest of the previous backup.
+
+        """
+        extension = get_codec(directory.compression.codec).extension
+        dst_backup = os.path.join(dst, dst_name + ".%s" % extension)
+
+        pipeline(
+            producer=lambda pipe: self.archive_stream(
+                directory, src, pipe, manifest=manifest, previous=previous
+            ),
+            consumer=lambda pipe: self.storage.upload_stream(
+                stream=pipe,
+                dst=dst_backup,
+                progress={
                     "unit": "B",
                     "unit_scale": True,
-                    "desc": "Uploading from local directory",
-                }
-                self.storage.upload(
-                    file=file_obj,
-                    file_size=file_obj_size,
-                    dst=dst_backup,
-                    progress=file_obj_progress,
-                )
+                    "desc": "Streaming from local directory",
+                },
+            ),
+        )
 
-            logger.info("removing temporary archive of local directory: '%s'", archive)
+    def _backup_volumes(
+        self, directory, src, dst, dst_name, manifest=None, previous=None
+    ):
+        """Create an archive of a local directory as fixed-size volumes, uploading every
+        volume to the storage interface while the rest of the archive is created.
 
-            os.remove(archive)
+        Args:
+            directory: The directory configuration to back up.
+            src (str): The path to the directory to back up.
+            dst (str): The storage path to upload the backup to.
+            dst_name (str): The name of the backup, without an extension.
+            manifest (Manifest): An optional manifest to record the archived entries in.
+            previous (Manifest): An optional manifest of the previous backup.
 
-            if directory.retention:
-                self.storage.retention(
-                    path=dst,
-                    config=directory.retention,
-                )
+        """
+        extension = get_codec(directory.compression.codec).extension
+        dst_backup = os.path.join(dst, dst_name + ".%s" % extension)
+
+        self.backup_volumes(
+            write=lambda file: self._write_archive(
+                directory, src, file, manifest, previous
+            ),
+            path="%s.%s" % (os.path.normpath(src), extension),
+            dst=dst_backup,
+            volume_size=directory.volume_size,
+            progress={
+                "unit": "B",
+                "unit_scale": True,
+                "desc": "Uploading volume from local directory",
+            },
+        )
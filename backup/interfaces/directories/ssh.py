@@ -1,13 +1,20 @@
 import logging
 import os
+import tempfile
 import threading
 from typing import List
 
 import paramiko
 from pydantic import BaseModel
 
+from backup import settings
+from backup.archive.compression import get_codec
 from backup.config.models import DirectoryBackupInterfaceConfig, DirectoryConfig
-from backup.interfaces.interface import BackupInterface, ClientInterfaceMixin
+from backup.interfaces.interface import (
+    BackupInterface,
+    ClientInterfaceMixin,
+    DirectoryInterfaceMixin,
+)
 from backup.utils import format_object, get_backup_name
 
 
@@ -18,7 +25,9 @@ class SSHDirectoryBackupInterfaceConfig(DirectoryBackupInterfaceConfig):
     ssh_port: int
 
 
-class SSHDirectoryBackupInterface(ClientInterfaceMixin, BackupInterface):
+class SSHDirectoryBackupInterface(
+    ClientInterfaceMixin, DirectoryInterfaceMixin, BackupInterface
+):
     """Concrete implementation of a backup interface for backing up directories
     located on a remote machine via an ssh connection.
 
@@ -53,6 +62,15 @@ class SSHDirectoryBackupInterface(ClientInterfaceMixin, BackupInterface):
         This is a list of directories to back up on the remote machine. Each directory
         must have a source path on the remote machine and a destination path for the backup.
 
+    - concurrency (int): The number of directories to back up concurrently. Defaults to 1.
+
+    Directories with a `volume_size` are archived to the standard output of tar on the remote
+    machine, and split into volumes of that size on the local machine, which are uploaded while
+    the rest of the archive is received.
+
+    Incremental backups aren't supported for remote directories, since remote directories are
+    archived by tar on the remote machine, without a manifest of the archived files.
+
     """
 
     config_cls = SSHDirectoryBackupInterfaceConfig
@@ -119,16 +137,63 @@ class SSHDirectoryBackupInterface(ClientInterfaceMixin, BackupInterface):
         """Validate the ssh directory backup interface.
 
         Raises:
-            ValueError: If any specified directories are missing or inaccessible.
+            ValueError: If any specified directories are missing or inaccessible, or
+                are configured for incremental backups.
 
         """
+        # incremental backups need a manifest of the archived files, which isn't
+        # created for remote directories, so they're rejected instead of silently
+        # taking full backups.
+
+        for directory in self.config.directories:
+            if directory.incremental:
+                raise ValueError(
+                    "incremental backups are not supported for remote directory: '%s'"
+                    % directory.src,
+                )
+
         self._validate_directories()
 
+    def _get_tar_command(self, directory, src, file):
+        """Get the command that archives a remote directory.
+
+        Args:
+            directory: The directory configuration to archive.
+            src (str): The path to the directory to archive.
+            file (str): The path to write the archive to, `-` writes the archive
+                to standard output.
+
+        Returns:
+            str: The tar command to run on the remote machine.
+
+        """
+        compression = directory.compression
+        compression_codec = get_codec(compression.codec)
+        compression_command = compression_codec.command(
+            level=compression.level,
+            threads=compression.threads,
+        )
+
+        src_tar_command_args = []
+
+        if compression_command:
+            src_tar_command_args.append(
+                "--use-compress-program='%s'" % compression_command
+            )
+        if directory.exclude:
+            src_tar_command_args.extend(["--exclude=%s" % e for e in directory.exclude])
+
+        src_tar_command_args = " ".join(src_tar_command_args)
+
+        return "tar -cf %s %s %s" % (file, src_tar_command_args, src)
+
     def archive(self, directory, src):
         """Create an archive file of the specified remote directory.
 
         This method creates an archive of the specified remote directory, which
-        can then be uploaded to the configured storage interface.
+        can then be uploaded to the configured storage interface. The archive is
+        compressed on the remote machine with the codec configured for the directory,
+        so the matching compression program (gzip, zstd or lz4) must be installed there.
 
         Args:
             directory: The directory configuration to archive.
@@ -142,21 +207,17 @@ class SSHDirectoryBackupInterface(ClientInterfaceMixin, BackupInterface):
         logger = logging.getLogger(__name__)
         logger.info("creating archive of remote directory: '%s'", src)
 
-        src_tmp = "/tmp/%s.tar.gz" % directory.name
-        src_tar_command_args = []
+        extension = get_codec(directory.compression.codec).extension
 
-        if directory.exclude:
-            src_tar_command_args.extend(["--exclude=%s" % e for e in directory.exclude])
-
-        src_tar_command_args = " ".join(src_tar_command_args)
-        src_tar_command = "tar -czf %s %s %s" % (src_tmp, src_tar_command_args, src)
+        src_tmp = "/tmp/%s.%s" % (directory.name, extension)
+        src_tar_command = self._get_tar_command(directory, src, src_tmp)
 
         logger.debug("running command: '%s'", src_tar_command)
 
         stdin, stdout, stderr = self.client.exec_command(src_tar_command)
         stdout.channel.recv_exit_status()
 
-        return src_tmp, ".".join(src_tmp.rsplit(".")[1:])
+        return src_tmp, extension
 
     def backup(self):
         """Perform the backup process for directories within a remote machine using ssh.
@@ -165,70 +226,175 @@ class SSHDirectoryBackupInterface(ClientInterfaceMixin, BackupInterface):
         remote machine using ssh, creates a backup of the specified directories, and
         stores the backup in the configured storage interface.
 
-        For ssh directory backups, the directories are first compressed into a tar.gz
-        archive, and then uploaded to the storage interface, where they are stored
-        as individual files.
+        For ssh directory backups, the directories are first compressed into a tar
+        archive using the configured compression codec, and then uploaded to the
+        storage interface, where they are stored as individual files.
 
-        When the backup is complete, the temporary tar.gz archive is removed from the
+        When the backup is complete, the temporary archive is removed from the
         remote machine to free up disk space.
 
+        Directories are backed up concurrently when the interface `concurrency` is
+        greater than one, each directory is archived and transferred over its own
+        channel of the shared ssh connection.
+
         """
         logger = logging.getLogger(__name__)
         logger.info("backing up remote directories with ssh")
 
-        for directory in self.config.directories:
-            logger.info("backup remote directory: %s", directory.src)
-            logger.info("directory configuration: %s" % format_object(directory))
+        self.backup_directories()
 
-            src, dst, name = (
-                directory.src,
-                directory.dest,
-                directory.name,
-            )
-            archive, extension = self.archive(
-                directory,
-                src,
+    def backup_directory(self, directory):
+        """Backup a single remote directory to the storage interface.
+
+        Args:
+            directory: The directory configuration to back up.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("backup remote directory: %s", directory.src)
+        logger.info("directory configuration: %s" % format_object(directory))
+
+        src, dst, name = (
+            directory.src,
+            directory.dest,
+            directory.name,
+        )
+
+        if directory.volume_size:
+            self._backup_volumes(directory, src, dst, name)
+            return
+
+        archive, extension = self.archive(
+            directory,
+            src,
+        )
+
+        dst_name = get_backup_name(name)
+        dst = os.path.join(dst, name)
+        dst_backup = os.path.join(dst, dst_name + ".%s" % extension)
+
+        sftp = self.client.open_sftp()
+
+        if not self.storage.exists(path=dst):
+            self.storage.create(path=dst)
+
+        try:
+            with sftp.file(archive, "rb") as remote_file:
+                remote_file_size = remote_file.stat().st_size
+                remote_file_progress = {
+                    "total": remote_file_size,
+                    "unit": "B",
+                    "unit_scale": True,
+                    "desc": "Uploading from remote directory",
+                }
+
+                self.storage.upload(
+                    file=remote_file,
+                    file_size=remote_file_size,
+                    dst=dst_backup,
+                    progress=remote_file_progress,
+                )
+
+        finally:
+            sftp.close()
+
+        src_tmp_rm_command = "rm %s" % archive
+
+        logger.info("removing temporary backup of remote directory: '%s'", archive)
+        logger.debug("running command: '%s'", src_tmp_rm_command)
+
+        stdin, stdout, stderr = self.client.exec_command(src_tmp_rm_command)
+        stdout.channel.recv_exit_status()
+
+        if directory.retention:
+            self.storage.retention(
+                path=dst,
+                config=directory.retention,
             )
 
-            dst_name = get_backup_name(name)
-            dst = os.path.join(dst, name)
-            dst_backup = os.path.join(dst, dst_name + ".%s" % extension)
+    def _backup_volumes(self, directory, src, dst, name):
+        """Archive a remote directory as fixed-size volumes, uploading every volume to
+        the storage interface while the rest of the archive is created.
+
+        The archive is written to the standard output of the tar command on the remote
+        machine, so nothing is written to the remote disk, the archive is split into
+        volumes on the local machine as it's received, in a temporary directory that's
+        unique to the backup.
+
+        Args:
+            directory: The directory configuration to back up.
+            src (str): The path to the remote directory to back up.
+            dst (str): The storage path to upload the backup to.
+            name (str): The name of the backup.
+
+        Raises:
+            RuntimeError: If the tar command fails on the remote machine.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        extension = get_codec(directory.compression.codec).extension
+        dst = os.path.join(dst, name)
+        dst_backup = os.path.join(dst, get_backup_name(name) + ".%s" % extension)
+
+        if not self.storage.exists(path=dst):
+            self.storage.create(path=dst)
 
-            sftp = self.client.open_sftp()
+        def write(file):
+            src_tar_command = self._get_tar_command(directory, src, "-")
 
-            if not self.storage.exists(path=dst):
-                self.storage.create(path=dst)
+            logger.debug("running command: '%s'", src_tar_command)
 
-            try:
-                with sftp.file(archive, "rb") as remote_file:
-                    remote_file_size = remote_file.stat().st_size
-                    remote_file_progress = {
-                        "total": remote_file_size,
-                        "unit": "B",
-                        "unit_scale": True,
-                        "desc": "Uploading from remote directory",
-                    }
+            stdin, stdout, stderr = self.client.exec_command(src_tar_command)
 
-                    self.storage.upload(
-                        file=remote_file,
-                        file_size=remote_file_size,
-                        dst=dst_backup,
-                        progress=remote_file_progress,
-                    )
+            # the standard error of the tar command is read in a separate thread, a
+            # tar command writing lots of warnings would otherwise fill the channel
+            # window and stop writing the archive, deadlocking the backup.
 
-            finally:
-                sftp.close()
+            errors = []
+            errors_thread = threading.Thread(
+                target=lambda: errors.append(stderr.read()),
+                daemon=True,
+            )
+            errors_thread.start()
 
-            src_tmp_rm_command = "rm %s" % archive
+            while True:
+                data = stdout.read(settings.BACKUP_UPLOAD_CHUNK_SIZE)
 
-            logger.info("removing temporary backup of remote directory: '%s'", archive)
-            logger.debug("running command: '%s'", src_tmp_rm_command)
+                if not data:
+                    break
 
-            stdin, stdout, stderr = self.client.exec_command(src_tmp_rm_command)
-            stdout.channel.recv_exit_status()
+                file.write(data)
 
-            if directory.retention:
-                self.storage.retention(
-                    path=dst,
-                    config=directory.retention,
+            # tar exits with a status of 1 when files changed while they were
+            # being archived, the archive is still usable in that case.
+
+            status = stdout.channel.recv_exit_status()
+            errors_thread.join()
+
+            if status > 1:
+                raise RuntimeError(
+                    "tar command failed on remote machine with status: %s: %s"
+                    % (status, b"".join(errors).decode("utf-8", "replace").strip())
                 )
+            if status:
+                logger.warning("files changed while archiving remote directory")
+
+        with tempfile.TemporaryDirectory(prefix="backup-") as tmp:
+            self.backup_volumes(
+                write=write,
+                path=os.path.join(tmp, "%s.%s" % (name, extension)),
+                dst=dst_backup,
+                volume_size=directory.volume_size,
+                progress={
+                    "unit": "B",
+                    "unit_scale": True,
+                    "desc": "Uploading volume from remote directory",
+                },
+            )
+
+        if directory.retention:
+            self.storage.retention(
+                path=dst,
+                config=directory.retention,
+            )
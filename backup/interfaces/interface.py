@@ -1,11 +1,19 @@
+import heapq
 import importlib
+import io
+import itertools
+import json
 import logging
 import os
+import re
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 from pydantic import BaseModel
 
 from backup import settings
+from backup.archive.volumes import VolumeWriter
 from backup.config.models import (
     BackupInterfaceConfig,
     StorageInterfaceConfig,
@@ -13,6 +21,76 @@ from backup.config.models import (
 )
 from backup.utils import format_object
 
+# volume sets are stored as numbered `.partNNNN` files, alongside a manifest with
+# the `.volumes` suffix that lists the volumes, the manifest represents the whole
+# set when backups are listed, and the volumes themselves are hidden.
+
+VOLUMES_SUFFIX = ".volumes"
+VOLUME_PATTERN = re.compile(r"\.part\d{4,}\Z")
+
+
+def is_volume(path):
+    """Check whether a path is a single volume of a volume set.
+
+    Args:
+        path (str): The path to check.
+
+    Returns:
+        bool: True if the path is a volume, False otherwise.
+
+    """
+    return VOLUME_PATTERN.search(path) is not None
+
+
+def get_sort_key(path):
+    """Get the key that backups are ordered by, the most recent backup has the
+    largest key.
+
+    The extension is ignored when sorting, this makes it so that files with different
+    extensions aren't ordered incorrectly in the case where backup configurations change.
+
+    Args:
+        path (str): The path of the backup.
+
+    Returns:
+        str: The sort key of the backup.
+
+    """
+    return os.path.splitext(path)[0].lower()
+
+
+def get_expired(paths, count):
+    """Get the backups that fall outside of the `count` most recent backups.
+
+    Only the `count` most recent backups seen so far are kept in a heap, any other
+    backup is returned as soon as it's known to be expired, so expired backups can be
+    deleted while the backups are still being listed, and the paths never have to be
+    held in memory (or sorted) all at once.
+
+    Args:
+        paths (Iterable[str]): The paths of the backups, in any order.
+        count (int): The number of backups to keep.
+
+    Yields:
+        str: The paths of the expired backups.
+
+    Examples:
+        >>> sorted(get_expired(["b_20240102", "b_20240103", "b_20240101"], count=2))
+        ['b_20240101']
+
+    """
+    heap = []
+
+    for path in paths:
+        item = (get_sort_key(path), path)
+
+        if len(heap) < count:
+            heapq.heappush(heap, item)
+        elif count:
+            yield heapq.heappushpop(heap, item)[1]
+        else:
+            yield path
+
 
 class Interface(ABC):
     """Abstract base class for the `interface` pattern used throughout the application.
@@ -84,6 +162,196 @@ class ClientInterfaceMixin(object):
         pass  # pragma: no cover
 
 
+class DirectoryInterfaceMixin(object):
+    """Mixin class for backup interfaces that back up a list of directories.
+
+    This mixin class provides a common structure for interfaces that back up each of
+    the directories in their `directories` configuration independently. Directories are
+    backed up concurrently with a maximum of `concurrency` threads (configured in the
+    interface configuration), and a failure while backing up one directory never stops
+    the other directories from being backed up.
+
+    The `backup_directory` method should be implemented by subclasses to define the
+    specific behavior of backing up a single directory.
+
+    """
+
+    def backup_directories(self):
+        """Back up every configured directory, isolating failures per directory.
+
+        Raises:
+            RuntimeError: If the backup of one or more directories failed, the error of
+                the first directory that failed is chained to this error.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        directories = self.config.directories
+        concurrency = min(self.config.concurrency, len(directories)) or 1
+        errors = []
+
+        def backup_directory(directory):
+            try:
+                self.backup_directory(directory)
+            except Exception as exc:
+                logger.error(
+                    "%s occurred while backing up directory: '%s'"
+                    % (type(exc), directory.src),
+                    exc_info=True,
+                )
+                errors.append((directory, exc))
+
+        logger.info(
+            "backing up %s directories with %s concurrent workers",
+            len(directories),
+            concurrency,
+        )
+
+        if concurrency == 1:
+            for directory in directories:
+                backup_directory(directory)
+        else:
+            with ThreadPoolExecutor(
+                max_workers=concurrency,
+                thread_name_prefix="backup-directory",
+            ) as executor:
+                list(executor.map(backup_directory, directories))
+
+        if errors:
+            raise RuntimeError(
+                "backup failed for %s of %s directories: %s"
+                % (
+                    len(errors),
+                    len(directories),
+                    ", ".join("'%s'" % directory.src for directory, _ in errors),
+                )
+            ) from errors[0][1]
+
+    def backup_volumes(self, write, path, dst, volume_size, progress=None):
+        """Write an archive as fixed-size volumes, uploading every volume to the storage
+        interface as soon as it's finished, while the rest of the archive is written.
+
+        Volumes are written to `<path>.partNNNN` files on the local machine, and uploaded
+        to `<dst>.partNNNN` on a background thread. At most two finished volumes wait to be
+        uploaded at any time, writing is paused until a volume has been uploaded, so disk
+        usage is bounded by the volume size rather than the size of the archive. Once every
+        volume has been uploaded, a manifest of the volume set is stored at `<dst>.volumes`.
+
+        When a volume fails to upload, archiving is stopped, and any volumes that were
+        already uploaded are removed from the storage interface again.
+
+        Args:
+            write (Callable[[file], None]): Called with a writable file-like object to
+                write the archive to.
+            path (str): The local base path to write volumes to.
+            dst (str): The storage path of the backup.
+            volume_size (int): The size of every volume, except for the last volume.
+            progress (dict): A dictionary of keyword arguments to pass to the tqdm
+                progress bar of each volume upload.
+
+        Returns:
+            List[str]: The storage paths of the uploaded volumes.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        volumes_pending = threading.BoundedSemaphore(2)
+        volumes_uploaded = []
+        futures = []
+
+        def upload(volume, number):
+            try:
+                volume_dst = VolumeWriter.get_volume_name(dst, number)
+                volume_file_size = os.path.getsize(volume)
+
+                logger.info("uploading archive volume %s: '%s'", number, volume_dst)
+
+                with open(volume, "rb") as volume_file:
+                    self.storage.upload(
+                        file=volume_file,
+                        file_size=volume_file_size,
+                        dst=volume_dst,
+                        progress=(
+                            dict(progress, total=volume_file_size) if progress else None
+                        ),
+                    )
+
+                volumes_uploaded.append(volume_dst)
+            finally:
+                os.remove(volume)
+                volumes_pending.release()
+
+        def on_volume(volume, number):
+            for future in futures:
+                if future.done() and future.exception():
+                    raise future.exception()
+
+            volumes_pending.acquire()
+            futures.append(executor.submit(upload, volume, number))
+
+        executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="backup-volume",
+        )
+        writer = VolumeWriter(path, volume_size, on_volume)
+
+        try:
+            with writer:
+                write(writer)
+
+            for future in futures:
+                future.result()
+        except Exception:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+            # volumes that never made it to the upload thread are still on the
+            # local disk, and volumes that were uploaded are incomplete without
+            # the rest of the set, both are removed.
+
+            for volume in writer.volumes:
+                if os.path.exists(volume):
+                    os.remove(volume)
+            for volume_dst in volumes_uploaded:
+                try:
+                    self.storage.delete(path=volume_dst)
+                except Exception:
+                    logger.warning(
+                        "unable to remove incomplete archive volume: '%s'",
+                        volume_dst,
+                        exc_info=True,
+                    )
+            raise
+        finally:
+            executor.shutdown(wait=True)
+
+        volumes = [
+            VolumeWriter.get_volume_name(dst, number)
+            for number in range(1, len(writer.volumes) + 1)
+        ]
+
+        self.storage.upload_volumes(dst, volumes)
+
+        return volumes
+
+    @abstractmethod
+    def backup_directory(self, directory):
+        """Back up a single directory.
+
+        This method should be implemented by subclasses to define the specific
+        behavior of backing up a single directory, it may be called concurrently
+        for different directories.
+
+        Args:
+            directory: The directory configuration to back up.
+
+        Raises:
+            NotImplementedError: If this method is called without
+                being overridden in a subclass.
+
+        """
+        pass  # pragma: no cover
+
+
 class BackupInterface(Interface):
     """Abstract base class for backup interfaces.
 
@@ -231,6 +499,13 @@ class StorageInterface(Interface):
 
     config_cls = StorageInterfaceConfig
 
+    # the limits of the storage backend on chunked uploads, the maximum number
+    # of chunks a single file can be uploaded as, and the maximum size of a
+    # single chunk, None when the backend has no limit.
+
+    max_chunks = None
+    max_chunk_size = None
+
     def retention(self, path, config):
         """Apply retention policy to the storage service.
 
@@ -239,12 +514,16 @@ class StorageInterface(Interface):
 
         By default, a very simple retention handler is implemented by default
         that will delete backups from the storage interface when the number of
-        backups exceeds the configuration retention count.
+        backups exceeds the configuration retention count. Volume sets are deleted
+        as a single backup, along with all of their volumes.
 
         If a more complex retention policy is required, this method should be
         overridden in the subclass to implement the desired behavior, such as
         deleting backups based on age, size, or other criteria.
 
+        When the interface implements `walk`, only the most recent backups are kept in
+        memory, and older backups are deleted while the backups are still being listed.
+
         Args:
             path: The path to the directory to apply the retention policy to.
             config: The retention policy configuration to apply.
@@ -254,10 +533,108 @@ class StorageInterface(Interface):
         logger.info("applying retention policy to storage service: '%s'", path)
         logger.debug("retention policy configuration: %s", format_object(config))
 
-        for i, item in enumerate(self.list(path=path)):
-            if i >= config.count:
+        # interfaces that can list backups without sorting them hand the backups to
+        # a heap as they're listed, otherwise every backup after the most recent
+        # `count` backups of the sorted listing has expired.
+
+        paths = self.walk(path=path)
+
+        if paths is None:
+            expired = itertools.islice(self.list(path=path), config.count, None)
+        else:
+            expired = get_expired(paths, config.count)
+
+        self.delete_backups(expired)
+
+    def delete_backups(self, paths):
+        """Delete a number of backups from the storage service, volume sets are deleted
+        along with all of their volumes.
+
+        By default, every backup is deleted one at a time with `delete`, interfaces
+        that can delete many files at once should override this method.
+
+        Args:
+            paths (Iterable[str]): The paths of the backups to delete.
+
+        """
+        for item in paths:
+            if item.endswith(VOLUMES_SUFFIX):
+                self.delete_volumes(item)
+            else:
                 self.delete(item)
 
+    def upload_volumes(self, dst, volumes):
+        """Store the manifest of a volume set, once all of its volumes are uploaded.
+
+        The manifest is stored at the destination of the backup with a `.volumes`
+        suffix, and lists the names of the volumes in order. Listing backups shows
+        the manifest in place of the volumes, and retention deletes every volume
+        along with the manifest, so the volume set is treated as a single backup.
+
+        Args:
+            dst (str): The path of the backup the volumes belong to.
+            volumes (List[str]): The paths of the uploaded volumes, in order.
+
+        """
+        data = json.dumps([os.path.basename(volume) for volume in volumes]).encode(
+            "utf-8"
+        )
+
+        self.upload(
+            file=io.BytesIO(data),
+            file_size=len(data),
+            dst=dst + VOLUMES_SUFFIX,
+        )
+
+    def download_volumes(self, path):
+        """Get the paths of the volumes listed in a volume set manifest.
+
+        Args:
+            path (str): The path of the volume set manifest.
+
+        Returns:
+            List[str]: The paths of the volumes, in order.
+
+        """
+        manifest_file = io.BytesIO()
+        self.download(path=path, file=manifest_file)
+
+        return [
+            os.path.join(os.path.dirname(path), volume)
+            for volume in json.loads(manifest_file.getvalue().decode("utf-8"))
+        ]
+
+    def delete_volumes(self, path):
+        """Delete every volume of a volume set, followed by its manifest.
+
+        Args:
+            path (str): The path of the volume set manifest.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("deleting volume set from storage service: '%s'", path)
+
+        for volume in self.download_volumes(path):
+            self.delete(volume)
+
+        self.delete(path)
+
+    def is_retryable(self, error):
+        """Check whether an error raised while uploading a chunk is transient, and
+        the chunk should be uploaded again.
+
+        By default, only dropped connections and timeouts are retried, subclasses
+        should extend this method with the transient errors of their backend.
+
+        Args:
+            error (Exception): The error raised while uploading the chunk.
+
+        Returns:
+            bool: True if the chunk should be retried, False otherwise.
+
+        """
+        return isinstance(error, (ConnectionError, TimeoutError))
+
     @abstractmethod
     def create(self, path):
         """Create a directory in the storage service.
@@ -324,6 +701,51 @@ class StorageInterface(Interface):
         """
         pass  # pragma: no cover
 
+    @abstractmethod
+    def upload_stream(self, stream, dst, progress=None):
+        """Upload a stream of unknown size to the storage service.
+
+        This method should be implemented by subclasses to define the specific
+        behavior of uploading a non-seekable stream in to the storage service. Unlike
+        the `upload` method, the stream can only be read sequentially, and the total
+        size of the stream is not known until the stream is exhausted.
+
+        The stream should be read by a single producer, with the chunks read from it
+        uploaded concurrently where the storage service allows it, and the file should
+        only be stored once the stream has been read and uploaded in full.
+
+        Args:
+            stream: A file-like object to read from until no more data is returned,
+                or an iterable of bytes objects (see `backup.streams.as_reader`).
+            dst: The name of the file to store.
+            progress: A dictionary of keyword arguments to pass to the tqdm
+                progress bar.
+
+        Raises:
+            NotImplementedError: If this method is called without
+                being overridden in a subclass.
+
+        """
+        pass  # pragma: no cover
+
+    @abstractmethod
+    def download(self, path, file):
+        """Download a file from the storage service.
+
+        This method should be implemented by subclasses to define the specific
+        behavior of reading a file stored in the storage service.
+
+        Args:
+            path: The name of the file to download.
+            file: A writable file-like object to write the file contents to.
+
+        Raises:
+            NotImplementedError: If this method is called without
+                being overridden in a subclass.
+
+        """
+        pass  # pragma: no cover
+
     @abstractmethod
     def delete(self, path):
         """Delete a backup from the storage service.
@@ -341,6 +763,23 @@ class StorageInterface(Interface):
         """
         pass  # pragma: no cover
 
+    def walk(self, path):
+        """Iterate over the backups in the storage service at the specified path,
+        in no particular order.
+
+        Interfaces that can list backups lazily, without sorting them, may override
+        this method so retention doesn't have to wait for (or hold on to) the full,
+        sorted listing. By default, None is returned, and `list` is used instead.
+
+        Args:
+            path: The path to list files from.
+
+        Returns:
+            Iterable[str]: The paths of the backups, or None if unsupported.
+
+        """
+        return None
+
     @abstractmethod
     def list(self, path):
         """List all files in the storage service at the specified path.
@@ -1,28 +1,87 @@
+import io
 import logging
+import mmap
 import os
+import posixpath
 import shutil
+import stat
 import threading
-from concurrent.futures import ThreadPoolExecutor
-from typing import List
-
-from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from azure.core.exceptions import (
+    HttpResponseError,
+    ResourceExistsError,
+    ServiceRequestError,
+    ServiceResponseError,
+)
 from azure.identity import ManagedIdentityCredential
 from azure.storage.blob import BlobServiceClient
-from pydantic import BaseModel
+from pydantic import BaseModel, confloat, conint
 from tqdm import tqdm
 
 from backup import settings
 from backup.config.models import StorageInterfaceConfig
 from backup.decorators import log_execution
-from backup.interfaces.interface import ClientInterfaceMixin, StorageInterface
+from backup.interfaces.interface import (
+    VOLUMES_SUFFIX,
+    ClientInterfaceMixin,
+    StorageInterface,
+    get_sort_key,
+    is_volume,
+)
+from backup.streams import as_reader
+from backup.transfer.buffers import BufferPool, readinto
+from backup.transfer.chunks import get_chunk_size
+from backup.transfer.hedge import LatencyTracker, call_with_hedge
+from backup.transfer.retry import call_with_retry
+from backup.transfer.scheduler import UploadScheduler
+from backup.transport import get_transport
 
 file_lock = threading.Lock()
 
+# status codes of responses to requests that may succeed when they're sent again,
+# timeouts, throttling, and server errors.
+
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def _map_file(file, file_size):
+    """Memory map a regular file on disk read-only, or return None when the file-like
+    object isn't backed by one (an in-memory buffer or a remote file, for example), or
+    the file can't be mapped."""
+    try:
+        fd = file.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+    if not isinstance(fd, int) or not stat.S_ISREG(os.fstat(fd).st_mode):
+        return None
+
+    # empty files can't be mapped, and files opened without read access or on
+    # filesystems that don't support mapping fail with an os error, these fall
+    # back to reading the file chunk by chunk.
+
+    try:
+        file_map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(file_map) < file_size:
+        file_map.close()
+        return None
+
+    return file_map
+
 
 class AzureBlobStorageInterfaceConfig(StorageInterfaceConfig):
     storage_account: str
     storage_container: str
     storage_key: str
+    hedge_percentile: Optional[confloat(gt=0, lt=100)] = None
+    max_single_put_size: conint(ge=0, le=64 * 1024 * 1024) = 4 * 1024 * 1024
+    directory_markers: bool = False
 
 
 class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
@@ -54,11 +113,59 @@ class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
         This is the access key for the Azure Blob Storage account that the interface will use
         to authenticate with the Azure Blob Storage service.
 
+    - hedge_percentile (float): An optional latency percentile for hedging block uploads.
+        When set, any block that takes longer to upload than this percentile of the blocks
+        uploaded before it is uploaded again on a new connection, and the first upload to
+        finish wins. Hedging is disabled by default.
+
+    - max_single_put_size (int): The size of the largest file uploaded in a single request.
+        Files (and streams) up to this size are uploaded with a single request, instead of
+        being staged as blocks and committed with a second request, defaults to 4 MiB, and
+        0 disables single requests.
+
+    - directory_markers (bool): Whether to store an empty marker blob for every directory.
+        Blob storage has no directories, a directory exists once any blob is stored under
+        it, so no markers are stored by default. Markers stored in earlier releases are
+        still recognised, and are never listed as files.
+
     """
 
     config_cls = AzureBlobStorageInterfaceConfig
     account_url_template = "https://%s.blob.core.windows.net"
 
+    # a block blob is made up of at most 50,000 committed blocks, of at most
+    # 4000 MiB each.
+
+    max_chunks = 50000
+    max_chunk_size = 4000 * 1024 * 1024
+
+    # a batch request deletes at most 256 blobs, and a few batches are sent at once,
+    # deleting thousands of blobs in the time a single delete of each would take.
+
+    max_delete_batch = 256
+    max_delete_workers = 4
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # the names directly under every directory listed during the run, keyed
+        # by directory, which answer every `exists` check after the first one,
+        # along with every blob and directory created during the run.
+
+        self._known = {}
+        self._added = set()
+        self._known_lock = threading.Lock()
+
+        # the listings in progress, keyed by directory, any other thread checking
+        # the same directory waits for the listing in progress, and directories
+        # are listed without holding the lock, so a slow listing of one directory
+        # never holds up checks of any other directory. the generation changes
+        # whenever a blob is deleted, a listing that started before a delete is
+        # never kept.
+
+        self._listing = {}
+        self._generation = 0
+
     def get_client(self):
         """Create a client object for the azure blob storage service.
 
@@ -70,9 +177,15 @@ class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
                 configuration settings or connectivity issues.
 
         """
+        account_url = self.account_url_template % self.config.storage_account
+
+        # the http session is shared by every client of the storage account, so
+        # upload threads and hedged requests reuse the same pool of connections.
+
         return BlobServiceClient(
-            account_url=self.account_url_template % self.config.storage_account,
+            account_url=account_url,
             credential=self.config.storage_key,
+            transport=get_transport(account_url),
         ).get_container_client(
             container=self.config.storage_container,
         )
@@ -84,22 +197,34 @@ class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
     def create(self, path):
         """Create a path in the azure blob storage container.
 
+        No request is sent unless `directory_markers` is enabled, the directory is
+        only remembered, so that `exists` finds it for the rest of the run.
+
         Args:
             path (str): The path of the directory to create.
 
         Raises:
-            ResourceExistsError: If the directory already exists.
+            ResourceExistsError: If directory markers are enabled, and the directory
+                already exists.
 
         """
         logger = logging.getLogger(__name__)
         logger.info("creating path in azure blob storage: '%s'", path)
 
-        blob = self.client.get_blob_client(path)
-        blob.upload_blob(b"", overwrite=False)
+        if self.config.directory_markers:
+            blob = self.client.get_blob_client(path)
+            blob.upload_blob(b"", overwrite=False)
+
+        self.add_known(path)
 
     def exists(self, path):
         """Check if a file or directory exists in the azure blob storage container.
 
+        The blobs and directories directly under the parent of the path are listed
+        with a single request the first time a path in that directory is checked, and
+        kept for the rest of the run, so checking every directory under a destination
+        only costs a single request.
+
         Args:
             path (str): The path of the directory to check.
 
@@ -110,25 +235,171 @@ class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
         logger = logging.getLogger(__name__)
         logger.debug("checking if blob exists in azure blob storage: '%s'", path)
 
+        path = path.replace("\\", "/").rstrip("/")
+
+        with self._known_lock:
+            if path in self._added:
+                return True
+
+        return path in self.get_known(posixpath.dirname(path))
+
+    def get_known(self, directory):
+        """Get the names of the blobs and directories directly under a directory,
+        listing them the first time the directory is requested.
+
+        Args:
+            directory (str): The path of the directory, an empty string for the root
+                of the container.
+
+        Returns:
+            Set[str]: The full names of the blobs and directories in the directory.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        with self._known_lock:
+            known = self._known.get(directory)
+
+            if known is not None:
+                return known
+
+            listing = self._listing.get(directory)
+
+            if listing is None:
+                listing = self._listing[directory] = Future()
+                generation = self._generation
+            else:
+                generation = None
+
+        if generation is None:
+            return listing.result()
+
+        logger.debug("listing directory in azure blob storage: '%s'", directory)
+
+        # directories are listed as prefixes, and any legacy marker of a
+        # directory is listed as a blob of the same name, both end up as the
+        # name of the directory.
+
         try:
-            blob = self.client.get_blob_client(path)
-            blob.get_blob_properties()
-        except ResourceNotFoundError:
-            return False
+            known = {
+                item.name.rstrip("/")
+                for item in self.client.walk_blobs(
+                    name_starts_with=directory + "/" if directory else None,
+                    delimiter="/",
+                )
+            }
+        except BaseException as exc:
+            with self._known_lock:
+                del self._listing[directory]
+
+            listing.set_exception(exc)
+            raise
+
+        with self._known_lock:
+            del self._listing[directory]
+
+            if generation == self._generation:
+                self._known[directory] = known
+
+        listing.set_result(known)
+
+        return known
+
+    def add_known(self, path):
+        """Remember that a blob or directory exists, along with all of its parents.
+
+        Args:
+            path (str): The path of the blob or directory.
+
+        """
+        path = path.replace("\\", "/").rstrip("/")
+
+        with self._known_lock:
+            while path:
+                directory = posixpath.dirname(path)
+
+                self._added.add(path)
+
+                if directory in self._known:
+                    self._known[directory].add(path)
+
+                path = directory
+
+    def remove_known(self, path):
+        """Forget a deleted blob, any directory above it may now be empty, so the
+        listings of those directories are dropped, and listed again when needed.
+
+        Args:
+            path (str): The path of the deleted blob.
+
+        """
+        path = path.replace("\\", "/").rstrip("/")
+        directory = posixpath.dirname(path)
+
+        with self._known_lock:
+            self._generation += 1
+            self._added.discard(path)
+
+            if directory in self._known:
+                self._known[directory].discard(path)
+
+            while directory:
+                directory = posixpath.dirname(directory)
+                self._known.pop(directory, None)
 
-        return True
+    def is_retryable(self, error):
+        """Check whether an error raised while uploading a chunk is transient.
+
+        The azure sdk already retries every request a few times, chunks are only retried
+        once these retries have run out, which rides out longer network outages and
+        throttling without losing the blocks already staged.
+
+        Args:
+            error (Exception): The error raised while uploading the chunk.
+
+        Returns:
+            bool: True if the chunk should be retried, False otherwise.
+
+        """
+        if isinstance(error, (ServiceRequestError, ServiceResponseError)):
+            return True
+        if isinstance(error, HttpResponseError):
+            return error.status_code in RETRY_STATUS_CODES
+
+        return super().is_retryable(error)
 
     def upload_chunk(
-        self, blob_client, file, offset, length, chunk_id, chunk_size, progress
+        self,
+        blob_client,
+        file,
+        offset,
+        length,
+        chunk_id,
+        chunk_size,
+        progress,
+        file_view=None,
+        latency=None,
+        buffers=None,
     ):
         """Upload a chunk of a file to the azure blob storage container.
 
         This method is meant to be used in conjunction with the `upload` method to
         upload a file to the azure blob storage container in chunks.
 
-        We use a separate method for uploading chunks so that we can use a ThreadPoolExecutor
+        We use a separate method for uploading chunks so that we can use an UploadScheduler
         to upload multiple chunks concurrently.
 
+        When a memory mapped view of the file is given, the chunk is staged as a slice of
+        the view, so the chunk is never copied into memory or read behind the file lock.
+        Otherwise, when a buffer pool is given, the chunk is read into a pooled buffer,
+        which is given back to the pool once the block has been staged.
+
+        When a latency tracker is given, the chunk is hedged, if staging the block takes
+        longer than the configured percentile of the blocks staged before it, the same
+        block is staged again with a new client (on a new connection), and whichever
+        request finishes first wins. Staging a block with the same id twice is
+        idempotent, so the losing request is harmless.
+
         Args:
 
             blob_client (azure.storage.blob.BlobClient): The blob client object for the
@@ -139,18 +410,92 @@ class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
             chunk_id (str): The id of the chunk to upload.
             chunk_size (int): The size of the chunk to upload.
             progress (tqdm): A tqdm progress bar to update with the progress of the upload.
+            file_view (memoryview): An optional memory mapped view of the whole file.
+            latency (LatencyTracker): An optional tracker of the latency of staged blocks,
+                used to hedge slow blocks.
+            buffers (BufferPool): An optional pool of buffers to read the chunk into.
 
         """
-        with file_lock:
-            file.seek(offset)
-            file_data = file.read(length)
+        buffer = None
+
+        if file_view is not None:
+            file_data = file_view[offset : offset + length]
+        elif buffers is not None:
+            buffer = buffers.acquire()
+
+            # the buffer is given back to the pool if the chunk can't be read,
+            # otherwise every failed (and retried) read would keep a buffer.
+
+            try:
+                with file_lock:
+                    file.seek(offset)
+                    file_data = buffer[: readinto(file, buffer[:length])]
+            except BaseException:
+                buffers.release(buffer)
+                raise
+        else:
+            with file_lock:
+                file.seek(offset)
+                file_data = file.read(length)
+
+        def release():
+            if buffer is not None:
+                file_data.release()
+                buffers.release(buffer)
+
+        def stage(client):
+            started = time.monotonic()
+            client.stage_block(
+                block_id=chunk_id,
+                data=file_data,
+            )
+            return time.monotonic() - started
+
+        def stage_hedge():
+            with self.get_client() as hedge_client:
+                return stage(hedge_client.get_blob_client(blob_client.blob_name))
+
+        # the buffer is only given back to the pool once every request sending it
+        # has finished, a hedged request that lost the race may still be sending
+        # the buffer after the chunk has been staged.
+
+        if latency is None:
+            try:
+                stage(blob_client)
+            finally:
+                release()
+        else:
+            latency.record(
+                call_with_hedge(
+                    fn=lambda: stage(blob_client),
+                    hedge_fn=stage_hedge,
+                    delay=latency.get_delay(length),
+                    on_finished=release,
+                ),
+                length,
+            )
+        if progress is not None:
+            progress.update(length)
+
+    def put_blob(self, blob_client, data, progress):
+        """Upload a small file to the azure blob storage container in a single request.
 
-        blob_client.stage_block(
-            block_id=chunk_id,
-            data=file_data,
+        Args:
+            blob_client (azure.storage.blob.BlobClient): The blob client object for the
+                file to upload.
+            data (bytes): The contents of the file.
+            progress (tqdm): A tqdm progress bar to update with the progress of the upload.
+
+        """
+        call_with_retry(
+            blob_client.upload_blob,
+            args=(data,),
+            kwargs={"length": len(data), "overwrite": True},
+            retryable=self.is_retryable,
         )
-        if progress:
-            progress.update(len(file_data))
+
+        if progress is not None:
+            progress.update(len(data))
 
     @log_execution(
         __name__,
@@ -158,13 +503,30 @@ class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
     )
     def upload(self, file, file_size, dst, progress=None):
         """Upload a file or directory to an azure blob storage container in
-        chunks of size `settings.BACKUP_UPLOAD_CHUNK_SIZE`.
+        chunks of a size picked for the file, up to `settings.BACKUP_UPLOAD_CHUNK_SIZE`.
 
         Note that by default, the file being uploaded will be uploaded in chunks
         to the storage interface with the specified path. The file will be uploaded
         concurrently with a maximum of `settings.BACKUP_UPLOAD_CONCURRENCY` threads
         uploading chunks of the file to the storage interface before committing the
-        file to the storage interface.
+        file to the storage interface. At most `settings.BACKUP_UPLOAD_MEMORY_LIMIT`
+        bytes of chunks are in flight at once.
+
+        When the file is a regular file on disk, it's memory mapped, and every chunk
+        is staged straight from the mapping, so chunks are neither read behind a lock
+        nor copied into a separate buffer before being sent. Any other file is read
+        into buffers reused from a pool, one for every thread.
+
+        Files up to `max_single_put_size` are uploaded with a single request instead.
+
+        When `hedge_percentile` is configured, blocks that take longer to stage than
+        that percentile of the blocks staged before them are staged a second time on
+        a new connection (see `upload_chunk`), which cuts the tail latency caused by
+        a few stalled connections.
+
+        The chunk size is picked from the size of the file and the number of threads,
+        and is grown when needed to keep the blob within the block limits of azure
+        blob storage (see `get_chunk_size`).
 
         Args:
             file (file): The file to upload.
@@ -177,32 +539,233 @@ class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
         logger = logging.getLogger(__name__)
         logger.info("uploading file to azure blob storage: '%s'", dst)
 
+        blob_client = self.client.get_blob_client(dst)
+
+        if progress:
+            progress = tqdm(**progress)
+
+        # small files are uploaded with a single request, without staging blocks,
+        # which halves the requests needed and skips starting any threads.
+
+        if file_size <= self.config.max_single_put_size:
+            with file_lock:
+                file.seek(0)
+                file_data = file.read(file_size)
+
+            self.put_blob(blob_client, file_data, progress)
+            self.add_known(dst)
+
+            return
+
+        blob_chunk_workers = settings.BACKUP_UPLOAD_CONCURRENCY
+        blob_chunk_size = get_chunk_size(
+            file_size,
+            workers=blob_chunk_workers,
+            max_chunks=self.max_chunks,
+            max_chunk_size=self.max_chunk_size,
+        )
+        blob_chunk_ids = []
+        blob_chunk_latency = None
+
+        if self.config.hedge_percentile:
+            blob_chunk_latency = LatencyTracker(percentile=self.config.hedge_percentile)
+
+        logger.debug("uploading blob in chunks of %d bytes", blob_chunk_size)
+
+        file_map = _map_file(file, file_size)
+        file_view = None
+        file_buffers = None
+
+        if file_map is not None:
+            file_view = memoryview(file_map)
+        else:
+            file_buffers = BufferPool(blob_chunk_size, max_buffers=blob_chunk_workers)
+
+        try:
+            # any chunk that failed to upload fails the whole upload, before the
+            # block list is committed, so a partial file is never stored.
+
+            with UploadScheduler(
+                workers=blob_chunk_workers,
+                retryable=self.is_retryable,
+            ) as scheduler:
+                for blob_chunk_offset in range(0, file_size, blob_chunk_size):
+                    blob_chunk_length = min(
+                        blob_chunk_size, file_size - blob_chunk_offset
+                    )
+                    blob_chunk_id = str(blob_chunk_offset).zfill(16)
+                    blob_chunk_ids.append(blob_chunk_id)
+
+                    scheduler.submit(
+                        blob_chunk_length,
+                        self.upload_chunk,
+                        blob_client,
+                        file,
+                        blob_chunk_offset,
+                        blob_chunk_length,
+                        blob_chunk_id,
+                        blob_chunk_size,
+                        progress,
+                        file_view,
+                        blob_chunk_latency,
+                        file_buffers,
+                    )
+        finally:
+            if file_view is not None:
+                file_view.release()
+
+                # a hedged request that lost the race may still be sending a chunk
+                # from the mapping, in which case the mapping can't be closed yet,
+                # and is closed once the request finishes and the chunk is released.
+
+                try:
+                    file_map.close()
+                except BufferError:
+                    logger.debug("file mapping still in use, leaving it to be closed")
+            else:
+                file_buffers.log_stats()
+
+        blob_client.commit_block_list(blob_chunk_ids)
+
+        self.add_known(dst)
+
+    @log_execution(
+        __name__,
+        prefix="uploaded stream to azure blob storage",
+    )
+    def upload_stream(self, stream, dst, progress=None):
+        """Upload a stream of unknown size to an azure blob storage container in
+        chunks of size `settings.BACKUP_UPLOAD_CHUNK_SIZE`.
+
+        The stream is read sequentially into pooled buffers, and every chunk read is
+        staged as a block concurrently with a maximum of `settings.BACKUP_UPLOAD_CONCURRENCY`
+        threads, while the next chunks are read. Reading pauses while
+        `settings.BACKUP_UPLOAD_MEMORY_LIMIT` bytes of chunks are waiting to be staged.
+
+        Streams up to `max_single_put_size` are uploaded with a single request instead.
+
+        The block list is only committed once the stream has been exhausted and every
+        block has been staged, if reading from the stream or staging a block fails, the
+        blob is never committed, so a partial stream can't be stored as a complete backup.
+
+        Args:
+            stream (file): A file-like object to read from until exhausted, or an
+                iterable of bytes objects.
+            dst (str): The path to upload the stream to.
+            progress (dict): A dictionary of keyword arguments to pass to the tqdm
+                progress bar.
+
+        Raises:
+            ValueError: If the stream is too large to be stored in a single blob.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("uploading stream to azure blob storage: '%s'", dst)
+
         blob_client = self.client.get_blob_client(dst)
         blob_chunk_size = settings.BACKUP_UPLOAD_CHUNK_SIZE
         blob_chunk_workers = settings.BACKUP_UPLOAD_CONCURRENCY
         blob_chunk_ids = []
-        blob_chunk_index = 0
+        blob_chunk_offset = 0
+        blob_buffers = BufferPool(blob_chunk_size, max_buffers=blob_chunk_workers)
+
+        stream = as_reader(stream)
 
         if progress:
             progress = tqdm(**progress)
 
-        with ThreadPoolExecutor(max_workers=blob_chunk_workers) as executor:
-            for blob_chunk_offset in range(0, file_size, blob_chunk_size):
-                blob_chunk_length = min(blob_chunk_size, file_size - blob_chunk_offset)
+        blob_buffer = blob_buffers.acquire()
+        blob_chunk_length = readinto(stream, blob_buffer)
+
+        # a chunk is only shorter than the chunk size once the stream has been
+        # exhausted, so a stream that fits in its first chunk, and is small enough,
+        # is uploaded with a single request.
+
+        if (
+            self.config.max_single_put_size
+            and blob_chunk_length < blob_chunk_size
+            and blob_chunk_length <= self.config.max_single_put_size
+        ):
+            try:
+                self.put_blob(
+                    blob_client, bytes(blob_buffer[:blob_chunk_length]), progress
+                )
+            finally:
+                blob_buffers.release(blob_buffer)
+
+            self.add_known(dst)
+
+            return
+
+        with UploadScheduler(
+            workers=blob_chunk_workers,
+            retryable=self.is_retryable,
+        ) as scheduler:
+            while True:
+                if not blob_chunk_length:
+                    blob_buffers.release(blob_buffer)
+                    scheduler.unreserve()
+                    break
+                if len(blob_chunk_ids) >= self.max_chunks:
+                    raise ValueError(
+                        "stream exceeds the limit of %d blocks of %d bytes: '%s'"
+                        % (self.max_chunks, blob_chunk_size, dst)
+                    )
+
                 blob_chunk_id = str(blob_chunk_offset).zfill(16)
                 blob_chunk_ids.append(blob_chunk_id)
-                executor.submit(
+
+                # the chunk is staged straight from the buffer it was read into,
+                # the buffer is given back to the pool once the block has been
+                # staged (after any retries), or the upload has been cancelled.
+
+                scheduler.submit(
+                    blob_chunk_length,
                     self.upload_chunk,
                     blob_client,
-                    file,
-                    blob_chunk_offset,
+                    None,
+                    0,
                     blob_chunk_length,
                     blob_chunk_id,
                     blob_chunk_size,
                     progress,
+                    blob_buffer,
+                ).add_done_callback(
+                    lambda _, buffer=blob_buffer: blob_buffers.release(buffer)
                 )
+
+                blob_chunk_offset += blob_chunk_length
+
+                # room for the next buffer is reserved before it's read, so the
+                # chunk being read counts against the budget of the chunks in flight.
+
+                scheduler.reserve(blob_chunk_size)
+                blob_buffer = blob_buffers.acquire()
+                blob_chunk_length = readinto(stream, blob_buffer)
+
+        blob_buffers.log_stats()
         blob_client.commit_block_list(blob_chunk_ids)
 
+        self.add_known(dst)
+
+    @log_execution(
+        __name__,
+        prefix="downloaded file from azure blob storage",
+    )
+    def download(self, path, file):
+        """Download a file from the azure blob storage container.
+
+        Args:
+            path (str): The path of the file to download.
+            file (file): A writable file-like object to write the file contents to.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("downloading file from azure blob storage: '%s'", path)
+
+        blob = self.client.get_blob_client(path)
+        blob.download_blob().readinto(file)
+
     @log_execution(
         __name__,
         prefix="deleted file from azure blob storage",
@@ -220,13 +783,165 @@ class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
         blob = self.client.get_blob_client(path)
         blob.delete_blob()
 
+        self.remove_known(path)
+
+    @log_execution(
+        __name__,
+        prefix="deleted backups from azure blob storage",
+    )
+    def delete_backups(self, paths):
+        """Delete a number of backups from the azure blob storage container in batches.
+
+        Blobs are deleted in batch requests of up to `max_delete_batch` blobs, with up to
+        `max_delete_workers` batches sent at once, batches are sent as soon as they're
+        full, so backups are deleted while the rest are still being listed. Blobs that no
+        longer exist are treated as deleted.
+
+        The manifest of a volume set is only deleted once all of its volumes have been
+        deleted, so a volume set that's partially deleted is still listed, and deleted
+        again by the next run.
+
+        Args:
+            paths (Iterable[str]): The paths of the backups to delete.
+
+        Raises:
+            RuntimeError: If one or more blobs couldn't be deleted, every other blob is
+                still deleted, and the error of the first blob that failed is chained
+                to this error.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        errors = []
+        deleted = []
+
+        def delete_batch(names):
+            logger.debug(
+                "deleting batch of %d blobs from azure blob storage", len(names)
+            )
+
+            try:
+                responses = list(
+                    self.client.delete_blobs(*names, raise_on_any_failure=False)
+                )
+            except Exception as exc:
+                logger.error(
+                    "%s occurred while deleting batch of %d blobs"
+                    % (type(exc), len(names)),
+                    exc_info=True,
+                )
+                errors.extend((name, exc) for name in names)
+                return
+
+            # the responses of a batch are returned in the order of the blobs, a
+            # blob that's already gone has nothing left to delete.
+
+            for name, response in zip(names, responses):
+                if response.status_code in (202, 404):
+                    deleted.append(name)
+                    self.remove_known(name)
+                else:
+                    logger.error(
+                        "unable to delete blob: '%s' (status: %s)",
+                        name,
+                        response.status_code,
+                    )
+                    errors.append((name, HttpResponseError(response=response)))
+
+        def submit_batches(executor, names):
+            futures = []
+            batch = []
+
+            for name in names:
+                batch.append(name)
+
+                if len(batch) == self.max_delete_batch:
+                    futures.append(executor.submit(delete_batch, batch))
+                    batch = []
+
+            if batch:
+                futures.append(executor.submit(delete_batch, batch))
+
+            for future in futures:
+                future.result()
+
+        volume_sets = {}
+
+        def get_names():
+            for path in paths:
+                if path.endswith(VOLUMES_SUFFIX):
+                    logger.info(
+                        "deleting volume set from azure blob storage: '%s'", path
+                    )
+                    volume_sets[path] = self.download_volumes(path)
+
+                    yield from volume_sets[path]
+                else:
+                    logger.info("deleting file from azure blob storage: '%s'", path)
+                    yield path
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_delete_workers,
+            thread_name_prefix="azure-delete",
+        ) as executor:
+            submit_batches(executor, get_names())
+
+            # manifests are deleted last, and only once every volume of their
+            # volume set is gone.
+
+            failed = {name for name, _ in errors}
+            submit_batches(
+                executor,
+                [
+                    path
+                    for path, volumes in volume_sets.items()
+                    if not failed.intersection(volumes)
+                ],
+            )
+
+        if errors:
+            raise RuntimeError(
+                "failed to delete %s of %s blobs: %s"
+                % (
+                    len(errors),
+                    len(errors) + len(deleted),
+                    ", ".join("'%s'" % name for name, _ in errors),
+                )
+            ) from errors[0][1]
+
+    def walk(self, path):
+        """Iterate over the files in the azure blob storage container at the specified
+        path, in the order they're listed.
+
+        Only the blobs directly under the path are listed, a page at a time, using the
+        delimiter to skip over any nested directories, which are never walked into.
+        The volumes of volume sets and the empty marker blobs of directories are left
+        out, in the same way as `list`.
+
+        Args:
+            path (str): The path to list files from.
+
+        Yields:
+            str: The names of the files within the specified path.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("walking files in azure blob storage: '%s'", path)
+
+        prefix = path.replace("\\", "/").rstrip("/") + "/"
+
+        for item in self.client.walk_blobs(name_starts_with=prefix, delimiter="/"):
+            if item.name.endswith("/"):
+                continue
+            if item.size and not is_volume(item.name):
+                yield item.name
+
     def list(self, path):
         """List all sorted files in the azure blob storage container at
         the specified path.
 
-        The files are sorted so that the most recent files are listed first, note that
-        some additional processing is done to ensure the file path specified is parsed
-        correctly to support azure blob storage requirements.
+        The files are sorted so that the most recent files are listed first, see
+        `walk` for the files that are listed.
 
         Args:
             path (str): The path to list files from.
@@ -235,17 +950,4 @@ class AzureBlobStorageInterface(ClientInterfaceMixin, StorageInterface):
             List[str]: A list of file names within the specified path.
 
         """
-        logger = logging.getLogger(__name__)
-        logger.debug("listing files in azure blob storage: '%s'", path)
-
-        path = path.replace("\\", "/")
-
-        return sorted(
-            [
-                blob.name
-                for blob in self.client.list_blobs(name_starts_with=path)
-                if blob.name != path
-            ],
-            key=lambda f: os.path.splitext(f)[0].lower(),
-            reverse=True,
-        )
+        return sorted(self.walk(path), key=get_sort_key, reverse=True)
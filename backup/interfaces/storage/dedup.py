@@ -0,0 +1,807 @@
+import collections
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import PositiveInt
+from tqdm import tqdm
+
+from backup import settings
+from backup.config.models import StorageInterfaceConfig
+from backup.decorators import log_execution
+from backup.interfaces.interface import VOLUMES_SUFFIX, StorageInterface
+from backup.streams import as_reader
+from backup.utils import get_class
+
+# the gear table maps every byte value to a pseudo random 64-bit integer, the
+# table is derived from sha256 so that chunk boundaries are stable between runs
+# and releases of the application.
+
+GEAR = [
+    int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], "little")
+    for i in range(256)
+]
+
+
+def _import_numpy():
+    # numpy is an optional dependency, we import it only when a chunker is
+    # created, so the application doesn't require it unless deduplication is
+    # actually configured.
+
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "the 'numpy' package is required to deduplicate backups, "
+            "please install it with: pip install backup[dedup]"
+        )
+
+    return numpy
+
+
+def iter_hashes(data, slice_size=64 * 1024):
+    """Compute the gear hash of the 64 bytes ending at every byte of a buffer.
+
+    The gear hash shifts its digest left by one bit for every byte, so a byte no longer
+    affects the digest once 64 more bytes have been hashed, and the digest at any byte
+    only depends on the 64 bytes ending at it. The digests of every byte are computed
+    at once by doubling the width of the window six times, rather than hashing the
+    buffer a byte at a time.
+
+    The buffer is hashed a slice at a time, small enough for the intermediate arrays
+    to stay in the cpu cache between passes. The digests of the first 63 bytes of the
+    buffer only cover the bytes before them.
+
+    Args:
+        data (bytes): The data to hash.
+        slice_size (int): The number of bytes to hash at once.
+
+    Yields:
+        Tuple[int, numpy.ndarray]: The offset of every slice in the data, and the
+            64-bit digest at every byte of the slice.
+
+    """
+    numpy = _import_numpy()
+
+    gear = numpy.array(GEAR, dtype=numpy.uint64)
+    data = numpy.frombuffer(data, dtype=numpy.uint8)
+    hashes = numpy.empty(slice_size + 63, dtype=numpy.uint64)
+    shifted = numpy.empty_like(hashes)
+
+    for offset in range(0, len(data), slice_size):
+        # every slice is hashed along with the 63 bytes before it, which make up
+        # the windows of the first bytes of the slice.
+
+        start = max(offset - 63, 0)
+        end = min(offset + slice_size, len(data))
+        size = end - start
+        window = hashes[:size]
+        width = 1
+
+        # every byte is a valid index into the table, the indices are never
+        # wrapped, but unlike the default mode, the wrap mode doesn't check
+        # the indices, or buffer the output.
+
+        numpy.take(gear, data[start:end], out=window, mode="wrap")
+
+        while width < 64:
+            numpy.left_shift(window[:-width], width, out=shifted[width:size])
+            numpy.add(window[width:], shifted[width:size], out=window[width:])
+            width *= 2
+
+        yield offset, window[offset - start :]
+
+
+class Chunker(object):
+    """A content-defined chunker based on a gear rolling hash.
+
+    Content-defined chunking splits a stream into chunks at positions determined
+    by the content of the stream, rather than at fixed offsets. Inserting or removing
+    data only changes the chunks around the edit, all other chunks keep the same
+    boundaries (and hashes), which is what allows unchanged data to be deduplicated
+    between backups.
+
+    A rolling gear hash is computed over the stream, and a chunk boundary is placed
+    wherever the top bits of the hash are all zero. Boundaries are never placed within
+    `min_size` bytes of the start of a chunk (those bytes aren't hashed at all), and a
+    boundary is forced at `max_size` bytes. A stricter mask is used before `avg_size`
+    bytes and a looser mask afterwards, which keeps chunk sizes close to `avg_size`.
+
+    The stream is read in blocks of several chunks, the hashes of a whole block are
+    computed at once (see `iter_hashes`), and every position where the hash matches
+    either mask is found in bulk, so only the first 63 bytes hashed in each chunk
+    are hashed one at a time.
+
+    Args:
+        min_size (int): The minimum size of a chunk.
+        avg_size (int): The target average size of a chunk, must be a power of two.
+        max_size (int): The maximum size of a chunk.
+
+    Raises:
+        ValueError: If the chunk sizes are not valid.
+
+    """
+
+    # the number of chunks of the maximum size that are read and hashed at once.
+
+    block_chunks = 4
+
+    def __init__(self, min_size, avg_size, max_size):
+        if avg_size & (avg_size - 1):
+            raise ValueError("average chunk size must be a power of two")
+        if not min_size <= avg_size <= max_size:
+            raise ValueError("chunk sizes must satisfy: min <= avg <= max")
+
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+
+        bits = avg_size.bit_length() - 1
+
+        self.mask_strict = ((1 << (bits + 1)) - 1) << (64 - bits - 1)
+        self.mask_loose = ((1 << (bits - 1)) - 1) << (64 - bits + 1)
+
+        _import_numpy()
+
+    def get_candidates(self, data):
+        """Find every position of a buffer where the hash matches either mask.
+
+        Args:
+            data (bytes): The buffered data.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray]: The sorted offsets of the bytes whose
+                hash matches the strict mask, and the loose mask.
+
+        """
+        numpy = _import_numpy()
+
+        # both masks cover the top bits of the hash, so a hash matches a mask
+        # when it's below the lowest bit of the mask, and every hash matching the
+        # strict mask also matches the loose mask.
+
+        limit_strict = self.mask_strict & -self.mask_strict
+        limit_loose = self.mask_loose & -self.mask_loose
+        strict, loose = [], []
+
+        for offset, hashes in iter_hashes(data):
+            if limit_loose:
+                offsets = numpy.flatnonzero(hashes < limit_loose)
+            else:
+                offsets = numpy.arange(len(hashes))
+
+            strict.append(offsets[hashes[offsets] < limit_strict] + offset)
+            loose.append(offsets + offset)
+
+        if not loose:
+            return numpy.empty(0, dtype=int), numpy.empty(0, dtype=int)
+
+        return numpy.concatenate(strict), numpy.concatenate(loose)
+
+    def cut(self, data, start, end, candidates=None):
+        """Find the end of the chunk starting at `start`.
+
+        Args:
+            data (bytes): The buffered data.
+            start (int): The offset of the start of the chunk in the data.
+            end (int): The offset of the end of the buffered data.
+            candidates (tuple): The candidates of the data, from `get_candidates`,
+                found when not given.
+
+        Returns:
+            int: The offset of the end of the chunk.
+
+        """
+        size = end - start
+
+        if size <= self.min_size:
+            return end
+
+        size = min(size, self.max_size)
+        normal = min(size, self.avg_size)
+
+        if candidates is None:
+            candidates = self.get_candidates(data[: start + size])
+
+        position = start + self.min_size
+        phases = (
+            (self.mask_strict, start + normal, candidates[0]),
+            (self.mask_loose, start + size, candidates[1]),
+        )
+
+        # the hash starts over at the first byte after the minimum size, so the
+        # hashes of the first 63 bytes don't match the hashes of the whole buffer,
+        # and are computed one at a time.
+
+        gear = GEAR
+        digest = 0
+        warmup = position + 63
+
+        for mask, stop, _ in phases:
+            for byte in data[position : min(stop, warmup)]:
+                digest = ((digest << 1) + gear[byte]) & 0xFFFFFFFFFFFFFFFF
+                position += 1
+
+                if not digest & mask:
+                    return position
+
+        for _, stop, offsets in phases:
+            index = offsets.searchsorted(max(position, warmup))
+
+            if index < len(offsets) and offsets[index] < stop:
+                return int(offsets[index]) + 1
+
+            position = max(position, stop)
+
+        return start + size
+
+    def chunks(self, reader):
+        """Split the data read from a file-like object into chunks.
+
+        Args:
+            reader: A readable file-like object, read until no more data is returned.
+
+        Yields:
+            bytes: The chunks of the data, in order.
+
+        """
+        block_size = self.max_size * self.block_chunks
+        buffer = b""
+        eof = False
+
+        while not eof:
+            blocks = [buffer]
+            size = len(buffer)
+
+            while size < block_size:
+                data = reader.read(block_size - size)
+
+                if not data:
+                    eof = True
+                    break
+
+                blocks.append(data)
+                size += len(data)
+
+            buffer = b"".join(blocks)
+
+            if not buffer:
+                break
+
+            candidates = self.get_candidates(buffer)
+            view = memoryview(buffer)
+            start = 0
+
+            # chunks are cut until less than a chunk of the maximum size is left,
+            # the rest of the buffer is carried over to the next block, unless the
+            # stream has ended.
+
+            while start < len(buffer) and (eof or len(buffer) - start >= self.max_size):
+                end = self.cut(buffer, start, len(buffer), candidates)
+
+                yield bytes(view[start:end])
+
+                start = end
+
+            view.release()
+            buffer = buffer[start:]
+
+
+class LimitedReader(object):
+    """A readable file-like object that reads at most `size` bytes from another.
+
+    Args:
+        fileobj: The readable file-like object to read from.
+        size (int): The maximum number of bytes to read.
+
+    """
+
+    def __init__(self, fileobj, size):
+        self.fileobj = fileobj
+        self.remaining = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.fileobj.read(size) if size else b""
+        self.remaining -= len(data)
+
+        return data
+
+
+class DeduplicatingStorageInterfaceConfig(StorageInterfaceConfig):
+    storage: StorageInterfaceConfig
+    chunk_path: str = "chunks"
+    chunk_min_size: PositiveInt = 256 * 1024
+    chunk_avg_size: PositiveInt = 1024 * 1024
+    chunk_max_size: PositiveInt = 4 * 1024 * 1024
+
+
+class DeduplicatingStorageInterface(StorageInterface):
+    """Concrete implementation of a storage interface that deduplicates backups before
+    storing them in another, wrapped storage interface.
+
+    Every file uploaded through this interface is split into content-defined chunks, each
+    unique chunk is stored once in the wrapped storage interface, under the sha256 hash of
+    its contents. A small recipe, listing the chunks that make up the file, is stored at the
+    upload destination in place of the file itself. Backups of the same directory taken on
+    different days share most of their chunks, so only the changed chunks are stored again.
+
+    A reference count for every chunk is kept in an index stored alongside the chunks, when
+    a recipe is deleted (directly or through retention), the reference counts of its chunks are
+    decremented, and any chunks that are no longer referenced are deleted. The index is always
+    updated before a recipe is stored, and after a recipe is deleted, so an interrupted backup
+    can only ever leave unreferenced chunks behind, never delete chunks that are still in use.
+
+    Chunks are referenced as soon as an upload decides to reuse them, and chunks that are
+    being uploaded are never garbage collected, so backups and retention can run at the same
+    time. The index is only locked within a single process though, a chunk path must only
+    ever be written to by a single process at a time.
+
+    Deduplication works best with uncompressed archives (`codec: none`), since a change early
+    in a compressed stream changes all of the compressed data that follows it.
+
+    Settings:
+
+    - storage (StorageInterfaceConfig): The storage interface to store chunks and recipes in.
+        This is a complete storage interface configuration, for example a local or azure
+        blob storage interface configuration.
+
+    - chunk_path (str): The path in the wrapped storage interface to store chunks in.
+        Defaults to `chunks`.
+
+    - chunk_min_size (int), chunk_avg_size (int), chunk_max_size (int): The minimum, target
+        average and maximum size of chunks. The average size must be a power of two.
+
+    """
+
+    config_cls = DeduplicatingStorageInterfaceConfig
+    recipe_version = 1
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        storage_cls = get_class(cls=self.config.storage.interface)
+
+        self.storage = storage_cls(config=self.config.storage)
+        self.chunker = Chunker(
+            min_size=self.config.chunk_min_size,
+            avg_size=self.config.chunk_avg_size,
+            max_size=self.config.chunk_max_size,
+        )
+
+        self._index = None
+        self._index_lock = threading.Lock()
+        self._pending = collections.Counter()
+        self._paths = set()
+
+    def _get_chunk_path(self, chunk_hash):
+        return os.path.join(self.config.chunk_path, chunk_hash[:2], chunk_hash)
+
+    def _get_index_path(self):
+        return os.path.join(self.config.chunk_path, "index.json.gz")
+
+    def _load_index(self):
+        """Load the chunk reference counts from the wrapped storage interface, the
+        index is only loaded once, and kept in memory afterwards."""
+        if self._index is not None:
+            return self._index
+
+        index_path = self._get_index_path()
+
+        if not self.storage.exists(path=index_path):
+            self._index = {}
+        else:
+            index_file = io.BytesIO()
+            self.storage.download(path=index_path, file=index_file)
+            index_file.seek(0)
+
+            with gzip.GzipFile(fileobj=index_file, mode="rb") as compressed:
+                self._index = json.loads(compressed.read().decode("utf-8"))
+
+        return self._index
+
+    def _save_index(self):
+        """Store the chunk reference counts in the wrapped storage interface."""
+        index_file = io.BytesIO()
+
+        with gzip.GzipFile(fileobj=index_file, mode="wb", mtime=0) as compressed:
+            compressed.write(
+                json.dumps(self._index, separators=(",", ":")).encode("utf-8")
+            )
+
+        self._create_parents(self._get_index_path())
+        self._upload_bytes(index_file.getvalue(), self._get_index_path())
+
+    def _create_parents(self, path):
+        """Create the parent directory of a path in the wrapped storage interface."""
+        parent = os.path.dirname(path)
+
+        if parent and parent not in self._paths:
+            if not self.storage.exists(path=parent):
+                self.storage.create(path=parent)
+
+            self._paths.add(parent)
+
+    def _upload_bytes(self, data, dst):
+        self.storage.upload(
+            file=io.BytesIO(data),
+            file_size=len(data),
+            dst=dst,
+        )
+
+    def _read_recipe(self, path):
+        recipe_file = io.BytesIO()
+        self.storage.download(path=path, file=recipe_file)
+
+        recipe = json.loads(recipe_file.getvalue().decode("utf-8"))
+
+        if recipe.get("version") != self.recipe_version:
+            raise ValueError(
+                "unsupported recipe version: '%s'" % recipe.get("version"),
+            )
+
+        return recipe
+
+    def create(self, path):
+        """Create a directory in the wrapped storage interface.
+
+        Args:
+            path (str): The path of the directory to create.
+
+        """
+        self.storage.create(path=path)
+
+    def exists(self, path):
+        """Check if a recipe or directory exists in the wrapped storage interface.
+
+        Args:
+            path (str): The path to check.
+
+        Returns:
+            bool: True if the path exists, False otherwise.
+
+        """
+        return self.storage.exists(path=path)
+
+    def _reserve_chunk(self, chunk_hash, uploaded, reserved):
+        """Decide whether a chunk of a stream has to be uploaded.
+
+        A chunk that's already referenced by the index is referenced by the stream
+        straight away, so it can't be garbage collected while the stream is uploaded.
+        Any other chunk is marked as pending, and is referenced once it's uploaded.
+
+        Args:
+            chunk_hash (str): The sha256 hash of the chunk contents.
+            uploaded (Set[str]): The hashes of the chunks the stream uploads.
+            reserved (Set[str]): The hashes of the chunks the stream has referenced.
+
+        Returns:
+            bool: True if the chunk should be uploaded, False otherwise.
+
+        """
+        if chunk_hash in uploaded or chunk_hash in reserved:
+            return False
+
+        with self._index_lock:
+            index = self._load_index()
+
+            if index.get(chunk_hash, 0) > 0:
+                index[chunk_hash] += 1
+                reserved.add(chunk_hash)
+                return False
+
+            self._pending[chunk_hash] += 1
+            uploaded.add(chunk_hash)
+
+        return True
+
+    def _release_chunks(self, uploaded, reserved):
+        """Release the chunks of a stream that failed to upload, must be called
+        while holding the index lock.
+
+        The references taken on reused chunks are dropped, a chunk that's no longer
+        referenced is left in place, and only collected once it's referenced and
+        deleted again.
+
+        Args:
+            uploaded (Set[str]): The hashes of the chunks the stream uploaded.
+            reserved (Set[str]): The hashes of the chunks the stream referenced.
+
+        """
+        index = self._load_index()
+
+        for chunk_hash in reserved:
+            references = index.get(chunk_hash, 0) - 1
+
+            if references > 0:
+                index[chunk_hash] = references
+            else:
+                index.pop(chunk_hash, None)
+
+        self._pending.subtract(uploaded)
+        self._pending += collections.Counter()
+
+    def upload_chunk(self, chunk, chunk_hash, progress):
+        """Store a single chunk in the wrapped storage interface.
+
+        Args:
+            chunk (bytes): The contents of the chunk.
+            chunk_hash (str): The sha256 hash of the chunk contents.
+            progress (tqdm): A tqdm progress bar to update with the progress of the upload.
+
+        """
+        chunk_path = self._get_chunk_path(chunk_hash)
+
+        self._create_parents(chunk_path)
+        self._upload_bytes(chunk, chunk_path)
+
+        if progress is not None:
+            progress.update(len(chunk))
+
+    @log_execution(
+        __name__,
+        prefix="uploaded file to deduplicated storage",
+    )
+    def upload(self, file, file_size, dst, progress=None):
+        """Upload a file to the wrapped storage interface as deduplicated chunks.
+
+        Args:
+            file (file): The file to upload.
+            file_size (int): The size of the file to upload.
+            dst (str): The path to store the recipe of the file at.
+            progress (dict): A dictionary of keyword arguments to pass to the tqdm
+                progress bar.
+
+        """
+        self.upload_stream(LimitedReader(file, file_size), dst, progress=progress)
+
+    @log_execution(
+        __name__,
+        prefix="uploaded stream to deduplicated storage",
+    )
+    def upload_stream(self, stream, dst, progress=None):
+        """Upload a stream to the wrapped storage interface as deduplicated chunks.
+
+        The stream is split into content-defined chunks, chunks that aren't already
+        referenced by another recipe are uploaded concurrently with a maximum of
+        `settings.BACKUP_UPLOAD_CONCURRENCY` threads, and a recipe listing the chunks
+        is stored at the destination path once all chunks have been uploaded.
+
+        A chunk that's already referenced is referenced again straight away, before it's
+        skipped, so deleting another recipe while the stream is uploaded never collects
+        it. The references are released again if the upload fails.
+
+        Args:
+            stream (file): A file-like object to read from until exhausted, or an
+                iterable of bytes objects.
+            dst (str): The path to store the recipe of the stream at.
+            progress (dict): A dictionary of keyword arguments to pass to the tqdm
+                progress bar.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("uploading deduplicated stream to storage: '%s'", dst)
+
+        chunk_workers = settings.BACKUP_UPLOAD_CONCURRENCY
+        chunk_pending = collections.deque()
+        chunk_uploaded = set()
+        chunk_reserved = set()
+        chunks = []
+        size = 0
+
+        if progress:
+            progress = tqdm(**progress)
+
+        try:
+            with ThreadPoolExecutor(max_workers=chunk_workers) as executor:
+                for chunk in self.chunker.chunks(as_reader(stream)):
+                    chunk_hash = hashlib.sha256(chunk).hexdigest()
+                    chunks.append([chunk_hash, len(chunk)])
+                    size += len(chunk)
+
+                    if not self._reserve_chunk(
+                        chunk_hash, chunk_uploaded, chunk_reserved
+                    ):
+                        if progress is not None:
+                            progress.update(len(chunk))
+                        continue
+
+                    # only a bounded number of chunks are held in memory while
+                    # they're being uploaded, so the stream isn't read any faster
+                    # than the chunks can be stored.
+
+                    while len(chunk_pending) >= chunk_workers * 2:
+                        chunk_pending.popleft().result()
+
+                    chunk_pending.append(
+                        executor.submit(self.upload_chunk, chunk, chunk_hash, progress)
+                    )
+
+                while chunk_pending:
+                    chunk_pending.popleft().result()
+        except BaseException:
+            with self._index_lock:
+                self._release_chunks(chunk_uploaded, chunk_reserved)
+
+            raise
+
+        logger.info(
+            "stored %s of %s chunks for: '%s', %s chunks were deduplicated",
+            len(chunk_uploaded),
+            len(chunks),
+            dst,
+            len(chunks) - len(chunk_uploaded),
+        )
+
+        with self._index_lock:
+            index = self._load_index()
+
+            for chunk_hash in chunk_uploaded:
+                index[chunk_hash] = index.get(chunk_hash, 0) + 1
+
+            self._pending.subtract(chunk_uploaded)
+            self._pending += collections.Counter()
+
+            try:
+                self._save_index()
+            except BaseException:
+                self._release_chunks(set(), chunk_uploaded | chunk_reserved)
+                raise
+
+        recipe = json.dumps(
+            {
+                "version": self.recipe_version,
+                "size": size,
+                "chunks": chunks,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+        self._upload_bytes(recipe, dst)
+
+    @log_execution(
+        __name__,
+        prefix="downloaded file from deduplicated storage",
+    )
+    def download(self, path, file):
+        """Download a file from the wrapped storage interface, reassembling it from
+        the chunks listed in its recipe.
+
+        Args:
+            path (str): The path of the recipe of the file to download.
+            file (file): A writable file-like object to write the file contents to.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("downloading deduplicated file from storage: '%s'", path)
+
+        for chunk_hash, chunk_size in self._read_recipe(path)["chunks"]:
+            self.storage.download(path=self._get_chunk_path(chunk_hash), file=file)
+
+    @log_execution(
+        __name__,
+        prefix="deleted file from deduplicated storage",
+    )
+    def delete(self, path):
+        """Delete a recipe from the wrapped storage interface, along with any chunks
+        that are no longer referenced by another recipe.
+
+        Args:
+            path (str): The path of the recipe to delete.
+
+        """
+        self._delete_recipes([path])
+
+    @log_execution(
+        __name__,
+        prefix="deleted backups from deduplicated storage",
+    )
+    def delete_backups(self, paths):
+        """Delete a number of recipes from the wrapped storage interface, volume sets are
+        deleted along with the recipes of all of their volumes.
+
+        Unreferenced chunks are only garbage collected (and the index only stored) once,
+        after every recipe has been deleted, rather than once for every recipe.
+
+        Args:
+            paths (Iterable[str]): The paths of the recipes to delete.
+
+        """
+
+        def get_recipes():
+            for item in paths:
+                if item.endswith(VOLUMES_SUFFIX):
+                    yield from self.download_volumes(item)
+
+                yield item
+
+        self._delete_recipes(get_recipes())
+
+    def _delete_recipes(self, paths):
+        """Delete recipes from the wrapped storage interface, and garbage collect the
+        chunks that are no longer referenced once all of them have been deleted.
+
+        Args:
+            paths (Iterable[str]): The paths of the recipes to delete.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        deleted = 0
+        released = set()
+
+        for path in paths:
+            logger.info("deleting deduplicated file from storage: '%s'", path)
+
+            recipe = self._read_recipe(path)
+
+            self.storage.delete(path=path)
+            deleted += 1
+
+            with self._index_lock:
+                index = self._load_index()
+
+                for chunk_hash in set(chunk_hash for chunk_hash, _ in recipe["chunks"]):
+                    references = index.get(chunk_hash, 0) - 1
+
+                    if references > 0:
+                        index[chunk_hash] = references
+                    else:
+                        index.pop(chunk_hash, None)
+                        released.add(chunk_hash)
+
+        if not deleted:
+            return
+
+        with self._index_lock:
+            index = self._load_index()
+
+            # a released chunk may have been referenced again since, or may be
+            # being uploaded again, in either case it's about to be referenced by
+            # another recipe, and is kept.
+
+            collected = [
+                chunk_hash
+                for chunk_hash in released
+                if not index.get(chunk_hash) and not self._pending[chunk_hash]
+            ]
+
+            for chunk_hash in collected:
+                self.storage.delete(path=self._get_chunk_path(chunk_hash))
+
+            self._save_index()
+
+        logger.info("garbage collected %s unreferenced chunks", len(collected))
+
+    def walk(self, path):
+        """Iterate over the recipes in the wrapped storage interface at the specified
+        path, in no particular order.
+
+        Args:
+            path (str): The path to list recipes from.
+
+        Returns:
+            Iterable[str]: The recipe names, or None if the wrapped storage interface
+                can only list them in order.
+
+        """
+        return self.storage.walk(path=path)
+
+    def list(self, path):
+        """List all recipes in the wrapped storage interface at the specified path.
+
+        Args:
+            path (str): The path to list recipes from.
+
+        Returns:
+            List[str]: A sorted list of recipe names within the specified path.
+
+        """
+        return self.storage.list(path=path)
@@ -1,9 +1,11 @@
+import errno
+import io
 import logging
 import os
 import shutil
+import stat
 import tarfile
 import threading
-from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 from pydantic import BaseModel
@@ -12,11 +14,118 @@ from tqdm import tqdm
 from backup import settings
 from backup.config.models import StorageInterfaceConfig
 from backup.decorators import log_execution
-from backup.interfaces.interface import StorageInterface
+from backup.interfaces.interface import StorageInterface, get_sort_key, is_volume
+from backup.streams import as_reader
+from backup.transfer.buffers import BufferPool, readinto
+from backup.transfer.chunks import get_chunk_size
+from backup.transfer.scheduler import UploadScheduler
 
 file_lock = threading.Lock()
 
 
+def _get_fileno(file):
+    """Get the file descriptor of a regular file on disk, or None when the file-like
+    object isn't backed by one (an in-memory buffer or a remote file, for example)."""
+    try:
+        fd = file.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        return None
+
+    return fd
+
+
+def _pwrite_all(fd, data, offset):
+    view = memoryview(data)
+
+    while view:
+        written = os.pwrite(fd, view, offset)
+        offset += written
+        view = view[written:]
+
+
+# errors raised when a zero-copy method isn't supported between two files (different
+# filesystems on older kernels, or filesystems without support), the copy falls back
+# to the next method when any of these are raised.
+
+_COPY_UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP}
+
+# errors that are transient when writing to network backed filesystems (a busy or
+# stale file handle, or a timed out request), chunks failing with any of these are
+# retried.
+
+_RETRY_ERRNOS = {errno.EAGAIN, errno.EINTR, errno.EBUSY, errno.ETIMEDOUT, errno.ESTALE}
+
+
+def _copy_range(src, dst, offset, length):
+    """Copy a range of one file descriptor to the same offset of another.
+
+    Args:
+        src (int): The file descriptor to copy from.
+        dst (int): The file descriptor to copy to.
+        offset (int): The offset of the range in both files.
+        length (int): The length of the range.
+
+    Raises:
+        OSError: If the source file ends before the end of the range.
+
+    """
+    end = offset + length
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < end:
+                copied = os.copy_file_range(src, dst, end - offset, offset, offset)
+
+                if not copied:
+                    raise OSError(errno.EIO, "unexpected end of file while copying")
+
+                offset += copied
+            return
+        except OSError as exc:
+            if exc.errno not in _COPY_UNSUPPORTED:
+                raise
+
+    # sendfile writes at the current position of the destination, so a separate
+    # destination descriptor is opened for every chunk, to position it without
+    # affecting any other chunks being copied at the same time.
+
+    if hasattr(os, "sendfile"):
+        try:
+            dst_chunk = os.open("/proc/self/fd/%d" % dst, os.O_WRONLY)
+        except OSError:
+            dst_chunk = None
+
+        if dst_chunk is not None:
+            try:
+                os.lseek(dst_chunk, offset, os.SEEK_SET)
+
+                while offset < end:
+                    copied = os.sendfile(dst_chunk, src, offset, end - offset)
+
+                    if not copied:
+                        raise OSError(errno.EIO, "unexpected end of file while copying")
+
+                    offset += copied
+                return
+            except OSError as exc:
+                if exc.errno not in _COPY_UNSUPPORTED:
+                    raise
+            finally:
+                os.close(dst_chunk)
+
+    while offset < end:
+        data = os.pread(src, min(end - offset, 1024 * 1024), offset)
+
+        if not data:
+            raise OSError(errno.EIO, "unexpected end of file while copying")
+
+        _pwrite_all(dst, data, offset)
+        offset += len(data)
+
+
 class LocalStorageInterface(StorageInterface):
     """Concrete implementation of a storage interface for storing backups on the local filesystem.
 
@@ -66,41 +175,87 @@ class LocalStorageInterface(StorageInterface):
             path,
         )
 
-    def upload_chunk(self, file, file_dst, offset, length, chunk_size, progress):
+    def is_retryable(self, error):
+        """Check whether an error raised while uploading a chunk is transient.
+
+        Args:
+            error (Exception): The error raised while uploading the chunk.
+
+        Returns:
+            bool: True if the chunk should be retried, False otherwise.
+
+        """
+        if isinstance(error, OSError) and error.errno in _RETRY_ERRNOS:
+            return True
+
+        return super().is_retryable(error)
+
+    def upload_chunk(
+        self, file, file_dst, offset, length, chunk_size, progress, buffers=None
+    ):
         """Upload a chunk of a file to the local filesystem.
 
-        This method reads a chunk of the file and writes it to the destination file.
+        This method copies a chunk of the file to the same offset in the destination file.
+        When the file is a real file on disk, the chunk is copied by the kernel, without
+        the data ever passing through python, using `os.copy_file_range` where supported,
+        falling back to `os.sendfile`, and finally to `os.pread` and `os.pwrite`. All of
+        these use explicit offsets, so chunks are copied concurrently without any locking.
+
+        Any other file-like object shares a single file position between threads, so only
+        reading from these objects is serialized, writing is still done concurrently.
 
-        We use a separate method for uploading chunks so that we can use a ThreadPoolExecutor
+        We use a separate method for uploading chunks so that we can use an UploadScheduler
         to upload multiple chunks concurrently.
 
         Args:
             file (file): The file to upload.
-            file_dst (file): The file to upload to.
+            file_dst (int): The file descriptor of the file to upload to.
             offset (int): The offset in the file to start reading from.
             length (int): The length of the chunk to read.
             chunk_size (int): The size of the chunk to upload.
             progress (tqdm): A tqdm progress bar to update with the progress of the upload.
+            buffers (BufferPool): An optional pool of buffers to read chunks of file-like
+                objects into.
 
         """
-        with file_lock:
-            file.seek(offset)
-            file_data = file.read(length)
+        file_fd = _get_fileno(file)
 
-        with file_lock:
-            file_dst.seek(offset)
-            file_dst.write(file_data)
+        if file_fd is None and buffers is not None:
+            buffer = buffers.acquire()
 
-        if progress:
-            progress.update(len(file_data))
+            try:
+                with file_lock:
+                    file.seek(offset)
+                    file_length = readinto(file, buffer[:length])
+
+                with buffer[:file_length] as file_data:
+                    _pwrite_all(file_dst, file_data, offset)
+            finally:
+                buffers.release(buffer)
+        elif file_fd is None:
+            with file_lock:
+                file.seek(offset)
+                file_data = file.read(length)
+
+            _pwrite_all(file_dst, file_data, offset)
+        else:
+            _copy_range(file_fd, file_dst, offset, length)
+
+        if progress is not None:
+            progress.update(length)
 
     @log_execution(
         __name__,
         prefix="uploaded file to local filesystem",
     )
     def upload(self, file, file_size, dst, progress=None):
-        """Upload a file or directory to the local filesystem in chunks of size
-        `settings.BACKUP_UPLOAD_CHUNK_SIZE`.
+        """Upload a file or directory to the local filesystem in chunks of a size
+        picked for the file, up to `settings.BACKUP_UPLOAD_CHUNK_SIZE`.
+
+        The destination file is sized up front, and every chunk is written at its own
+        offset, so chunks are uploaded concurrently with a maximum of
+        `settings.BACKUP_UPLOAD_CONCURRENCY` threads, and at most
+        `settings.BACKUP_UPLOAD_MEMORY_LIMIT` bytes of chunks in flight.
 
         Args:
             file (file): The file to upload.
@@ -113,17 +268,40 @@ class LocalStorageInterface(StorageInterface):
         logger = logging.getLogger(__name__)
         logger.info("uploading file to local filesystem: '%s'", dst)
 
-        chunk_size = settings.BACKUP_UPLOAD_CHUNK_SIZE
         chunk_workers = settings.BACKUP_UPLOAD_CONCURRENCY
+        chunk_size = get_chunk_size(
+            file_size,
+            workers=chunk_workers,
+            max_chunks=self.max_chunks,
+            max_chunk_size=self.max_chunk_size,
+        )
+
+        logger.debug("uploading file in chunks of %d bytes", chunk_size)
 
         if progress:
             progress = tqdm(**progress)
 
-        with open(dst, "wb") as file_dst:
-            with ThreadPoolExecutor(max_workers=chunk_workers) as executor:
+        # files on disk are copied by the kernel, and never read into memory, any
+        # other file-like object is read into buffers reused from a pool.
+
+        file_buffers = None
+
+        if _get_fileno(file) is None:
+            file_buffers = BufferPool(chunk_size, max_buffers=chunk_workers)
+
+        file_dst = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+
+        try:
+            os.ftruncate(file_dst, file_size)
+
+            with UploadScheduler(
+                workers=chunk_workers,
+                retryable=self.is_retryable,
+            ) as scheduler:
                 for chunk_offset in range(0, file_size, chunk_size):
                     chunk_length = min(chunk_size, file_size - chunk_offset)
-                    executor.submit(
+                    scheduler.submit(
+                        chunk_length,
                         self.upload_chunk,
                         file,
                         file_dst,
@@ -131,7 +309,131 @@ class LocalStorageInterface(StorageInterface):
                         chunk_length,
                         chunk_size,
                         progress,
+                        file_buffers,
                     )
+        finally:
+            os.close(file_dst)
+
+        if file_buffers is not None:
+            file_buffers.log_stats()
+
+    def upload_buffer(self, buffer, file_dst, offset, length, progress):
+        """Write a chunk read from a stream to the local filesystem.
+
+        This method is meant to be used in conjunction with the `upload_stream` method
+        to write the chunks of a stream concurrently, every chunk is written at its own
+        offset in the destination file.
+
+        Args:
+            buffer (memoryview): The buffer the chunk was read into.
+            file_dst (int): The file descriptor of the file to upload to.
+            offset (int): The offset of the chunk in the stream.
+            length (int): The length of the chunk.
+            progress (tqdm): A tqdm progress bar to update with the progress of the upload.
+
+        """
+        with buffer[:length] as chunk:
+            _pwrite_all(file_dst, chunk, offset)
+
+        if progress is not None:
+            progress.update(length)
+
+    @log_execution(
+        __name__,
+        prefix="uploaded stream to local filesystem",
+    )
+    def upload_stream(self, stream, dst, progress=None):
+        """Upload a stream of unknown size to the local filesystem in chunks of
+        size `settings.BACKUP_UPLOAD_CHUNK_SIZE`.
+
+        The stream is read sequentially into pooled buffers, and every chunk read is
+        written at its own offset concurrently with a maximum of
+        `settings.BACKUP_UPLOAD_CONCURRENCY` threads, while the next chunks are read.
+        Reading pauses while `settings.BACKUP_UPLOAD_MEMORY_LIMIT` bytes of chunks are
+        waiting to be written.
+
+        If reading from the stream or writing a chunk fails, the partially written file
+        is removed, so a partial stream can't be stored as a complete backup.
+
+        Args:
+            stream (file): A file-like object to read from until exhausted, or an
+                iterable of bytes objects.
+            dst (str): The path to upload the stream to.
+            progress (dict): A dictionary of keyword arguments to pass to the tqdm
+                progress bar.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.info("uploading stream to local filesystem: '%s'", dst)
+
+        chunk_size = settings.BACKUP_UPLOAD_CHUNK_SIZE
+        chunk_workers = settings.BACKUP_UPLOAD_CONCURRENCY
+        chunk_offset = 0
+        buffers = BufferPool(chunk_size, max_buffers=chunk_workers)
+
+        stream = as_reader(stream)
+
+        if progress:
+            progress = tqdm(**progress)
+
+        file_dst = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+
+        try:
+            with UploadScheduler(
+                workers=chunk_workers,
+                retryable=self.is_retryable,
+            ) as scheduler:
+                while True:
+                    # room for the buffer is reserved before it's read, so the chunk
+                    # being read counts against the budget of the chunks in flight.
+
+                    scheduler.reserve(chunk_size)
+                    buffer = buffers.acquire()
+                    chunk_length = readinto(stream, buffer)
+
+                    if not chunk_length:
+                        buffers.release(buffer)
+                        scheduler.unreserve()
+                        break
+
+                    scheduler.submit(
+                        chunk_length,
+                        self.upload_buffer,
+                        buffer,
+                        file_dst,
+                        chunk_offset,
+                        chunk_length,
+                        progress,
+                    ).add_done_callback(
+                        lambda _, buffer=buffer: buffers.release(buffer)
+                    )
+
+                    chunk_offset += chunk_length
+        except BaseException:
+            os.close(file_dst)
+            os.remove(dst)
+            raise
+
+        os.close(file_dst)
+        buffers.log_stats()
+
+    @log_execution(
+        __name__,
+        prefix="downloaded file from local filesystem",
+    )
+    def download(self, path, file):
+        """Download a file from the local filesystem.
+
+        Args:
+            path (str): The path to the file to download.
+            file (file): A writable file-like object to write the file contents to.
+
+        """
+        logger = logging.getLogger(__name__)
+        logger.debug("downloading file from local filesystem: '%s'", path)
+
+        with open(path, "rb") as file_src:
+            shutil.copyfileobj(file_src, file)
 
     @log_execution(
         __name__,
@@ -154,7 +456,8 @@ class LocalStorageInterface(StorageInterface):
     def list(self, path):
         """List all sorted files in the local filesystem at the specified path.
 
-        The files are sorted so that the most recent files are listed first.
+        The files are sorted so that the most recent files are listed first, the
+        volumes of volume sets are left out, only their manifests are listed.
 
         Args:
             path (str): The path to list files from.
@@ -166,12 +469,8 @@ class LocalStorageInterface(StorageInterface):
         logger = logging.getLogger(__name__)
         logger.debug("listing files in local filesystem: '%s'", path)
 
-        # we split listed files so the extension is ignored when sorting, this
-        # makes it so that files with different extensions aren't ordered incorrectly
-        # in the case where backup configurations change.
-
         return sorted(
-            [os.path.join(path, i) for i in os.listdir(path)],
-            key=lambda f: os.path.splitext(f)[0].lower(),
+            [os.path.join(path, i) for i in os.listdir(path) if not is_volume(i)],
+            key=get_sort_key,
             reverse=True,
         )
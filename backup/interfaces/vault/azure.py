@@ -9,6 +9,7 @@ from pydantic import BaseModel
 from backup.config.models import VaultInterfaceConfig
 from backup.decorators import log_execution
 from backup.interfaces.interface import ClientInterfaceMixin, VaultInterface
+from backup.transport import get_transport
 
 
 class AzureKeyVaultInterfaceConfig(VaultInterfaceConfig):
@@ -45,6 +46,7 @@ class AzureKeyVaultInterface(ClientInterfaceMixin, VaultInterface):
         client = SecretClient(
             vault_url=self.config.url,
             credential=credential,
+            transport=get_transport(self.config.url),
         )
 
         return client
@@ -56,10 +56,18 @@ BACKUP_CONFIG_PATH = utils.getenv("BACKUP_CONFIG_PATH")
 # chunked uploads will be used for all files, and depending on the network
 # limitations, or memory constraints, this value can be adjusted to a
 # suitable value.
+#
+# files of a known size are uploaded with a chunk size picked for the size of
+# the file and the number of concurrent uploads, between the minimum chunk size
+# and this chunk size, which is used as the maximum. streams of an unknown size
+# are always uploaded in chunks of this size.
 
 BACKUP_UPLOAD_CHUNK_SIZE = utils.getenv(
     "BACKUP_UPLOAD_CHUNK_SIZE", default=200 * 1024 * 1024, cast=int
 )
+BACKUP_UPLOAD_MIN_CHUNK_SIZE = utils.getenv(
+    "BACKUP_UPLOAD_MIN_CHUNK_SIZE", default=4 * 1024 * 1024, cast=int
+)
 
 # specify the number of concurrent uploads that the application will
 # perform when uploading files to the storage interface. this value
@@ -70,6 +78,74 @@ BACKUP_UPLOAD_CONCURRENCY = utils.getenv(
     "BACKUP_UPLOAD_CONCURRENCY", default=20, cast=int
 )
 
+# specify the number of threads that will be used to compress archives, archives
+# are split into blocks of `BACKUP_COMPRESSION_BLOCK_SIZE` bytes, and each block
+# is compressed concurrently. by default, a thread is used for each cpu available
+# on the machine running the application.
+
+BACKUP_COMPRESSION_CONCURRENCY = utils.getenv(
+    "BACKUP_COMPRESSION_CONCURRENCY", default=os.cpu_count() or 1, cast=int
+)
+BACKUP_COMPRESSION_BLOCK_SIZE = utils.getenv(
+    "BACKUP_COMPRESSION_BLOCK_SIZE", default=1024 * 1024, cast=int
+)
+
+# specify the number of threads used to list and stat directories while walking a
+# local directory tree to archive it, directory reads are fanned out over these
+# threads, which hides the metadata latency of network backed filesystems.
+
+BACKUP_WALK_CONCURRENCY = utils.getenv("BACKUP_WALK_CONCURRENCY", default=8, cast=int)
+
+# specify how the http connections to storage services (and vaults) are pooled,
+# a single pool of connections is shared by every client connecting to the same
+# host, and holds enough connections for every upload thread, along with any
+# hedged requests, by default. the timeouts (in seconds) limit how long it takes
+# to open a connection, and how long a connection may go without sending or
+# receiving any data, idle connections are probed every keep-alive interval.
+
+BACKUP_HTTP_POOL_SIZE = utils.getenv(
+    "BACKUP_HTTP_POOL_SIZE", default=BACKUP_UPLOAD_CONCURRENCY * 2, cast=int
+)
+BACKUP_HTTP_CONNECTION_TIMEOUT = utils.getenv(
+    "BACKUP_HTTP_CONNECTION_TIMEOUT", default=20, cast=int
+)
+BACKUP_HTTP_READ_TIMEOUT = utils.getenv(
+    "BACKUP_HTTP_READ_TIMEOUT", default=120, cast=int
+)
+BACKUP_HTTP_KEEPALIVE = utils.getenv("BACKUP_HTTP_KEEPALIVE", default=30, cast=int)
+
+# specify the maximum number of bytes of chunks that will be held in memory at
+# once while a file is uploaded, chunks are only read once enough of the chunks
+# in flight have finished uploading to fit them, so the memory used by an upload
+# is bounded by this value rather than the chunk size times the concurrency.
+
+BACKUP_UPLOAD_MEMORY_LIMIT = utils.getenv(
+    "BACKUP_UPLOAD_MEMORY_LIMIT", default=1024 * 1024 * 1024, cast=int
+)
+
+# specify how chunks that fail to upload with a transient error (a dropped
+# connection, a timeout, or a throttled request) are retried, every chunk is
+# retried up to this many times, waiting a random time of up to the delay
+# (in seconds) before the first retry, doubling with every retry up to the
+# maximum delay.
+
+BACKUP_UPLOAD_RETRIES = utils.getenv("BACKUP_UPLOAD_RETRIES", default=5, cast=int)
+BACKUP_UPLOAD_RETRY_DELAY = utils.getenv(
+    "BACKUP_UPLOAD_RETRY_DELAY", default=1.0, cast=float
+)
+BACKUP_UPLOAD_RETRY_MAX_DELAY = utils.getenv(
+    "BACKUP_UPLOAD_RETRY_MAX_DELAY", default=60.0, cast=float
+)
+
+# specify the maximum number of bytes that will be held in memory when an archive
+# is streamed directly into the storage interface, the archive is paused whenever
+# this many bytes are waiting to be uploaded, so this value bounds the memory used
+# by a streaming backup regardless of the size of the directory being archived.
+
+BACKUP_STREAM_BUFFER_SIZE = utils.getenv(
+    "BACKUP_STREAM_BUFFER_SIZE", default=64 * 1024 * 1024, cast=int
+)
+
 # specify whether the application should continue to process other backup
 # interfaces if an error occurs while an interface is running. This may prove useful
 # in the case where the application is backing up multiple interfaces, and one of the
@@ -0,0 +1,325 @@
+import collections
+import logging
+import threading
+
+from backup import settings
+
+
+class Pipe(object):
+    """A bounded, in-memory pipe used to connect a writer and a reader running
+    on separate threads.
+
+    The pipe holds at most `capacity` bytes of data written but not yet read, once
+    the capacity is reached, any calls to `write` will block until the reader has
+    consumed enough data to free up space in the pipe. This allows a producer (such as
+    an archive being created) to run concurrently with a consumer (such as a storage
+    upload), without ever holding more than `capacity` bytes in memory, or writing
+    any intermediate data to disk.
+
+    The writer side should call `close` when all data has been written, optionally passing
+    an exception to signal that the data is incomplete. The reader side can call `abort` to
+    signal that no more data will be consumed, any blocked or future writes will then raise
+    a `BrokenPipeError`.
+
+    Args:
+        capacity (int): The maximum number of unread bytes to hold in the pipe.
+
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity or settings.BACKUP_STREAM_BUFFER_SIZE
+
+        self._chunks = collections.deque()
+        self._size = 0
+        self._closed = False
+        self._aborted = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def write(self, data):
+        """Write data to the pipe, blocking while the pipe is at capacity.
+
+        Args:
+            data (bytes): The data to write to the pipe.
+
+        Returns:
+            int: The number of bytes written.
+
+        Raises:
+            BrokenPipeError: If the reader has aborted the pipe.
+            ValueError: If the pipe has already been closed.
+
+        """
+        data = bytes(data)
+
+        with self._condition:
+            while self._size >= self.capacity and not self._aborted:
+                self._condition.wait()
+
+            if self._aborted:
+                raise BrokenPipeError("pipe reader has been aborted")
+            if self._closed:
+                raise ValueError("write to closed pipe")
+
+            if data:
+                self._chunks.append(data)
+                self._size += len(data)
+                self._condition.notify_all()
+
+        return len(data)
+
+    def read(self, size=-1):
+        """Read up to `size` bytes from the pipe.
+
+        This method blocks until `size` bytes are available, or the writer has
+        closed the pipe, in which case any remaining data is returned. An empty
+        bytes object is returned once all data has been consumed.
+
+        Args:
+            size (int): The number of bytes to read, a negative value reads
+                until the writer closes the pipe.
+
+        Returns:
+            bytes: The data read from the pipe.
+
+        Raises:
+            Exception: Any exception passed by the writer when closing the pipe.
+
+        """
+        buffer = bytearray()
+
+        with self._condition:
+            while size < 0 or len(buffer) < size:
+                while not self._chunks and not self._closed:
+                    self._condition.wait()
+
+                if self._error is not None:
+                    raise self._error
+                if not self._chunks:
+                    break
+
+                chunk = self._chunks.popleft()
+                self._size -= len(chunk)
+
+                if size >= 0 and len(buffer) + len(chunk) > size:
+                    remaining = size - len(buffer)
+                    self._chunks.appendleft(chunk[remaining:])
+                    self._size += len(chunk) - remaining
+                    chunk = chunk[:remaining]
+
+                buffer.extend(chunk)
+                self._condition.notify_all()
+
+        return bytes(buffer)
+
+    def readinto(self, buffer):
+        """Read data from the pipe straight into a buffer.
+
+        This method blocks until the buffer is full, or the writer has closed the
+        pipe, in the same way as `read`.
+
+        Args:
+            buffer (memoryview): A writable buffer to read into.
+
+        Returns:
+            int: The number of bytes read, 0 once all data has been consumed.
+
+        Raises:
+            Exception: Any exception passed by the writer when closing the pipe.
+
+        """
+        buffer = memoryview(buffer).cast("B")
+        filled = 0
+
+        with self._condition:
+            while filled < len(buffer):
+                while not self._chunks and not self._closed:
+                    self._condition.wait()
+
+                if self._error is not None:
+                    raise self._error
+                if not self._chunks:
+                    break
+
+                chunk = self._chunks.popleft()
+                count = min(len(chunk), len(buffer) - filled)
+
+                buffer[filled : filled + count] = chunk[:count]
+                filled += count
+                self._size -= count
+
+                if count < len(chunk):
+                    self._chunks.appendleft(chunk[count:])
+
+                self._condition.notify_all()
+
+        return filled
+
+    def flush(self):
+        pass
+
+    def close(self, error=None):
+        """Close the writer side of the pipe.
+
+        Args:
+            error (Exception): An optional exception to raise on the reader side,
+                used to signal that the data written to the pipe is incomplete.
+
+        """
+        with self._condition:
+            self._closed = True
+            self._error = error
+            self._condition.notify_all()
+
+    def abort(self):
+        """Abort the reader side of the pipe, unblocking any pending writes."""
+        with self._condition:
+            self._aborted = True
+            self._chunks.clear()
+            self._size = 0
+            self._condition.notify_all()
+
+
+class IterableReader(object):
+    """A readable file-like object over an iterable of bytes objects, such as a
+    generator yielding the output of a compressor or a subprocess.
+
+    Args:
+        iterable (Iterable[bytes]): The chunks of data to read, in order.
+
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self._chunk = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def _next(self):
+        while not self._chunk:
+            try:
+                self._chunk = memoryview(next(self._iterator)).cast("B")
+            except StopIteration:
+                return False
+
+        return True
+
+    def readinto(self, buffer):
+        buffer = memoryview(buffer).cast("B")
+        filled = 0
+
+        while filled < len(buffer) and self._next():
+            count = min(len(self._chunk), len(buffer) - filled)
+            buffer[filled : filled + count] = self._chunk[:count]
+            self._chunk = self._chunk[count:]
+            filled += count
+
+        return filled
+
+    def read(self, size=-1):
+        chunks = []
+
+        while size != 0 and self._next():
+            count = len(self._chunk) if size < 0 else min(len(self._chunk), size)
+            chunks.append(self._chunk[:count].tobytes())
+            self._chunk = self._chunk[count:]
+
+            if size > 0:
+                size -= count
+
+        return b"".join(chunks)
+
+
+def as_reader(stream):
+    """Get a readable file-like object for a stream.
+
+    Args:
+        stream: A readable file-like object, returned as is, or an iterable of
+            bytes objects, wrapped in an `IterableReader`.
+
+    Returns:
+        A readable file-like object.
+
+    """
+    if hasattr(stream, "read"):
+        return stream
+
+    return IterableReader(stream)
+
+
+def pipeline(producer, consumer, capacity=None):
+    """Run a producer and a consumer concurrently, connected by a bounded pipe.
+
+    The producer is called on a background thread with the pipe as its only argument,
+    and should write all of its data to the pipe. The consumer is called on the current
+    thread with the pipe as its only argument, and should read from the pipe until no
+    more data is returned.
+
+    Errors are propagated in both directions, if the producer fails, the consumer will
+    receive the exception on its next read, and if the consumer fails, the producer will
+    receive a `BrokenPipeError` on its next write. In either case, the original exception
+    is raised from this function.
+
+    Args:
+        producer (callable): A callable that writes data to the pipe.
+        consumer (callable): A callable that reads data from the pipe.
+        capacity (int): The maximum number of bytes to hold in memory, defaults
+            to `settings.BACKUP_STREAM_BUFFER_SIZE`.
+
+    Returns:
+        The return value of the consumer.
+
+    Examples:
+        >>> pipeline(
+        ...     producer=lambda pipe: pipe.write(b"data"),
+        ...     consumer=lambda pipe: pipe.read(),
+        ... )
+        b'data'
+
+    """
+    logger = logging.getLogger(__name__)
+
+    pipe = Pipe(capacity=capacity)
+    errors = []
+
+    def produce():
+        try:
+            producer(pipe)
+        except BaseException as exc:
+            errors.append(exc)
+            pipe.close(error=exc)
+        else:
+            pipe.close()
+
+    thread = threading.Thread(target=produce, name="pipeline-producer", daemon=True)
+    thread.start()
+
+    # the pipe is always aborted once the consumer returns, so that a producer
+    # blocked on a full pipe can never outlive the consumer, if the consumer read
+    # everything successfully, the producer has already closed the pipe and the
+    # abort is a no-op.
+
+    try:
+        result = consumer(pipe)
+    finally:
+        logger.debug("pipeline consumer finished, waiting for producer")
+        pipe.abort()
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return result
@@ -0,0 +1,116 @@
+import logging
+import threading
+
+
+def readinto(file, buffer):
+    """Fill a buffer with data read from a file-like object.
+
+    Reads are repeated until the buffer is full or the file is exhausted, using
+    `readinto` when the file supports it, so the data is read straight into the buffer,
+    and falling back to `read` (and copying the data into the buffer) otherwise.
+
+    Args:
+        file: A readable file-like object.
+        buffer (memoryview): The buffer to fill.
+
+    Returns:
+        int: The number of bytes read, less than the size of the buffer only when
+            the file has been exhausted.
+
+    """
+    file_readinto = getattr(file, "readinto", None)
+    filled = 0
+
+    while filled < len(buffer):
+        if file_readinto is not None:
+            count = file_readinto(buffer[filled:])
+        else:
+            data = file.read(len(buffer) - filled)
+            count = len(data)
+            buffer[filled : filled + count] = data
+
+        if not count:
+            break
+
+        filled += count
+
+    return filled
+
+
+class BufferPool(object):
+    """A pool of reusable, fixed size buffers for reading chunks of data.
+
+    Buffers are handed out as `memoryview` objects over preallocated `bytearray`
+    objects, and should be given back to the pool with `release` once the chunk read
+    into the buffer has been uploaded, so the next chunk reuses the same memory instead
+    of allocating a new object for every chunk.
+
+    A buffer is taken from the pool when one is available (a hit), and allocated when
+    the pool is empty (a miss). At most `max_buffers` buffers are kept in the pool once
+    they're released, any others are freed.
+
+    Args:
+        buffer_size (int): The size of every buffer in the pool.
+        max_buffers (int): The maximum number of buffers kept in the pool.
+        preallocate (int): The number of buffers allocated up front.
+
+    Examples:
+        >>> pool = BufferPool(buffer_size=1024, max_buffers=2)
+        >>> buffer = pool.acquire()
+        >>> pool.release(buffer)
+        >>> pool.release(pool.acquire())
+        >>> pool.hits, pool.misses
+        (1, 1)
+
+    """
+
+    def __init__(self, buffer_size, max_buffers=1, preallocate=0):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self.hits = 0
+        self.misses = 0
+
+        self._buffers = [bytearray(buffer_size) for _ in range(preallocate)]
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a buffer from the pool, allocating a new buffer if the pool is empty.
+
+        Returns:
+            memoryview: A writable view over the whole buffer.
+
+        """
+        with self._lock:
+            if self._buffers:
+                self.hits += 1
+                return memoryview(self._buffers.pop())
+
+            self.misses += 1
+
+        return memoryview(bytearray(self.buffer_size))
+
+    def release(self, buffer):
+        """Give a buffer back to the pool.
+
+        The buffer must not be used once it's released, including any slices of the
+        buffer that were handed to other objects.
+
+        Args:
+            buffer (memoryview): A view returned by `acquire`.
+
+        """
+        data = buffer.obj
+        buffer.release()
+
+        with self._lock:
+            if len(self._buffers) < self.max_buffers:
+                self._buffers.append(data)
+
+    def log_stats(self):
+        logger = logging.getLogger(__name__)
+        logger.debug(
+            "buffer pool of %d byte buffers, hits: %d, misses: %d",
+            self.buffer_size,
+            self.hits,
+            self.misses,
+        )
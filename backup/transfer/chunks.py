@@ -0,0 +1,89 @@
+from backup import settings
+
+# the number of chunks each worker should upload, splitting a file into a few chunks
+# per worker keeps every worker busy until the end of an upload, even when some
+# chunks are uploaded slower than others.
+
+CHUNKS_PER_WORKER = 4
+
+# chunk sizes are rounded up to a multiple of this alignment, so chunks start on
+# page boundaries when a file is memory mapped or copied between file descriptors.
+
+CHUNK_ALIGNMENT = 64 * 1024
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def _align(size):
+    if size <= CHUNK_ALIGNMENT:
+        return size
+
+    return _ceil_div(size, CHUNK_ALIGNMENT) * CHUNK_ALIGNMENT
+
+
+def get_chunk_size(
+    file_size,
+    workers=None,
+    min_size=None,
+    max_size=None,
+    max_chunks=None,
+    max_chunk_size=None,
+):
+    """Pick the chunk size to upload a file of a known size with.
+
+    The file is split into `CHUNKS_PER_WORKER` chunks for every worker, so small files
+    are still uploaded concurrently, and the chunk size is kept between `min_size` and
+    `max_size`. When the storage backend limits the number of chunks a file can be
+    made of, the chunk size is grown past `max_size` to stay under the limit, but
+    never past the largest chunk the backend accepts.
+
+    Args:
+        file_size (int): The size of the file to upload.
+        workers (int): The number of workers uploading chunks, defaults to
+            `settings.BACKUP_UPLOAD_CONCURRENCY`.
+        min_size (int): The smallest chunk size to use, defaults to
+            `settings.BACKUP_UPLOAD_MIN_CHUNK_SIZE`.
+        max_size (int): The largest chunk size to use, defaults to
+            `settings.BACKUP_UPLOAD_CHUNK_SIZE`.
+        max_chunks (int): The maximum number of chunks the backend accepts for a
+            single file, None if there's no limit.
+        max_chunk_size (int): The largest chunk the backend accepts, None if there's
+            no limit.
+
+    Returns:
+        int: The chunk size to upload the file with.
+
+    Raises:
+        ValueError: If the file can't be split into chunks within the backend limits.
+
+    Examples:
+        >>> get_chunk_size(64 * 1024 * 1024, workers=4, min_size=1024 * 1024)
+        4194304
+
+    """
+    workers = workers or settings.BACKUP_UPLOAD_CONCURRENCY
+    max_size = max_size or settings.BACKUP_UPLOAD_CHUNK_SIZE
+
+    if max_chunk_size:
+        max_size = min(max_size, max_chunk_size)
+
+    min_size = min(min_size or settings.BACKUP_UPLOAD_MIN_CHUNK_SIZE, max_size)
+
+    chunk_size = _align(_ceil_div(file_size, workers * CHUNKS_PER_WORKER))
+    chunk_size = max(min_size, min(chunk_size, max_size))
+
+    if max_chunks and _ceil_div(file_size, chunk_size) > max_chunks:
+        chunk_size = _align(_ceil_div(file_size, max_chunks))
+
+        if max_chunk_size and chunk_size > max_chunk_size:
+            chunk_size = _ceil_div(file_size, max_chunks)
+
+        if max_chunk_size and chunk_size > max_chunk_size:
+            raise ValueError(
+                "file of %d bytes exceeds the limit of %d chunks of %d bytes"
+                % (file_size, max_chunks, max_chunk_size)
+            )
+
+    return max(chunk_size, 1)
@@ -0,0 +1,156 @@
+import bisect
+import logging
+import queue
+import threading
+import time
+
+
+class LatencyTracker(object):
+    """Track the latency of requests, to decide when a slow request should be hedged.
+
+    Latencies are recorded per byte, so requests of different sizes (the last chunk of a
+    file is usually smaller than the others) are compared fairly. The hedging delay of a
+    request is the latency at `percentile` of every request recorded so far, scaled to the
+    size of the request, or None until `min_samples` requests have been recorded.
+
+    Args:
+        percentile (float): The percentile of latencies a request has to exceed before
+            it's hedged, between 0 and 100.
+        min_samples (int): The number of requests to record before hedging any request.
+
+    """
+
+    def __init__(self, percentile, min_samples=8):
+        self.percentile = percentile
+        self.min_samples = min_samples
+
+        self._samples = []
+        self._lock = threading.Lock()
+
+    def record(self, seconds, size):
+        """Record the latency of a request that finished.
+
+        Args:
+            seconds (float): The time taken by the request.
+            size (int): The number of bytes sent by the request.
+
+        """
+        with self._lock:
+            bisect.insort(self._samples, seconds / max(size, 1))
+
+    def get_delay(self, size):
+        """Get the time to wait for a request before hedging it.
+
+        Args:
+            size (int): The number of bytes sent by the request.
+
+        Returns:
+            float: The time to wait in seconds, or None if the request shouldn't be
+                hedged, because too few requests have been recorded.
+
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+
+            index = int(len(self._samples) * self.percentile / 100)
+            sample = self._samples[min(index, len(self._samples) - 1)]
+
+        return sample * max(size, 1)
+
+
+def call_with_hedge(fn, hedge_fn, delay, on_finished=None):
+    """Call a function, calling a hedge function concurrently if the first call takes
+    longer than a delay, and return the result of whichever call succeeds first.
+
+    Both calls must be idempotent, since both may end up completing. The call that loses
+    the race can't be interrupted once it has started, it's left to finish on its own
+    thread and its result (or error) is discarded. An error is only raised when both
+    calls fail, in which case the error of the first call is raised.
+
+    Args:
+        fn (Callable[[], Any]): The function to call first.
+        hedge_fn (Callable[[], Any]): The function to call when `fn` is slow.
+        delay (float): The time to wait for `fn` before calling `hedge_fn`, None calls
+            `fn` on the current thread without hedging.
+        on_finished (Callable[[], None]): Called once every call that was started has
+            finished, including the call that lost the race, used to free anything
+            both calls share (a buffer being sent, for example).
+
+    Returns:
+        The return value of the call that succeeded first.
+
+    """
+    logger = logging.getLogger(__name__)
+
+    if delay is None:
+        try:
+            return fn()
+        finally:
+            if on_finished is not None:
+                on_finished()
+
+    results = queue.Queue()
+    running = [1]
+    running_lock = threading.Lock()
+
+    def run(target, name):
+        try:
+            results.put((name, True, target()))
+        except BaseException as exc:
+            results.put((name, False, exc))
+        finally:
+            with running_lock:
+                running[0] -= 1
+                finished = not running[0]
+
+            if finished and on_finished is not None:
+                on_finished()
+
+    def start(target, name):
+        thread = threading.Thread(
+            target=run,
+            args=(target, name),
+            name="hedge-%s" % name,
+            daemon=True,
+        )
+        thread.start()
+
+    start(fn, "primary")
+    started = time.monotonic()
+
+    try:
+        name, success, value = results.get(timeout=delay)
+    except queue.Empty:
+        # the hedged call is only started while the first call is still running,
+        # once the first call has finished, anything shared by the calls may have
+        # already been freed by `on_finished`.
+
+        with running_lock:
+            hedged = running[0] > 0
+
+            if hedged:
+                running[0] += 1
+
+        if hedged:
+            logger.debug(
+                "request is slower than %.2fs after %.2fs, sending hedged request",
+                delay,
+                time.monotonic() - started,
+            )
+            start(hedge_fn, "hedge")
+
+        name, success, value = results.get()
+
+        if not success and hedged:
+            errors = {name: value}
+            name, success, value = results.get()
+            errors[name] = value
+
+            if not success:
+                raise errors["primary"]
+
+    if not success:
+        raise value
+
+    return value
@@ -0,0 +1,104 @@
+import logging
+import random
+import time
+
+from backup import settings
+
+
+def get_delay(attempt, delay, max_delay):
+    """Get the time to wait before retrying an operation, using exponential backoff
+    with full jitter.
+
+    The delay doubles with every attempt, up to `max_delay`, and a random delay between
+    zero and that value is picked, so operations that failed at the same time (every
+    chunk of an upload during a network outage, for example) don't retry in lockstep.
+
+    Args:
+        attempt (int): The number of the failed attempt, starting at 0.
+        delay (float): The maximum delay after the first failed attempt, in seconds.
+        max_delay (float): The maximum delay after any attempt, in seconds.
+
+    Returns:
+        float: The time to wait before retrying, in seconds.
+
+    """
+    return random.uniform(0, min(max_delay, delay * 2**attempt))
+
+
+def call_with_retry(
+    fn,
+    args=(),
+    kwargs=None,
+    retryable=None,
+    retries=None,
+    delay=None,
+    max_delay=None,
+    cancelled=None,
+):
+    """Call a function, retrying it with exponential backoff when it fails with a
+    transient error.
+
+    Args:
+        fn (Callable): The function to call, calling it again must be safe after a
+            failed attempt.
+        args (tuple): The positional arguments to call `fn` with.
+        kwargs (dict): The keyword arguments to call `fn` with.
+        retryable (Callable[[Exception], bool]): Check whether an error is transient
+            and worth retrying, no errors are retried when None.
+        retries (int): The maximum number of retries, defaults to
+            `settings.BACKUP_UPLOAD_RETRIES`.
+        delay (float): The delay after the first failed attempt, defaults to
+            `settings.BACKUP_UPLOAD_RETRY_DELAY`.
+        max_delay (float): The maximum delay between attempts, defaults to
+            `settings.BACKUP_UPLOAD_RETRY_MAX_DELAY`.
+        cancelled (threading.Event): An optional event that stops any further retries
+            once set, the last error is raised instead.
+
+    Returns:
+        The return value of `fn`.
+
+    Raises:
+        Exception: The error of the last attempt, when the error isn't retryable, or
+            the retries have run out or been cancelled.
+
+    """
+    logger = logging.getLogger(__name__)
+
+    kwargs = kwargs or {}
+    retries = settings.BACKUP_UPLOAD_RETRIES if retries is None else retries
+    delay = settings.BACKUP_UPLOAD_RETRY_DELAY if delay is None else delay
+    max_delay = (
+        settings.BACKUP_UPLOAD_RETRY_MAX_DELAY if max_delay is None else max_delay
+    )
+
+    attempt = 0
+
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as exc:
+            if attempt >= retries or retryable is None or not retryable(exc):
+                raise
+            if cancelled is not None and cancelled.is_set():
+                raise
+
+            error = exc
+
+        wait = get_delay(attempt, delay, max_delay)
+        attempt += 1
+
+        logger.warning(
+            "retrying after transient error (attempt %d of %d) in %.2fs: %s",
+            attempt,
+            retries,
+            wait,
+            error,
+        )
+
+        # the wait is cut short when the operation is cancelled, so a failed
+        # upload isn't held up by chunks sleeping between their retries.
+
+        if cancelled is None:
+            time.sleep(wait)
+        elif cancelled.wait(wait):
+            raise error
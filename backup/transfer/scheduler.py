@@ -0,0 +1,204 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backup import settings
+from backup.transfer.retry import call_with_retry
+
+
+class UploadScheduler(object):
+    """Run chunk uploads concurrently without holding more than a byte budget of
+    chunks in memory.
+
+    Every chunk is submitted along with its size, and the size is counted against the
+    budget until the chunk has finished uploading. Once the budget is full, `submit`
+    blocks the producer until enough chunks have finished to make room for the next one,
+    so a large file is read (and buffered) only as fast as it's being uploaded. A chunk
+    larger than the whole budget is still uploaded, on its own.
+
+    A producer that reads every chunk into a buffer before submitting it (such as a
+    stream) reserves room for the buffer with `reserve` before reading it, so the chunk
+    being read is counted against the budget along with the chunks in flight, and is
+    then submitted into its reservation without blocking again.
+
+    Chunks that fail with an error accepted by `retryable` are retried with exponential
+    backoff and jitter (see `call_with_retry`). The first chunk to fail for good stops
+    the upload, chunks that haven't started are skipped, chunks waiting to retry give
+    up, any further calls to `submit` raise the error, and the error is raised again
+    when the scheduler is closed. The peak number of bytes buffered at once is kept in
+    `peak`, and is logged when the scheduler closes.
+
+    Args:
+        workers (int): The number of threads uploading chunks, defaults to
+            `settings.BACKUP_UPLOAD_CONCURRENCY`.
+        memory_limit (int): The maximum number of bytes of chunks in flight at once,
+            defaults to `settings.BACKUP_UPLOAD_MEMORY_LIMIT`.
+        retryable (Callable[[Exception], bool]): Check whether a chunk error is
+            transient and worth retrying, no errors are retried when None.
+
+    Examples:
+        >>> with UploadScheduler(workers=4, memory_limit=1024) as scheduler:
+        ...     for offset in range(0, 4096, 512):
+        ...         scheduler.submit(512, upload_chunk, offset, 512)
+        >>> scheduler.peak
+        1024
+
+    """
+
+    def __init__(self, workers=None, memory_limit=None, retryable=None):
+        self.workers = workers or settings.BACKUP_UPLOAD_CONCURRENCY
+        self.memory_limit = memory_limit or settings.BACKUP_UPLOAD_MEMORY_LIMIT
+        self.retryable = retryable
+        self.buffered = 0
+        self.peak = 0
+        self.submitted = 0
+
+        self._reserved = 0
+        self._error = None
+        self._cancelled = threading.Event()
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="upload-chunk",
+        )
+
+    def _run(self, size, fn, args, kwargs):
+        try:
+            # chunks that start after another chunk has failed are skipped,
+            # the upload has already failed as a whole.
+
+            if self._cancelled.is_set():
+                return None
+
+            return call_with_retry(
+                fn,
+                args=args,
+                kwargs=kwargs,
+                retryable=self.retryable,
+                cancelled=self._cancelled,
+            )
+        except BaseException as exc:
+            with self._condition:
+                if self._error is None:
+                    self._error = exc
+                    self._cancelled.set()
+            raise
+        finally:
+            with self._condition:
+                self.buffered -= size
+                self._condition.notify_all()
+
+    def _wait(self, size):
+        # the condition is held by the caller, an empty budget always has room
+        # for the next chunk, however large it is.
+
+        while (
+            self._error is None
+            and self.buffered
+            and self.buffered + size > self.memory_limit
+        ):
+            self._condition.wait()
+
+        if self._error is not None:
+            raise self._error
+
+        self.buffered += size
+        self.peak = max(self.peak, self.buffered)
+
+    def reserve(self, size):
+        """Reserve room in the byte budget for the next chunk before it's read, blocking
+        while the byte budget is full.
+
+        The next call to `submit` uses the reservation instead of waiting for room, and
+        `unreserve` gives the reservation back when no chunk is submitted after all.
+
+        Args:
+            size (int): The number of bytes the next chunk may hold in memory.
+
+        Raises:
+            Exception: The error of the first chunk that failed to upload.
+
+        """
+        with self._condition:
+            self._wait(size)
+            self._reserved += size
+
+    def unreserve(self):
+        """Give back the room reserved for the next chunk, when it isn't submitted."""
+        with self._condition:
+            self.buffered -= self._reserved
+            self._reserved = 0
+            self._condition.notify_all()
+
+    def submit(self, size, fn, *args, **kwargs):
+        """Submit a chunk to be uploaded, blocking while the byte budget is full, unless
+        room for the chunk has been reserved (see `reserve`).
+
+        Args:
+            size (int): The number of bytes the chunk holds in memory.
+            fn (Callable): The function that uploads the chunk.
+            *args: The positional arguments to call `fn` with.
+            **kwargs: The keyword arguments to call `fn` with.
+
+        Returns:
+            concurrent.futures.Future: The future of the chunk upload.
+
+        Raises:
+            Exception: The error of the first chunk that failed to upload.
+
+        """
+        with self._condition:
+            if self._reserved:
+                self.buffered += size - self._reserved
+                self.peak = max(self.peak, self.buffered)
+                self._reserved = 0
+
+                if self._error is not None:
+                    self.buffered -= size
+                    raise self._error
+            else:
+                self._wait(size)
+
+            self.submitted += 1
+
+        try:
+            return self._executor.submit(self._run, size, fn, args, kwargs)
+        except BaseException:
+            with self._condition:
+                self.buffered -= size
+                self._condition.notify_all()
+            raise
+
+    def close(self):
+        """Wait for every submitted chunk to finish uploading, once a chunk has failed,
+        the chunks that haven't started uploading yet are cancelled instead.
+
+        Raises:
+            Exception: The error of the first chunk that failed to upload.
+
+        """
+        logger = logging.getLogger(__name__)
+
+        self._executor.shutdown(wait=True, cancel_futures=self._error is not None)
+
+        logger.info(
+            "uploaded %d chunks, peak buffered bytes: %d of %d",
+            self.submitted,
+            self.peak,
+            self.memory_limit,
+        )
+
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # when the producer fails, its error is raised instead of the error
+        # of any chunk, so the chunks that haven't started are just cancelled.
+
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(wait=True, cancel_futures=True)
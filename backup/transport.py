@@ -0,0 +1,135 @@
+import logging
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+from backup import settings
+
+# request bodies (such as staged blocks) are sent in blocks of this size, rather
+# than the 16 KiB blocks sent by default, which quarters the number of writes (and
+# system calls) needed to send a block.
+
+BLOCK_SIZE = 64 * 1024
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    """An http adapter that enables tcp keep-alive on every pooled connection, so
+    connections that sit idle between uploads (or stall in the middle of one) are
+    detected by the operating system instead of hanging until a timeout, and sends
+    request bodies in blocks of `BLOCK_SIZE` bytes."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        socket_options = list(HTTPConnection.default_socket_options)
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            socket_options.append(
+                (
+                    socket.IPPROTO_TCP,
+                    socket.TCP_KEEPIDLE,
+                    settings.BACKUP_HTTP_KEEPALIVE,
+                )
+            )
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            socket_options.append(
+                (
+                    socket.IPPROTO_TCP,
+                    socket.TCP_KEEPINTVL,
+                    settings.BACKUP_HTTP_KEEPALIVE,
+                )
+            )
+
+        kwargs["socket_options"] = socket_options
+        kwargs["blocksize"] = BLOCK_SIZE
+
+        return super().init_poolmanager(*args, **kwargs)
+
+
+def get_session(url):
+    """Get the shared http session for the host of a url.
+
+    A single session is created for every host, and shared by every client that
+    connects to the host, so connections (and their tls sessions) are reused by every
+    client instead of each client opening its own. The connection pool of the session
+    holds `settings.BACKUP_HTTP_POOL_SIZE` connections, enough for every upload thread
+    (and a hedged request for each) to hold a connection at once.
+
+    Retries are disabled on the session, requests are retried by the azure sdk
+    pipeline and the upload scheduler instead.
+
+    Args:
+        url (str): The url of the service the session connects to.
+
+    Returns:
+        requests.Session: The shared session for the host of the url.
+
+    """
+    logger = logging.getLogger(__name__)
+
+    host = urlsplit(url).netloc.lower()
+
+    with _sessions_lock:
+        session = _sessions.get(host)
+
+        if session is None:
+            logger.debug(
+                "creating http session for: '%s' with a pool of %d connections",
+                host,
+                settings.BACKUP_HTTP_POOL_SIZE,
+            )
+
+            adapter = KeepAliveHTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.BACKUP_HTTP_POOL_SIZE,
+                max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+            )
+
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            _sessions[host] = session
+
+    return session
+
+
+def get_transport(url):
+    """Get an azure sdk transport that sends requests through the shared session of
+    the host of a url.
+
+    Every client should get its own transport, the transport doesn't own the shared
+    session, so closing a client never closes the session used by other clients.
+
+    Args:
+        url (str): The url of the service the transport connects to.
+
+    Returns:
+        azure.core.pipeline.transport.RequestsTransport: The transport to pass to
+            an azure sdk client.
+
+    """
+    from azure.core.pipeline.transport import RequestsTransport
+
+    return RequestsTransport(
+        session=get_session(url),
+        session_owner=False,
+        connection_timeout=settings.BACKUP_HTTP_CONNECTION_TIMEOUT,
+        read_timeout=settings.BACKUP_HTTP_READ_TIMEOUT,
+    )
+
+
+def close_sessions():
+    """Close every shared session, and the connections in their pools."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+
+        _sessions.clear()
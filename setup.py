@@ -15,6 +15,8 @@ setup(
         "python-dotenv==1.0.1",
         "pydantic==2.9.2",
         "tqdm==4.66.5",
+        "requests==2.32.3",
+        "urllib3==2.2.3",
         "azure-core==1.31.0",
         "azure-identity==1.18.0",
         "azure-keyvault-secrets==4.8.0",
@@ -35,6 +37,13 @@ setup(
             "pytest==8.3.3",
             "pytest-cov==5.0.0",
         ],
+        "compression": [
+            "zstandard==0.23.0",
+            "lz4==4.3.3",
+        ],
+        "dedup": [
+            "numpy==2.0.2",
+        ],
     },
     entry_points={
         "console_scripts": [
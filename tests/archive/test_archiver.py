@@ -0,0 +1,178 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+from backup.archive.archiver import DELETIONS_NAME, Archiver, SparseHashingReader
+from backup.archive.manifest import Manifest
+from backup.archive.sparse import SparseReader
+
+
+def write_archive(archiver):
+    """Write an archive to memory and return the opened tar file."""
+    file = io.BytesIO()
+    archiver.write(file)
+    file.seek(0)
+
+    return tarfile.open(fileobj=file, mode="r:")
+
+
+def test_archiver(tmp_path):
+    """Test that every entry of a directory is archived."""
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "file.txt").write_bytes(b"test data")
+
+    with write_archive(Archiver(str(tmp_path))) as tar:
+        assert tar.getnames() == [".", "./sub", "./sub/file.txt"]
+        assert tar.extractfile("./sub/file.txt").read() == b"test data"
+
+
+def test_archiver_manifest(tmp_path):
+    """Test that archived entries are recorded in the manifest with a content hash."""
+    (tmp_path / "file.txt").write_bytes(b"test data")
+
+    manifest = Manifest()
+
+    write_archive(Archiver(str(tmp_path), manifest=manifest)).close()
+
+    assert sorted(manifest.entries) == [".", "./file.txt"]
+    assert manifest.get("./file.txt").hash == hashlib.sha256(b"test data").hexdigest()
+
+
+def test_archiver_incremental(tmp_path):
+    """Test that an incremental archive only contains changed files and deletions."""
+    (tmp_path / "unchanged.txt").write_bytes(b"unchanged")
+    (tmp_path / "changed.txt").write_bytes(b"original")
+    (tmp_path / "deleted.txt").write_bytes(b"deleted")
+
+    previous = Manifest()
+    write_archive(Archiver(str(tmp_path), manifest=previous)).close()
+
+    (tmp_path / "changed.txt").write_bytes(b"changed data")
+    (tmp_path / "deleted.txt").unlink()
+    (tmp_path / "new.txt").write_bytes(b"new")
+
+    manifest = Manifest()
+
+    with write_archive(
+        Archiver(str(tmp_path), manifest=manifest, previous=previous)
+    ) as tar:
+        assert tar.getnames() == [".", "./changed.txt", "./new.txt", DELETIONS_NAME]
+        assert json.loads(tar.extractfile(DELETIONS_NAME).read()) == ["./deleted.txt"]
+
+    assert manifest.get("./unchanged.txt") == previous.get("./unchanged.txt")
+    assert "./deleted.txt" not in manifest
+
+
+def test_archiver_headers_match_tarfile(tmp_path):
+    """Test that headers created from walked stat results match tarfile's own."""
+    (tmp_path / "file.txt").write_bytes(b"test data")
+    (tmp_path / "file.txt").chmod(0o640)
+    os.symlink("file.txt", tmp_path / "link.txt")
+    os.link(tmp_path / "file.txt", tmp_path / "hardlink.txt")
+
+    with write_archive(Archiver(str(tmp_path))) as tar:
+        members = {member.name: member for member in tar.getmembers()}
+
+    expected = tarfile.open(fileobj=io.BytesIO(), mode="w")
+
+    for name in ["file.txt", "hardlink.txt", "link.txt"]:
+        tarinfo = expected.gettarinfo(tmp_path / name, arcname="./" + name)
+        member = members["./" + name]
+
+        assert member.type == tarinfo.type
+        assert member.mode == tarinfo.mode & 0o7777
+        assert member.size == tarinfo.size
+        assert member.linkname == tarinfo.linkname
+        assert member.uname == tarinfo.uname
+        assert int(member.mtime) == int(tarinfo.mtime)
+
+
+def test_archiver_sparse(tmp_path):
+    """Test that files with holes are archived as sparse members that extract to
+    the original contents."""
+    src = tmp_path / "src"
+    src.mkdir()
+
+    with open(src / "sparse.img", "wb") as file:
+        file.write(b"head")
+        file.seek(8 * 1024 * 1024)
+        file.write(b"middle")
+        file.truncate(16 * 1024 * 1024)
+
+    file = io.BytesIO()
+    Archiver(str(src)).write(file)
+
+    if os.stat(src / "sparse.img").st_blocks * 512 < 16 * 1024 * 1024:
+        assert len(file.getvalue()) < 1024 * 1024
+
+    file.seek(0)
+
+    with tarfile.open(fileobj=file, mode="r:") as tar:
+        assert tar.getnames() == [".", "./sparse.img"]
+
+        tar.extractall(tmp_path / "dst", filter="tar")
+
+    with open(tmp_path / "dst" / "sparse.img", "rb") as file:
+        data = file.read()
+
+    assert len(data) == 16 * 1024 * 1024
+    assert data[:4] == b"head"
+    assert data[8 * 1024 * 1024 : 8 * 1024 * 1024 + 6] == b"middle"
+    assert data.count(0) == len(data) - 10
+
+
+def test_archiver_sparse_manifest(tmp_path):
+    """Test that the manifest hash of a sparse file is the hash of its logical
+    contents, rather than of its sparse map and data regions."""
+    with open(tmp_path / "sparse.img", "wb") as file:
+        file.write(b"head")
+        file.seek(8 * 1024 * 1024)
+        file.write(b"middle")
+        file.truncate(16 * 1024 * 1024)
+
+    manifest = Manifest()
+
+    write_archive(Archiver(str(tmp_path), manifest=manifest)).close()
+
+    expected = hashlib.sha256((tmp_path / "sparse.img").read_bytes()).hexdigest()
+
+    assert manifest.get("./sparse.img").hash == expected
+
+
+@pytest.mark.parametrize("size", [1, 7, 512, 1024 * 1024])
+def test_sparse_hashing_reader(tmp_path, size):
+    """Test that a sparse reader is hashed as the logical contents of the file."""
+    data = bytearray(3 * 1024 * 1024 + 100)
+    regions = [(0, 0), (10, 5), (1024 * 1024, 1000), (2 * 1024 * 1024 + 3, 64)]
+
+    for offset, length in regions:
+        data[offset : offset + length] = os.urandom(length)
+
+    (tmp_path / "file").write_bytes(data)
+
+    with open(tmp_path / "file", "rb") as file:
+        sparse_map = b"4\n" + b"\0" * 510
+        reader = SparseHashingReader(
+            SparseReader(file.fileno(), sparse_map, regions), len(data)
+        )
+
+        while reader.read(size):
+            pass
+
+    assert reader.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_archiver_hardlinks(tmp_path):
+    """Test that the contents of hard linked files are only archived once."""
+    (tmp_path / "a.txt").write_bytes(b"test data" * 1024)
+    os.link(tmp_path / "a.txt", tmp_path / "b.txt")
+
+    with write_archive(Archiver(str(tmp_path))) as tar:
+        assert tar.getmember("./a.txt").isreg()
+        assert tar.getmember("./b.txt").islnk()
+        assert tar.getmember("./b.txt").linkname == "./a.txt"
+        assert tar.extractfile("./b.txt").read() == b"test data" * 1024
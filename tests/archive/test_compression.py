@@ -0,0 +1,103 @@
+import gzip
+import io
+import os
+import tarfile
+
+import pytest
+
+from backup.archive.compression import (
+    ParallelGzipWriter,
+    compress_gzip_member,
+    get_codec,
+)
+
+
+def test_compress_gzip_member():
+    """Test that a block compressed into a gzip member can be decompressed."""
+    assert gzip.decompress(compress_gzip_member(b"test data", level=6)) == b"test data"
+
+
+def test_parallel_gzip_writer():
+    """Test that data compressed in parallel blocks is a valid gzip stream."""
+    data = os.urandom(1024) * 64
+    file = io.BytesIO()
+
+    with ParallelGzipWriter(file, level=6, workers=4, block_size=1000) as writer:
+        for i in range(0, len(data), 333):
+            writer.write(data[i : i + 333])
+
+    assert gzip.decompress(file.getvalue()) == data
+
+
+def test_parallel_gzip_writer_empty():
+    """Test that writing no data still produces a valid gzip stream."""
+    file = io.BytesIO()
+
+    with ParallelGzipWriter(file, workers=2, block_size=1000):
+        pass
+
+    assert gzip.decompress(file.getvalue()) == b""
+
+
+def test_parallel_gzip_writer_tar(tmp_path):
+    """Test that a tar stream compressed in parallel can be read as a tar.gz archive."""
+    (tmp_path / "file.txt").write_bytes(b"test data" * 1000)
+
+    file = io.BytesIO()
+
+    with ParallelGzipWriter(file, workers=4, block_size=512) as writer:
+        with tarfile.open(fileobj=writer, mode="w|") as tar:
+            tar.add(tmp_path / "file.txt", arcname="file.txt")
+
+    file.seek(0)
+
+    with tarfile.open(fileobj=file, mode="r:gz") as tar:
+        assert tar.extractfile("file.txt").read() == b"test data" * 1000
+
+
+@pytest.mark.parametrize(
+    "name, extension",
+    [
+        ("gzip", "tar.gz"),
+        ("zstd", "tar.zst"),
+        ("lz4", "tar.lz4"),
+        ("none", "tar"),
+    ],
+)
+def test_codec_roundtrip(name, extension):
+    """Test that data compressed with each codec can be decompressed again."""
+    codec = get_codec(name)
+    data = b"test data" * 1000
+    file = io.BytesIO()
+
+    if name == "zstd":
+        decompress = pytest.importorskip("zstandard").ZstdDecompressor()
+        decompress = decompress.decompressobj().decompress
+    elif name == "lz4":
+        decompress = pytest.importorskip("lz4.frame").decompress
+    elif name == "gzip":
+        decompress = gzip.decompress
+    else:
+        decompress = bytes
+
+    with codec.open(file, level=1, threads=2) as writer:
+        writer.write(data)
+
+    assert codec.extension == extension
+    assert not file.closed
+    assert decompress(file.getvalue()) == data
+
+
+def test_codec_command():
+    """Test that codecs provide the matching remote compression command."""
+    assert get_codec("gzip").command() == "gzip -6"
+    assert get_codec("gzip").command(level=1) == "gzip -1"
+    assert get_codec("zstd").command(level=1, threads=4) == "zstd -1 -T4"
+    assert get_codec("lz4").command() == "lz4 -1"
+    assert get_codec("none").command() is None
+
+
+def test_get_codec_invalid():
+    """Test that an unknown codec name raises an error."""
+    with pytest.raises(ValueError):
+        get_codec("unknown")
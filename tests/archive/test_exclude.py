@@ -0,0 +1,67 @@
+import re
+
+import pytest
+
+from backup.archive.exclude import ExcludeMatcher, translate
+
+
+@pytest.mark.parametrize(
+    "pattern, path, expected",
+    [
+        ("*.log", "error.log", True),
+        ("*.log", "logs/error.log", False),
+        ("file?.txt", "file1.txt", True),
+        ("file[0-9].txt", "file1.txt", True),
+        ("file[!0-9].txt", "file1.txt", False),
+        ("**/cache", "cache", True),
+        ("**/cache", "a/b/cache", True),
+        ("logs/**", "logs/a/b.log", True),
+    ],
+)
+def test_translate(pattern, path, expected):
+    """Test that glob patterns are translated into matching regular expressions."""
+    assert bool(re.fullmatch(translate(pattern), path)) is expected
+
+
+def test_exclude_matcher_names():
+    """Test that patterns without a separator match names at any depth."""
+    matcher = ExcludeMatcher(["node_modules", "*.pyc"], root="/app")
+
+    assert matcher.match("node_modules", is_dir=True)
+    assert matcher.match("src/web/node_modules", is_dir=True)
+    assert matcher.match("src/module.pyc")
+    assert not matcher.match("src/module.py")
+
+
+def test_exclude_matcher_anchored():
+    """Test that patterns with a separator are anchored to the root directory."""
+    matcher = ExcludeMatcher(["/build", "src/cache"], root="/app")
+
+    assert matcher.match("build", is_dir=True)
+    assert not matcher.match("src/build", is_dir=True)
+    assert matcher.match("src/cache", is_dir=True)
+    assert not matcher.match("lib/src/cache", is_dir=True)
+
+
+def test_exclude_matcher_absolute():
+    """Test that absolute patterns inside the root directory are anchored to it."""
+    matcher = ExcludeMatcher(["/home/www/app/uploads"], root="/home/www/app/")
+
+    assert matcher.match("uploads", is_dir=True)
+    assert not matcher.match("static/uploads", is_dir=True)
+
+
+def test_exclude_matcher_directories_only():
+    """Test that patterns with a trailing separator only match directories."""
+    matcher = ExcludeMatcher(["build/"], root="/app")
+
+    assert matcher.match("build", is_dir=True)
+    assert not matcher.match("build", is_dir=False)
+
+
+def test_exclude_matcher_empty():
+    """Test that an empty matcher excludes nothing."""
+    matcher = ExcludeMatcher([], root="/app")
+
+    assert not matcher
+    assert not matcher.match("anything")
@@ -0,0 +1,64 @@
+import io
+import os
+
+import pytest
+
+from backup.archive.manifest import Manifest, ManifestEntry
+
+
+def test_manifest_changed(tmp_path):
+    """Test that a manifest detects new and changed files."""
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"test data")
+
+    manifest = Manifest()
+    manifest.add("./file.txt", os.stat(path), hash="hash")
+
+    assert not manifest.changed("./file.txt", os.stat(path))
+    assert manifest.changed("./new.txt", os.stat(path))
+
+    path.write_bytes(b"changed test data")
+
+    assert manifest.changed("./file.txt", os.stat(path))
+
+
+def test_manifest_deleted():
+    """Test that entries missing from a newer manifest are reported as deleted."""
+    previous = Manifest(
+        entries={
+            "./a.txt": ManifestEntry(1, 1, 1),
+            "./b.txt": ManifestEntry(1, 1, 2),
+        }
+    )
+    manifest = Manifest(entries={"./a.txt": ManifestEntry(1, 1, 1)})
+
+    assert previous.deleted(manifest) == ["./b.txt"]
+
+
+def test_manifest_dump_load():
+    """Test that a manifest can be written and read back."""
+    manifest = Manifest(
+        entries={"./a.txt": ManifestEntry(10, 20, 30, "hash")},
+        incrementals=3,
+    )
+    file = io.BytesIO()
+
+    manifest.dump(file)
+    file.seek(0)
+
+    loaded = Manifest.load(file)
+
+    assert loaded.incrementals == 3
+    assert loaded.get("./a.txt") == ManifestEntry(10, 20, 30, "hash")
+
+
+def test_manifest_load_invalid_version():
+    """Test that loading a manifest with an unsupported version raises an error."""
+    file = io.BytesIO()
+    manifest = Manifest()
+    manifest.version = 0
+    manifest.dump(file)
+    file.seek(0)
+
+    with pytest.raises(ValueError):
+        Manifest.load(file)
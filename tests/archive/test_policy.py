@@ -0,0 +1,40 @@
+import os
+
+from backup.archive.policy import CompressibilityPolicy, entropy
+
+
+def test_entropy():
+    """Test that entropy ranges from zero for repeated bytes to eight for random bytes."""
+    assert entropy(b"") == 0.0
+    assert entropy(b"a" * 1024) == 0.0
+    assert entropy(bytes(range(256)) * 4) == 8.0
+
+
+def test_policy_extensions():
+    """Test that the extension lists take precedence over sampling."""
+    policy = CompressibilityPolicy(compress_extensions=["jpg"], min_size=0)
+
+    assert policy.compressible("./video.MP4", fd=None, size=1024) is False
+    assert policy.compressible("./photo.jpg", fd=None, size=1024) is True
+    assert policy.compressible("./notes.txt", fd=None, size=1024) is True
+
+
+def test_policy_min_size():
+    """Test that small files are always compressed."""
+    policy = CompressibilityPolicy(min_size=1024)
+
+    assert policy.compressible("./archive.zip", fd=None, size=1023) is True
+    assert policy.compressible("./archive.zip", fd=None, size=1024) is False
+
+
+def test_policy_entropy_sample(tmp_path):
+    """Test that files without a known extension are sampled."""
+    policy = CompressibilityPolicy(min_size=0)
+
+    (tmp_path / "random.bin").write_bytes(os.urandom(128 * 1024))
+    (tmp_path / "text.bin").write_bytes(b"hello world " * 10000)
+
+    for name, expected in [("random.bin", False), ("text.bin", True)]:
+        with open(tmp_path / name, "rb") as file:
+            assert policy.compressible(name, fd=file.fileno(), size=1024) is expected
+            assert file.tell() == 0
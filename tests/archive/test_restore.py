@@ -0,0 +1,113 @@
+import io
+import os
+
+import pytest
+
+from backup.archive.archiver import Archiver
+from backup.archive.compression import get_codec
+from backup.archive.manifest import Manifest
+from backup.archive.policy import CompressibilityPolicy
+from backup.archive.restore import extract, get_codec_for_path, restore
+from backup.interfaces.storage.local import LocalStorageInterface
+
+
+def write_archive(archiver, codec):
+    file = io.BytesIO()
+
+    with codec.open(file) as compressed:
+        archiver.write(compressed)
+
+    return file.getvalue()
+
+
+def test_get_codec_for_path():
+    """Test that the codec of an archive is determined by its extension."""
+    assert get_codec_for_path("source_1.tar.gz").name == "gzip"
+    assert get_codec_for_path("source_1.incr.tar.zst").name == "zstd"
+    assert get_codec_for_path("source_1.tar.lz4.volumes").name == "lz4"
+    assert get_codec_for_path("source_1.tar").name == "none"
+
+    with pytest.raises(ValueError):
+        get_codec_for_path("source_1.zip")
+
+
+@pytest.mark.parametrize("codec_name", ["gzip", "zstd", "lz4", "none"])
+def test_extract_stored_members(tmp_path, codec_name):
+    """Test that archives with incompressible files stored without compression are
+    extracted, and that stored files take up their original size in the archive."""
+    if codec_name == "zstd":
+        pytest.importorskip("zstandard")
+    elif codec_name == "lz4":
+        pytest.importorskip("lz4.frame")
+
+    src = tmp_path / "src"
+    src.mkdir()
+
+    data = os.urandom(256 * 1024)
+    (src / "random.bin").write_bytes(data)
+    (src / "text.txt").write_bytes(b"hello world " * 20000)
+
+    codec = get_codec(codec_name)
+    archive = write_archive(
+        Archiver(str(src), policy=CompressibilityPolicy()),
+        codec,
+    )
+
+    if codec_name == "gzip":
+        assert len(archive) < len(data) + 64 * 1024
+
+    extract(io.BytesIO(archive), str(tmp_path / "dst"), codec)
+
+    assert (tmp_path / "dst" / "random.bin").read_bytes() == data
+    assert (tmp_path / "dst" / "text.txt").read_bytes() == b"hello world " * 20000
+
+
+def test_restore_incremental(tmp_path):
+    """Test that restoring a full backup followed by an incremental backup restores
+    changed files, and removes deleted files."""
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "changed.txt").write_bytes(b"original")
+    (src / "deleted.txt").write_bytes(b"deleted")
+
+    codec = get_codec("gzip")
+    storage = LocalStorageInterface(
+        config={"interface": "backup.interfaces.storage.local.LocalStorageInterface"}
+    )
+    full, incremental = Manifest(), Manifest()
+
+    (tmp_path / "source_1.tar.gz").write_bytes(
+        write_archive(Archiver(str(src), manifest=full), codec)
+    )
+
+    (src / "changed.txt").write_bytes(b"changed data")
+    (src / "deleted.txt").unlink()
+
+    archive = write_archive(
+        Archiver(str(src), manifest=incremental, previous=full), codec
+    )
+
+    # the incremental backup is stored as a volume set, to check that volume
+    # sets are restored as a single archive.
+
+    volumes = [str(tmp_path / "source_2.incr.tar.gz.part0001")]
+    volumes.append(str(tmp_path / "source_2.incr.tar.gz.part0002"))
+
+    with open(volumes[0], "wb") as file:
+        file.write(archive[:100])
+    with open(volumes[1], "wb") as file:
+        file.write(archive[100:])
+
+    storage.upload_volumes(str(tmp_path / "source_2.incr.tar.gz"), volumes)
+
+    restore(
+        storage,
+        [
+            str(tmp_path / "source_1.tar.gz"),
+            str(tmp_path / "source_2.incr.tar.gz.volumes"),
+        ],
+        str(tmp_path / "dst"),
+    )
+
+    assert sorted(os.listdir(tmp_path / "dst")) == ["changed.txt"]
+    assert (tmp_path / "dst" / "changed.txt").read_bytes() == b"changed data"
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from backup.archive.volumes import VolumeWriter
+
+
+def test_volume_writer(tmp_path):
+    """Test that written data is split into volumes of the configured size."""
+    finished = []
+    path = str(tmp_path / "archive.tar")
+
+    with VolumeWriter(path, 10, lambda *args: finished.append(args)) as writer:
+        writer.write(b"0123456")
+        writer.write(b"789abcdef")
+        writer.write(b"ghijklmnopqrstu")
+
+    assert finished == [
+        (path + ".part0001", 1),
+        (path + ".part0002", 2),
+        (path + ".part0003", 3),
+        (path + ".part0004", 4),
+    ]
+    assert [os.path.getsize(volume) for volume, _ in finished] == [10, 10, 10, 1]
+    assert b"".join(open(volume, "rb").read() for volume, _ in finished) == (
+        b"0123456789abcdefghijklmnopqrstu"
+    )
+
+
+def test_volume_writer_empty(tmp_path):
+    """Test that an empty archive is written as a single empty volume."""
+    finished = []
+
+    with VolumeWriter(str(tmp_path / "a"), 10, lambda *args: finished.append(args)):
+        pass
+
+    assert finished == [(str(tmp_path / "a.part0001"), 1)]
+
+
+def test_volume_writer_abort(tmp_path):
+    """Test that an error raised while writing leaves the current volume unfinished."""
+    finished = []
+
+    with pytest.raises(ValueError):
+        with VolumeWriter(
+            str(tmp_path / "a"), 10, lambda *args: finished.append(args)
+        ) as writer:
+            writer.write(b"0123456789abc")
+            raise ValueError("failed")
+
+    assert finished == [(str(tmp_path / "a.part0001"), 1)]
+    assert writer.volumes == [
+        str(tmp_path / "a.part0001"),
+        str(tmp_path / "a.part0002"),
+    ]
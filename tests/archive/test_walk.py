@@ -0,0 +1,82 @@
+import os
+
+from backup.archive.exclude import ExcludeMatcher
+from backup.archive.walk import walk
+
+
+def create_tree(root, paths):
+    """Create a tree of files and directories, directories end with a separator."""
+    for path in paths:
+        path = os.path.join(root, path)
+
+        if path.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            with open(path, "w") as file:
+                file.write("test data")
+
+
+def test_walk(tmp_path):
+    """Test that a directory tree is walked depth first in sorted order."""
+    create_tree(tmp_path, ["b.txt", "a/2.txt", "a/1.txt", "c/"])
+
+    assert [entry.arcname for entry in walk(str(tmp_path))] == [
+        ".",
+        "./a",
+        "./a/1.txt",
+        "./a/2.txt",
+        "./b.txt",
+        "./c",
+    ]
+
+
+def test_walk_exclude_prunes(tmp_path, monkeypatch):
+    """Test that excluded directories are pruned without being listed."""
+    create_tree(tmp_path, ["keep.txt", "node_modules/package/index.js"])
+
+    listed = []
+    scandir = os.scandir
+
+    def scandir_spy(path):
+        listed.append(os.path.basename(path))
+        return scandir(path)
+
+    monkeypatch.setattr("os.scandir", scandir_spy)
+
+    entries = list(
+        walk(
+            str(tmp_path),
+            matcher=ExcludeMatcher(["node_modules"], root=str(tmp_path)),
+        )
+    )
+
+    assert [entry.arcname for entry in entries] == [".", "./keep.txt"]
+    assert "node_modules" not in listed
+
+
+def test_walk_parallel_order(tmp_path):
+    """Test that a parallel walk yields entries in the same order as a sequential walk,
+    with the stat result of every entry."""
+    create_tree(
+        tmp_path,
+        [
+            "%s/%s/%s.txt" % (a, b, c)
+            for a in range(6)
+            for b in range(6)
+            for c in range(3)
+        ]
+        + ["empty/", "file.txt"],
+    )
+
+    sequential = list(walk(str(tmp_path), workers=1))
+    parallel = list(walk(str(tmp_path), workers=4))
+
+    assert [entry.arcname for entry in parallel] == [
+        entry.arcname for entry in sequential
+    ]
+    assert len(parallel) == 1 + 6 + 36 + 108 + 2
+
+    for entry in parallel:
+        assert entry.stat.st_ino == os.lstat(entry.path).st_ino
@@ -0,0 +1,30 @@
+import pydantic
+import pytest
+
+from backup.config.models import CompressionConfig
+
+
+@pytest.mark.parametrize(
+    "codec, level",
+    [("gzip", 1), ("gzip", 9), ("zstd", 19), ("lz4", 12), ("none", None)],
+)
+def test_compression_level(codec, level):
+    """Test that compression levels supported by the codec are accepted."""
+    assert CompressionConfig(codec=codec, level=level).level == level
+
+
+@pytest.mark.parametrize(
+    "codec, level, message",
+    [
+        ("gzip", 0, "compression level: 0 is out of range for codec: 'gzip' (1-9)"),
+        ("zstd", 22, "compression level: 22 is out of range for codec: 'zstd' (1-19)"),
+        ("lz4", -1, "compression level: -1 is out of range for codec: 'lz4' (1-12)"),
+        ("none", 1, "codec: 'none' does not support compression levels"),
+    ],
+)
+def test_compression_level_invalid(codec, level, message):
+    """Test that compression levels the codec doesn't support are rejected."""
+    with pytest.raises(pydantic.ValidationError) as exc_info:
+        CompressionConfig(codec=codec, level=level)
+
+    assert message in str(exc_info.value)
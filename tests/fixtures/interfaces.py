@@ -1,12 +1,16 @@
+import threading
+
 from backup.config.models import (
     BackupInterfaceConfig,
     BaseInterfaceConfig,
+    DirectoryBackupInterfaceConfig,
     StorageInterfaceConfig,
     VaultInterfaceConfig,
 )
 from backup.interfaces.interface import (
     BackupInterface,
     ClientInterfaceMixin,
+    DirectoryInterfaceMixin,
     Interface,
     StorageInterface,
     VaultInterface,
@@ -57,6 +61,32 @@ class MockBackupInterface(BackupInterface):
         return "backup"
 
 
+class MockDirectoryBackupInterface(DirectoryInterfaceMixin, BackupInterface):
+    config_cls = DirectoryBackupInterfaceConfig
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.backed_up = []
+        self.threads = set()
+
+    def validate(self):
+        return "validate"
+
+    def archive(self, directory, src):
+        return "archive"
+
+    def backup(self):
+        self.backup_directories()
+
+    def backup_directory(self, directory):
+        self.threads.add(threading.current_thread().name)
+
+        if directory.name.startswith("fail"):
+            raise ValueError("failed to back up: '%s'" % directory.src)
+
+        self.backed_up.append(directory.name)
+
+
 class MockStorageInterface(StorageInterface):
     config_cls = MockStorageInterfaceConfig
 
@@ -72,6 +102,12 @@ class MockStorageInterface(StorageInterface):
     def upload(self, file, file_size, dst):
         return "upload"
 
+    def upload_stream(self, stream, dst):
+        return "upload_stream"
+
+    def download(self, path, file):
+        return "download"
+
     def delete(self, path):
         return "delete"
 
@@ -1,10 +1,14 @@
+import io
+import os
 import shutil
+import tarfile
 from unittest.mock import MagicMock, mock_open, patch
 
 import pydantic
 import pytest
 
 from backup.interfaces.directories.local import LocalDirectoryBackupInterface
+from backup.interfaces.storage.local import LocalStorageInterface
 
 
 @pytest.fixture
@@ -61,21 +65,288 @@ def test_validate_invalid(local_directory_backup_interface):
     )
 
 
-def test_archive(local_directory_backup_interface):
+def test_archive(local_directory_backup_interface, tmp_path):
     """Test that a directory can be archived."""
-    with patch(
-        "shutil.make_archive", return_value="/path/to/archive.tar.gz"
-    ) as make_archive_mock:
-        result, extension = local_directory_backup_interface.archive(
-            directory=local_directory_backup_interface.config.directories[0],
-            src=local_directory_backup_interface.config.directories[0].src,
-        )
+    src = tmp_path / "source"
+    src.mkdir()
+    (src / "file.txt").write_bytes(b"test data")
+
+    result, extension = local_directory_backup_interface.archive(
+        directory=local_directory_backup_interface.config.directories[0],
+        src=str(src),
+    )
+
+    assert result == str(tmp_path / "source.tar.gz")
+    assert extension == "tar.gz"
+
+    with tarfile.open(result, mode="r:gz") as tar:
+        assert tar.extractfile("./file.txt").read() == b"test data"
+
+
+def test_archive_compression(local_directory_backup_interface, tmp_path):
+    """Test that a directory is archived with the configured compression codec."""
+    src = tmp_path / "source"
+    src.mkdir()
+    (src / "file.txt").write_bytes(b"test data")
+
+    directory = local_directory_backup_interface.config.directories[0]
+    directory.compression.codec = "none"
+
+    result, extension = local_directory_backup_interface.archive(
+        directory=directory,
+        src=str(src),
+    )
+
+    assert result == str(tmp_path / "source.tar")
+    assert extension == "tar"
+
+    with tarfile.open(result, mode="r:") as tar:
+        assert tar.extractfile("./file.txt").read() == b"test data"
+
+
+def test_archive_exclude(local_directory_backup_interface, tmp_path):
+    """Test that excluded paths are left out of the archive."""
+    src = tmp_path / "source"
+    (src / "node_modules" / "package").mkdir(parents=True)
+    (src / "node_modules" / "package" / "index.js").write_bytes(b"excluded")
+    (src / "debug.log").write_bytes(b"excluded")
+    (src / "file.txt").write_bytes(b"test data")
+
+    directory = local_directory_backup_interface.config.directories[0]
+    directory.exclude = ["node_modules/", "*.log"]
+
+    result, extension = local_directory_backup_interface.archive(
+        directory=directory,
+        src=str(src),
+    )
+
+    with tarfile.open(result, mode="r:gz") as tar:
+        assert tar.getnames() == [".", "./file.txt"]
+
+
+def test_archive_stream(local_directory_backup_interface, tmp_path):
+    """Test that a directory can be streamed into a file-like object."""
+    src = tmp_path / "source"
+    src.mkdir()
+    (src / "file.txt").write_bytes(b"test data")
+
+    file = io.BytesIO()
+
+    local_directory_backup_interface.archive_stream(
+        directory=local_directory_backup_interface.config.directories[0],
+        src=str(src),
+        file=file,
+    )
+
+    file.seek(0)
+
+    with tarfile.open(fileobj=file, mode="r:gz") as tar:
+        assert tar.extractfile("./file.txt").read() == b"test data"
+
+
+def test_backup_stream(local_directory_backup_interface, tmp_path):
+    """Test that a directory is streamed into the storage interface when
+    streaming is enabled, without creating a temporary archive."""
+    src = tmp_path / "source"
+    src.mkdir()
+    (src / "file.txt").write_bytes(b"test data")
+
+    uploaded = io.BytesIO()
+
+    def upload_stream(stream, dst, progress=None):
+        uploaded.write(stream.read())
+
+    storage = local_directory_backup_interface.storage
+    storage.exists.return_value = True
+    storage.upload_stream.side_effect = upload_stream
+
+    local_directory_backup_interface.config.stream = True
+    local_directory_backup_interface.config.directories = [
+        local_directory_backup_interface.config.directories[0]
+    ]
+    local_directory_backup_interface.config.directories[0].src = str(src)
+
+    with patch("shutil.make_archive") as make_archive_mock:
+        local_directory_backup_interface.backup()
+
+    make_archive_mock.assert_not_called()
+    storage.upload.assert_not_called()
+
+    assert storage.upload_stream.call_count == 1
+    assert storage.upload_stream.call_args.kwargs["dst"].endswith(".tar.gz")
+    assert list(tmp_path.iterdir()) == [src]
+
+    uploaded.seek(0)
+
+    with tarfile.open(fileobj=uploaded, mode="r:gz") as tar:
+        assert tar.extractfile("./file.txt").read() == b"test data"
+
+
+def test_backup_stream_local_storage(tmp_path):
+    """Test that a directory is streamed into a local storage interface, with the
+    progress bar of a stream that has no known size."""
+    src = tmp_path / "source"
+    src.mkdir()
+    (src / "file.txt").write_bytes(b"test data")
+
+    interface = LocalDirectoryBackupInterface(
+        config={
+            "interface": "backup.interfaces.directories.local.LocalDirectoryBackupInterface",
+            "stream": True,
+            "directories": [
+                {
+                    "src": str(src),
+                    "dest": str(tmp_path / "backups"),
+                    "name": "source",
+                },
+            ],
+        },
+        storage=LocalStorageInterface(
+            config={
+                "interface": "backup.interfaces.storage.local.LocalStorageInterface",
+            }
+        ),
+    )
+
+    interface.backup()
+
+    (backup,) = os.listdir(tmp_path / "backups" / "source")
+
+    assert backup.endswith(".tar.gz")
+
+    with tarfile.open(tmp_path / "backups" / "source" / backup) as tar:
+        assert tar.extractfile("./file.txt").read() == b"test data"
+
+
+def test_backup_incremental(tmp_path):
+    """Test that incremental backups only archive files changed since the previous
+    backup, and that a full backup is taken every `full_every` backups."""
+    src = tmp_path / "source"
+    src.mkdir()
+    (src / "unchanged.txt").write_bytes(b"unchanged")
+    (src / "changed.txt").write_bytes(b"original")
+
+    interface = LocalDirectoryBackupInterface(
+        config={
+            "interface": "backup.interfaces.directories.local.LocalDirectoryBackupInterface",
+            "directories": [
+                {
+                    "src": str(src),
+                    "dest": str(tmp_path / "backups"),
+                    "name": "source",
+                    "incremental": {"full_every": 2},
+                },
+            ],
+        },
+        storage=LocalStorageInterface(
+            config={
+                "interface": "backup.interfaces.storage.local.LocalStorageInterface",
+            }
+        ),
+    )
+
+    def backup(timestamp):
+        with patch(
+            "backup.interfaces.directories.local.get_backup_name",
+            return_value="source_%s" % timestamp,
+        ):
+            interface.backup()
+
+    def names(backup):
+        with tarfile.open(tmp_path / "backups" / "source" / backup) as tar:
+            return [name for name in tar.getnames() if name != "."]
+
+    backup(1)
+    (src / "changed.txt").write_bytes(b"changed data")
+    backup(2)
+    backup(3)
+
+    assert sorted(os.listdir(tmp_path / "backups" / "source")) == [
+        "source_1.tar.gz",
+        "source_2.incr.tar.gz",
+        "source_3.tar.gz",
+    ]
+    assert os.path.exists(tmp_path / "backups" / "source.manifest.gz")
+
+    assert names("source_1.tar.gz") == ["./changed.txt", "./unchanged.txt"]
+    assert names("source_2.incr.tar.gz") == [
+        "./changed.txt",
+        "./.backup-deletions.json",
+    ]
+    assert names("source_3.tar.gz") == ["./changed.txt", "./unchanged.txt"]
 
-        make_archive_mock.assert_called_once_with(
-            base_name="/path/to/source/1",
-            root_dir="/path/to/source/1",
-            format="gztar",
+
+def _volume_interface(tmp_path, storage):
+    src = tmp_path / "source"
+    src.mkdir()
+    (src / "data.bin").write_bytes(os.urandom(64 * 1024))
+
+    return LocalDirectoryBackupInterface(
+        config={
+            "interface": "backup.interfaces.directories.local.LocalDirectoryBackupInterface",
+            "directories": [
+                {
+                    "src": str(src),
+                    "dest": str(tmp_path / "backups"),
+                    "name": "source",
+                    "volume_size": 16 * 1024,
+                    "retention": {"count": 1},
+                },
+            ],
+        },
+        storage=storage,
+    )
+
+
+def test_backup_volumes(tmp_path):
+    """Test that archives are split into volumes, uploaded with a volume manifest,
+    and that retention treats every volume set as a single backup."""
+    storage = LocalStorageInterface(
+        config={
+            "interface": "backup.interfaces.storage.local.LocalStorageInterface",
+        }
+    )
+    interface = _volume_interface(tmp_path, storage)
+    backups = tmp_path / "backups" / "source"
+
+    for timestamp in [1, 2]:
+        with patch(
+            "backup.interfaces.directories.local.get_backup_name",
+            return_value="source_%s" % timestamp,
+        ):
+            interface.backup()
+
+    names = sorted(os.listdir(backups))
+    volumes = [name for name in names if ".part" in name]
+
+    assert "source_2.tar.gz.volumes" in names
+    assert not any(name.startswith("source_1") for name in names)
+    assert len(volumes) > 1
+    assert storage.list(str(backups)) == [str(backups / "source_2.tar.gz.volumes")]
+    assert not os.path.exists(tmp_path / "source.tar.gz.part0001")
+
+    data = b"".join((backups / volume).read_bytes() for volume in volumes)
+
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+        assert (
+            tar.extractfile("./data.bin").read()
+            == (tmp_path / "source" / "data.bin").read_bytes()
         )
 
-        assert result == "/path/to/archive.tar.gz"
-        assert extension == "tar.gz"
+
+def test_backup_volumes_upload_error(tmp_path):
+    """Test that a failed volume upload stops the backup, and removes the volumes
+    that were already uploaded."""
+    storage = MagicMock()
+    storage.upload.side_effect = [None, OSError("upload failed")]
+
+    interface = _volume_interface(tmp_path, storage)
+
+    with pytest.raises(RuntimeError) as exc_info:
+        interface.backup()
+
+    assert isinstance(exc_info.value.__cause__, OSError)
+    assert storage.delete.call_count == 1
+    assert storage.delete.call_args[1]["path"].endswith(".tar.gz.part0001")
+    assert not storage.upload_volumes.called
+    assert not [name for name in os.listdir(tmp_path) if ".part" in name]
@@ -1,4 +1,6 @@
+import os
 import shutil
+import tempfile
 from unittest.mock import MagicMock, mock_open, patch
 
 import pydantic
@@ -48,6 +50,23 @@ def test_validate(ssh_directory_backup_interface):
         ssh_directory_backup_interface.validate()
 
 
+def test_validate_incremental(ssh_directory_backup_interface):
+    """Test that remote directories configured for incremental backups are rejected."""
+    directory = ssh_directory_backup_interface.config.directories[0]
+    directory.incremental = {"full_every": 7}
+
+    ssh_directory_backup_interface.client.exec_command = MagicMock()
+
+    with pytest.raises(ValueError) as exc_info:
+        ssh_directory_backup_interface.validate()
+
+    assert str(exc_info.value) == (
+        "incremental backups are not supported for remote directory: '%s'"
+        % directory.src
+    )
+    ssh_directory_backup_interface.client.exec_command.assert_not_called()
+
+
 def test_validate_invalid(ssh_directory_backup_interface):
     """Test that an exception is raised when a remote directory is invalid."""
     mock_stdout_does_not_exist = MagicMock()
@@ -100,3 +119,91 @@ def test_archive(ssh_directory_backup_interface):
 
     assert result == "/tmp/directory1.tar.gz"
     assert extension == "tar.gz"
+
+
+def test_archive_compression(ssh_directory_backup_interface):
+    """Test that a remote directory is archived with the configured compression codec."""
+    mock_stdout = MagicMock()
+    mock_stdout.channel.recv_exit_status.return_value = 0
+
+    directory = ssh_directory_backup_interface.config.directories[0]
+    directory.compression.codec = "zstd"
+    directory.compression.level = 1
+
+    with patch(
+        "paramiko.SSHClient.exec_command",
+        return_value=(MagicMock(), mock_stdout, MagicMock()),
+    ) as exec_command_mock:
+        result, extension = ssh_directory_backup_interface.archive(
+            directory=directory,
+            src=directory.src,
+        )
+
+    assert result == "/tmp/directory1.tar.zst"
+    assert extension == "tar.zst"
+    assert "--use-compress-program='zstd -1 -T0'" in exec_command_mock.call_args[0][0]
+
+
+def test_backup_volumes(ssh_directory_backup_interface):
+    """Test that remote archives are streamed over ssh and split into volumes."""
+    directory = ssh_directory_backup_interface.config.directories[0]
+    directory.volume_size = 4
+
+    stdout = MagicMock()
+    stdout.read.side_effect = [b"0123456789", b""]
+    stdout.channel.recv_exit_status.return_value = 0
+
+    ssh_directory_backup_interface.client.exec_command = MagicMock(
+        return_value=(MagicMock(), stdout, MagicMock())
+    )
+    storage = ssh_directory_backup_interface.storage
+
+    ssh_directory_backup_interface.backup()
+
+    command = ssh_directory_backup_interface.client.exec_command.call_args[0][0]
+
+    assert command.startswith("tar -cf - ")
+    assert storage.upload.call_count == 3
+    assert [c[1]["file_size"] for c in storage.upload.call_args_list] == [4, 4, 2]
+    assert storage.upload_volumes.call_args[0][1][-1].endswith(".tar.gz.part0003")
+
+
+def test_backup_volumes_temporary_directory(ssh_directory_backup_interface):
+    """Test that volumes are written to a temporary directory unique to the backup,
+    which is removed once the volumes are uploaded."""
+    directory = ssh_directory_backup_interface.config.directories[0]
+    directory.volume_size = 4
+
+    with patch.object(
+        ssh_directory_backup_interface, "backup_volumes"
+    ) as backup_volumes_mock:
+        ssh_directory_backup_interface.backup_directory(directory)
+        ssh_directory_backup_interface.backup_directory(directory)
+
+    first, second = [c[1]["path"] for c in backup_volumes_mock.call_args_list]
+
+    assert os.path.dirname(os.path.dirname(first)) == tempfile.gettempdir()
+    assert os.path.dirname(first) != os.path.dirname(second)
+    assert not os.path.exists(os.path.dirname(first))
+
+
+def test_backup_volumes_tar_error(ssh_directory_backup_interface):
+    """Test that the standard error of a failed tar command is reported."""
+    directory = ssh_directory_backup_interface.config.directories[0]
+    directory.volume_size = 4
+
+    stdout = MagicMock()
+    stdout.read.side_effect = [b"0123456789", b""]
+    stdout.channel.recv_exit_status.return_value = 2
+
+    stderr = MagicMock()
+    stderr.read.return_value = b"tar: permission denied\n"
+
+    ssh_directory_backup_interface.client.exec_command = MagicMock(
+        return_value=(MagicMock(), stdout, stderr)
+    )
+
+    with pytest.raises(RuntimeError, match="status: 2: tar: permission denied"):
+        ssh_directory_backup_interface.backup_directory(directory)
+
+    stderr.read.assert_called_once_with()
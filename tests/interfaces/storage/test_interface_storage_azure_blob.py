@@ -1,9 +1,16 @@
+import io
+import threading
 from unittest.mock import MagicMock, patch
 
 import pytest
-from azure.core.exceptions import ResourceNotFoundError
+from azure.core.exceptions import (
+    HttpResponseError,
+    ResourceNotFoundError,
+    ServiceRequestError,
+)
 
 from backup.interfaces.storage.azure import AzureBlobStorageInterface
+from backup.transfer.buffers import BufferPool
 
 
 @pytest.fixture
@@ -15,6 +22,7 @@ def azure_blob_storage_interface():
             "storage_account": "test_account",
             "storage_container": "test_container",
             "storage_key": "test_key",
+            "max_single_put_size": 0,
         }
     )
     interface.client = MagicMock()
@@ -22,10 +30,34 @@ def azure_blob_storage_interface():
     return interface
 
 
+def mock_walk(names):
+    """Create the items listed by `walk_blobs` for a list of blob and prefix names."""
+    items = []
+
+    for name in names:
+        item = MagicMock(spec_set=["name"])
+        item.name = name
+        items.append(item)
+
+    return items
+
+
 def test_create(azure_blob_storage_interface):
-    """Test that a directory can be created in the azure blob storage container."""
+    """Test that creating a directory sends no requests, and is remembered."""
+    path = "backups/test_directory"
+    azure_blob_storage_interface.client.walk_blobs.return_value = []
+
+    azure_blob_storage_interface.create(path)
+
+    azure_blob_storage_interface.client.get_blob_client.assert_not_called()
+    assert azure_blob_storage_interface.exists(path) is True
+
+
+def test_create_directory_markers(azure_blob_storage_interface):
+    """Test that a marker blob is stored for a directory when markers are enabled."""
     path = "test_directory"
     mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+    azure_blob_storage_interface.config.directory_markers = True
 
     azure_blob_storage_interface.create(path)
 
@@ -34,34 +66,109 @@ def test_create(azure_blob_storage_interface):
 
 
 def test_exists_when_blob_exists(azure_blob_storage_interface):
-    """Test that the exists method returns true when the blob exists."""
-    path = "existing_blob"
-    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
-    mock_blob_client.get_blob_properties.return_value = MagicMock()
+    """Test that the exists method returns true when the blob, a directory, or the
+    marker of a directory exists."""
+    mock_walk_blobs = azure_blob_storage_interface.client.walk_blobs
+    mock_walk_blobs.return_value = mock_walk(
+        ["backups/existing_blob", "backups/directory/", "backups/marker"]
+    )
 
-    result = azure_blob_storage_interface.exists(path)
+    assert azure_blob_storage_interface.exists("backups/existing_blob") is True
+    assert azure_blob_storage_interface.exists("backups/directory") is True
+    assert azure_blob_storage_interface.exists("backups/marker") is True
 
-    assert result is True
-    azure_blob_storage_interface.client.get_blob_client.assert_called_once_with(path)
-    mock_blob_client.get_blob_properties.assert_called_once()
+    mock_walk_blobs.assert_called_once_with(name_starts_with="backups/", delimiter="/")
 
 
 def test_exists_when_blob_does_not_exist(azure_blob_storage_interface):
     """Test that the exists method returns false when the blob does not exist."""
-    path = "non_existent_blob"
-    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
-    mock_blob_client.get_blob_properties.side_effect = ResourceNotFoundError
+    mock_walk_blobs = azure_blob_storage_interface.client.walk_blobs
+    mock_walk_blobs.return_value = mock_walk(["non_existent_blob_2"])
 
-    result = azure_blob_storage_interface.exists(path)
+    result = azure_blob_storage_interface.exists("non_existent_blob")
 
     assert result is False
-    azure_blob_storage_interface.client.get_blob_client.assert_called_once_with(path)
-    mock_blob_client.get_blob_properties.assert_called_once()
+    mock_walk_blobs.assert_called_once_with(name_starts_with=None, delimiter="/")
+
+
+def test_exists_after_upload(azure_blob_storage_interface):
+    """Test that uploaded blobs, and their directories, exist without listing the
+    directories again."""
+    mock_walk_blobs = azure_blob_storage_interface.client.walk_blobs
+    mock_walk_blobs.return_value = []
+
+    assert azure_blob_storage_interface.exists("backups/directory") is False
+
+    azure_blob_storage_interface.upload(
+        io.BytesIO(b"x" * 100), 100, "backups/directory/uploaded_file"
+    )
+
+    assert azure_blob_storage_interface.exists("backups/directory") is True
+    assert mock_walk_blobs.call_count == 1
+
+
+def test_exists_after_delete(azure_blob_storage_interface):
+    """Test that deleted blobs no longer exist, and that the directories above them
+    are listed again."""
+    mock_walk_blobs = azure_blob_storage_interface.client.walk_blobs
+    mock_walk_blobs.return_value = mock_walk(["backups/directory/file"])
+
+    assert azure_blob_storage_interface.exists("backups/directory/file") is True
+
+    azure_blob_storage_interface.delete("backups/directory/file")
+
+    assert azure_blob_storage_interface.exists("backups/directory/file") is False
+    assert mock_walk_blobs.call_count == 1
+
+    mock_walk_blobs.return_value = []
+
+    assert azure_blob_storage_interface.exists("backups/directory") is False
+    assert mock_walk_blobs.call_count == 2
+
+
+def test_exists_concurrent_listing(azure_blob_storage_interface):
+    """Test that a slow listing of one directory doesn't hold up checks of another
+    directory, and that concurrent checks of the same directory list it once."""
+    listing = threading.Event()
+    release = threading.Event()
+    mock_walk_blobs = azure_blob_storage_interface.client.walk_blobs
+
+    def walk_blobs(name_starts_with, delimiter):
+        if name_starts_with == "slow/":
+            listing.set()
+            assert release.wait(timeout=5)
+            return mock_walk(["slow/blob"])
+        return []
+
+    mock_walk_blobs.side_effect = walk_blobs
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                azure_blob_storage_interface.exists("slow/blob")
+            )
+        )
+        for _ in range(2)
+    ]
+
+    threads[0].start()
+    assert listing.wait(timeout=5)
+    threads[1].start()
+
+    assert azure_blob_storage_interface.exists("fast/blob") is False
+
+    release.set()
+
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == [True, True]
+    assert mock_walk_blobs.call_count == 2
 
 
 def test_upload(azure_blob_storage_interface):
     """Test that a file can be uploaded to the azure blob storage container."""
-    file = MagicMock()
+    file = io.BytesIO(b"x" * 100)
     file_size = 100
     dst = "uploaded_file"
     mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
@@ -77,7 +184,7 @@ def test_upload(azure_blob_storage_interface):
 
 def test_upload_progress(azure_blob_storage_interface):
     """Test that a file can be uploaded to the azure blob storage container with a progress bar."""
-    file = MagicMock()
+    file = io.BytesIO(b"x" * 100)
     file_size = 100
     dst = "uploaded_file"
     mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
@@ -108,6 +215,254 @@ def test_upload_progress(azure_blob_storage_interface):
     )
 
 
+def test_upload_mapped_file(azure_blob_storage_interface, tmp_path):
+    """Test that a file on disk is uploaded as memory mapped slices of the file."""
+    data = bytes(range(256)) * 4
+    path = tmp_path / "file"
+    path.write_bytes(data)
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+    staged = {}
+
+    def stage_block(block_id, data):
+        assert isinstance(data, memoryview)
+        staged[block_id] = bytes(data)
+
+    mock_blob_client.stage_block.side_effect = stage_block
+
+    with open(path, "rb") as file:
+        with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 300):
+            azure_blob_storage_interface.upload(file, len(data), "uploaded_file")
+
+    block_ids = mock_blob_client.commit_block_list.call_args[0][0]
+
+    assert len(block_ids) == 4
+    assert b"".join(staged[block_id] for block_id in block_ids) == data
+
+
+def test_upload_unmapped_file(azure_blob_storage_interface):
+    """Test that a file that isn't on disk is uploaded by reading each chunk into a
+    pooled buffer."""
+    data = b"abcdefghij" * 10
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+    staged = {}
+
+    def stage_block(block_id, data):
+        assert isinstance(data, memoryview)
+        staged[block_id] = bytes(data)
+
+    mock_blob_client.stage_block.side_effect = stage_block
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 25):
+        azure_blob_storage_interface.upload(
+            io.BytesIO(data), len(data), "uploaded_file"
+        )
+
+    block_ids = mock_blob_client.commit_block_list.call_args[0][0]
+
+    assert b"".join(staged[block_id] for block_id in block_ids) == data
+
+
+def test_upload_chunk_read_error(azure_blob_storage_interface):
+    """Test that the pooled buffer of a chunk is given back to the pool when the
+    chunk can't be read."""
+    buffers = BufferPool(buffer_size=25, max_buffers=1, preallocate=1)
+    file = MagicMock(spec=["seek", "readinto"])
+    file.readinto.side_effect = OSError("read failed")
+
+    for _ in range(3):
+        with pytest.raises(OSError):
+            azure_blob_storage_interface.upload_chunk(
+                MagicMock(), file, 0, 25, "chunk", 25, None, buffers=buffers
+            )
+
+    assert buffers.hits == 3
+    assert buffers.misses == 0
+
+
+def test_upload_chunk_error(azure_blob_storage_interface, tmp_path):
+    """Test that a file is never committed when a chunk fails to upload."""
+    path = tmp_path / "file"
+    path.write_bytes(b"x" * 100)
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+    mock_blob_client.stage_block.side_effect = RuntimeError("stage failed")
+
+    with open(path, "rb") as file:
+        with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 25):
+            with pytest.raises(RuntimeError):
+                azure_blob_storage_interface.upload(file, 100, "uploaded_file")
+
+    mock_blob_client.commit_block_list.assert_not_called()
+
+
+def test_upload_chunk_retry(azure_blob_storage_interface):
+    """Test that a chunk failing with a transient error is retried, and the file is
+    still committed."""
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+    mock_blob_client.stage_block.side_effect = [
+        ServiceRequestError("connection reset"),
+        None,
+    ]
+
+    with patch("backup.settings.BACKUP_UPLOAD_RETRY_DELAY", 0):
+        azure_blob_storage_interface.upload(io.BytesIO(b"x" * 10), 10, "uploaded_file")
+
+    assert mock_blob_client.stage_block.call_count == 2
+    mock_blob_client.commit_block_list.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (ServiceRequestError("connection reset"), True),
+        (HttpResponseError(response=MagicMock(status_code=503)), True),
+        (HttpResponseError(response=MagicMock(status_code=403)), False),
+        (ValueError("invalid"), False),
+    ],
+)
+def test_is_retryable(azure_blob_storage_interface, error, expected):
+    """Test that only transient errors are retried."""
+    assert azure_blob_storage_interface.is_retryable(error) is expected
+
+
+def test_upload_hedged(azure_blob_storage_interface):
+    """Test that a block that stalls is staged again with a new client."""
+    stalled = threading.Event()
+    azure_blob_storage_interface.config.hedge_percentile = 50
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+    mock_blob_client.blob_name = "uploaded_file"
+    mock_hedge_client = MagicMock()
+    mock_hedge_blob_client = (
+        mock_hedge_client.__enter__.return_value.get_blob_client.return_value
+    )
+
+    def stage_block(block_id, data):
+        if block_id == "0000000000000090":
+            stalled.wait()
+
+    mock_blob_client.stage_block.side_effect = stage_block
+
+    try:
+        with patch.object(
+            azure_blob_storage_interface, "get_client", return_value=mock_hedge_client
+        ):
+            with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 10):
+                with patch("backup.settings.BACKUP_UPLOAD_CONCURRENCY", 1):
+                    azure_blob_storage_interface.upload(
+                        io.BytesIO(b"x" * 100), 100, "uploaded_file"
+                    )
+    finally:
+        stalled.set()
+
+    mock_hedge_client.__enter__.return_value.get_blob_client.assert_called_with(
+        "uploaded_file"
+    )
+    assert "0000000000000090" in [
+        call.kwargs["block_id"]
+        for call in mock_hedge_blob_client.stage_block.call_args_list
+    ]
+    mock_blob_client.commit_block_list.assert_called_once()
+
+
+def test_upload_single_put(azure_blob_storage_interface):
+    """Test that a small file is uploaded with a single request."""
+    azure_blob_storage_interface.config.max_single_put_size = 100
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 25):
+        azure_blob_storage_interface.upload(
+            io.BytesIO(b"x" * 100), 100, "uploaded_file"
+        )
+
+    mock_blob_client.upload_blob.assert_called_once_with(
+        b"x" * 100, length=100, overwrite=True
+    )
+    mock_blob_client.stage_block.assert_not_called()
+    mock_blob_client.commit_block_list.assert_not_called()
+
+
+def test_upload_stream_single_put(azure_blob_storage_interface):
+    """Test that a small stream that fits in a single chunk is uploaded with a
+    single request."""
+    azure_blob_storage_interface.config.max_single_put_size = 100
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 25):
+        azure_blob_storage_interface.upload_stream(
+            io.BytesIO(b"x" * 10), "uploaded_stream"
+        )
+        azure_blob_storage_interface.upload_stream(
+            io.BytesIO(b"x" * 60), "uploaded_stream"
+        )
+
+    mock_blob_client.upload_blob.assert_called_once_with(
+        b"x" * 10, length=10, overwrite=True
+    )
+    assert mock_blob_client.stage_block.call_count == 3
+    mock_blob_client.commit_block_list.assert_called_once()
+
+
+def test_upload_stream(azure_blob_storage_interface):
+    """Test that a stream of unknown size can be uploaded to the azure blob storage
+    container, and is committed only once the stream is exhausted."""
+    stream = io.BytesIO(b"x" * 60)
+    dst = "uploaded_stream"
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 25):
+        azure_blob_storage_interface.upload_stream(stream, dst)
+
+    assert mock_blob_client.stage_block.call_count == 3
+    mock_blob_client.commit_block_list.assert_called_once_with(
+        ["0000000000000000", "0000000000000025", "0000000000000050"]
+    )
+
+
+def test_upload_stream_iterable(azure_blob_storage_interface):
+    """Test that an iterable of chunks is staged concurrently, and committed in order."""
+    chunks = [bytes([i]) * size for i, size in enumerate([10, 40, 3, 77, 1])]
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+    staged = {}
+
+    def stage_block(block_id, data):
+        staged[block_id] = bytes(data)
+
+    mock_blob_client.stage_block.side_effect = stage_block
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 16):
+        with patch("backup.settings.BACKUP_UPLOAD_CONCURRENCY", 4):
+            azure_blob_storage_interface.upload_stream(iter(chunks), "uploaded_stream")
+
+    block_ids = mock_blob_client.commit_block_list.call_args[0][0]
+
+    assert len(block_ids) == 9
+    assert b"".join(staged[block_id] for block_id in block_ids) == b"".join(chunks)
+
+
+def test_upload_stream_error(azure_blob_storage_interface):
+    """Test that a stream that fails while being read is never committed."""
+    stream = MagicMock(spec=["read"])
+    stream.read.side_effect = [b"x" * 25, RuntimeError("stream failed")]
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 25):
+        with pytest.raises(RuntimeError):
+            azure_blob_storage_interface.upload_stream(stream, "uploaded_stream")
+
+    mock_blob_client.commit_block_list.assert_not_called()
+
+
+def test_download(azure_blob_storage_interface):
+    """Test that a blob can be downloaded from the azure blob storage container."""
+    path = "download_blob"
+    file = io.BytesIO()
+    mock_blob_client = azure_blob_storage_interface.client.get_blob_client.return_value
+
+    azure_blob_storage_interface.download(path, file)
+
+    azure_blob_storage_interface.client.get_blob_client.assert_called_once_with(path)
+    mock_blob_client.download_blob.return_value.readinto.assert_called_once_with(file)
+
+
 def test_delete(azure_blob_storage_interface):
     """Test that a blob can be deleted from the azure blob storage container."""
     path = "delete_blob"
@@ -129,15 +484,124 @@ def test_list(azure_blob_storage_interface):
         "path_to_list/blob2",
         "path_to_list/blob3",
     ]:
-        path_mock = MagicMock(spec_set=["name"])
+        path_mock = MagicMock(spec_set=["name", "size"])
         path_mock.name = name
+        path_mock.size = 1024
         path_mocks.append(path_mock)
 
-    azure_blob_storage_interface.client.list_blobs.return_value = path_mocks
+    azure_blob_storage_interface.client.walk_blobs.return_value = path_mocks
 
     result = azure_blob_storage_interface.list(path)
 
     assert result == ["path_to_list/blob3", "path_to_list/blob2", "path_to_list/blob1"]
-    azure_blob_storage_interface.client.list_blobs.assert_called_once_with(
-        name_starts_with=path
+    azure_blob_storage_interface.client.walk_blobs.assert_called_once_with(
+        name_starts_with="path_to_list/", delimiter="/"
     )
+
+
+def test_list_directory_markers(azure_blob_storage_interface):
+    """Test that nested directories, and the empty marker blobs of directories, are
+    never listed."""
+    path_mocks = []
+
+    for name, size in [
+        ("path_to_list/blob1", 1024),
+        ("path_to_list/directory", 0),
+        ("path_to_list/directory/", None),
+        ("path_to_list/blob2.part0001", 1024),
+    ]:
+        path_mock = MagicMock(spec_set=["name", "size"])
+        path_mock.name = name
+        path_mock.size = size
+        path_mocks.append(path_mock)
+
+    azure_blob_storage_interface.client.walk_blobs.return_value = path_mocks
+
+    result = azure_blob_storage_interface.list("path_to_list")
+
+    assert result == ["path_to_list/blob1"]
+
+
+def mock_delete_blobs(statuses=None):
+    """Create a `delete_blobs` side effect that records every batch, and responds with
+    the status given for each blob, 202 by default."""
+    batches = []
+
+    def delete_blobs(*names, **kwargs):
+        batches.append(names)
+
+        for name in names:
+            yield MagicMock(status_code=(statuses or {}).get(name, 202))
+
+    return batches, delete_blobs
+
+
+def test_retention(azure_blob_storage_interface):
+    """Test that retention deletes every backup but the most recent backups in a
+    single batch."""
+    batches, delete_blobs = mock_delete_blobs()
+    path_mocks = []
+
+    for name in [
+        "path/backup_20240103.tar.gz",
+        "path/backup_20240101.tar.gz",
+        "path/backup_20240104.tar.gz",
+        "path/backup_20240102.tar.gz",
+    ]:
+        path_mock = MagicMock(spec_set=["name", "size"])
+        path_mock.name = name
+        path_mock.size = 1024
+        path_mocks.append(path_mock)
+
+    azure_blob_storage_interface.client.walk_blobs.return_value = path_mocks
+    azure_blob_storage_interface.client.delete_blobs.side_effect = delete_blobs
+
+    azure_blob_storage_interface.retention("path", MagicMock(count=2))
+
+    assert batches == [
+        ("path/backup_20240101.tar.gz", "path/backup_20240102.tar.gz"),
+    ]
+    azure_blob_storage_interface.client.get_blob_client.assert_not_called()
+
+
+def test_delete_backups_batches(azure_blob_storage_interface):
+    """Test that backups are deleted in batches, and that volume set manifests are
+    deleted once their volumes are gone."""
+    batches, delete_blobs = mock_delete_blobs()
+
+    azure_blob_storage_interface.max_delete_batch = 2
+    azure_blob_storage_interface.client.delete_blobs.side_effect = delete_blobs
+    azure_blob_storage_interface.download_volumes = MagicMock(
+        return_value=["path/b.part0001", "path/b.part0002"]
+    )
+
+    azure_blob_storage_interface.delete_backups(
+        iter(["path/a", "path/b.volumes", "path/c"])
+    )
+
+    assert sorted(batches) == [
+        ("path/a", "path/b.part0001"),
+        ("path/b.part0002", "path/c"),
+        ("path/b.volumes",),
+    ]
+    assert batches[-1] == ("path/b.volumes",)
+
+
+def test_delete_backups_partial_failure(azure_blob_storage_interface):
+    """Test that every blob is still deleted when some blobs fail, that the failures
+    are reported, and that the manifest of a partially deleted volume set is kept."""
+    batches, delete_blobs = mock_delete_blobs(
+        statuses={"path/a": 404, "path/b.part0002": 403}
+    )
+
+    azure_blob_storage_interface.client.delete_blobs.side_effect = delete_blobs
+    azure_blob_storage_interface.download_volumes = MagicMock(
+        return_value=["path/b.part0001", "path/b.part0002"]
+    )
+
+    with pytest.raises(RuntimeError, match="failed to delete 1 of 4 blobs"):
+        azure_blob_storage_interface.delete_backups(
+            ["path/a", "path/b.volumes", "path/c"]
+        )
+
+    assert batches == [("path/a", "path/b.part0001", "path/b.part0002", "path/c")]
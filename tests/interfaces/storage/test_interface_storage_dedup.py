@@ -0,0 +1,355 @@
+import io
+import os
+import random
+from unittest.mock import patch
+
+import pytest
+
+from backup.config.models import RetentionConfig
+
+# deduplication requires numpy, which is only installed with the dedup extra.
+
+pytest.importorskip("numpy")
+
+from backup.interfaces.storage.dedup import (
+    GEAR,
+    Chunker,
+    DeduplicatingStorageInterface,
+    LimitedReader,
+)
+
+
+@pytest.fixture
+def dedup_storage_interface(tmp_path):
+    """Fixture for creating a DeduplicatingStorageInterface instance wrapping
+    a LocalStorageInterface."""
+    interface = DeduplicatingStorageInterface(
+        config={
+            "interface": "backup.interfaces.storage.dedup.DeduplicatingStorageInterface",
+            "storage": {
+                "interface": "backup.interfaces.storage.local.LocalStorageInterface",
+            },
+            "chunk_path": os.path.join(tmp_path, "chunks"),
+            "chunk_min_size": 256,
+            "chunk_avg_size": 1024,
+            "chunk_max_size": 4096,
+        }
+    )
+
+    return interface
+
+
+def _random_bytes(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+def _chunk_files(tmp_path):
+    return [
+        name
+        for _, _, names in os.walk(os.path.join(tmp_path, "chunks"))
+        for name in names
+        if name != "index.json.gz"
+    ]
+
+
+def test_chunker_invalid_sizes():
+    """Test that the chunker rejects invalid chunk sizes."""
+    with pytest.raises(ValueError):
+        Chunker(min_size=256, avg_size=1000, max_size=4096)
+    with pytest.raises(ValueError):
+        Chunker(min_size=2048, avg_size=1024, max_size=4096)
+
+
+def test_chunker_boundaries_are_content_defined():
+    """Test that inserting data only changes the chunks around the insertion."""
+    chunker = Chunker(min_size=256, avg_size=1024, max_size=4096)
+    data = _random_bytes(64 * 1024)
+    edited = data[:30000] + b"inserted" + data[30000:]
+
+    chunks = list(chunker.chunks(io.BytesIO(data)))
+    edited_chunks = list(chunker.chunks(io.BytesIO(edited)))
+
+    assert b"".join(chunks) == data
+    assert b"".join(edited_chunks) == edited
+    assert all(256 < len(chunk) <= 4096 for chunk in chunks[:-1])
+    assert len(set(chunks) - set(edited_chunks)) <= 2
+
+
+def _reference_cut(chunker, data, start, end):
+    """Find the end of a chunk by hashing one byte at a time, the way chunks were
+    always cut, which the bulk hashing of the chunker must match exactly."""
+    size = end - start
+
+    if size <= chunker.min_size:
+        return end
+
+    size = min(size, chunker.max_size)
+    normal = min(size, chunker.avg_size)
+    digest = 0
+    position = start + chunker.min_size
+
+    for mask, stop in (
+        (chunker.mask_strict, start + normal),
+        (chunker.mask_loose, start + size),
+    ):
+        for byte in data[position:stop]:
+            digest = ((digest << 1) + GEAR[byte]) & 0xFFFFFFFFFFFFFFFF
+            position += 1
+
+            if not digest & mask:
+                return position
+
+    return start + size
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        _random_bytes(200 * 1024, seed=1),
+        bytes(64 * 1024),
+        bytes(random.Random(2).choice(b"ab") for _ in range(64 * 1024)),
+    ],
+)
+def test_chunker_matches_reference(data):
+    """Test that chunk boundaries match the boundaries of the byte at a time gear
+    hash, so chunks stored by earlier releases are still deduplicated."""
+    chunker = Chunker(min_size=256, avg_size=1024, max_size=4096)
+    expected = []
+    start = 0
+
+    while start < len(data):
+        end = _reference_cut(chunker, data, start, len(data))
+        expected.append(data[start:end])
+        start = end
+
+    assert list(chunker.chunks(io.BytesIO(data))) == expected
+
+
+class _CountingTable(list):
+    """A gear table that counts the bytes hashed one at a time."""
+
+    lookups = 0
+
+    def __getitem__(self, index):
+        self.lookups += 1
+
+        return super().__getitem__(index)
+
+
+def test_chunker_hashes_in_bulk():
+    """Test that chunking isn't done a byte at a time, only the first 63 bytes after
+    the minimum size of every chunk are hashed one at a time."""
+    chunker = Chunker(min_size=4 * 1024, avg_size=16 * 1024, max_size=64 * 1024)
+    data = _random_bytes(4 * 1024 * 1024)
+    table = _CountingTable(GEAR)
+
+    with patch("backup.interfaces.storage.dedup.GEAR", table):
+        chunks = list(chunker.chunks(io.BytesIO(data)))
+
+    assert b"".join(chunks) == data
+    assert 0 < table.lookups <= 63 * len(chunks)
+
+
+def test_chunker_empty_stream():
+    """Test that an empty stream produces no chunks."""
+    chunker = Chunker(min_size=256, avg_size=1024, max_size=4096)
+
+    assert list(chunker.chunks(io.BytesIO())) == []
+
+
+def test_limited_reader():
+    """Test that the limited reader never reads past its size."""
+    reader = LimitedReader(io.BytesIO(b"0123456789"), 4)
+
+    assert reader.read(3) == b"012"
+    assert reader.read() == b"3"
+    assert reader.read() == b""
+
+
+def test_upload_download(dedup_storage_interface, tmp_path):
+    """Test that an uploaded file can be downloaded from its recipe."""
+    data = _random_bytes(32 * 1024)
+    dst = os.path.join(tmp_path, "backup.tar")
+
+    dedup_storage_interface.upload(io.BytesIO(data + b"ignored"), len(data), dst)
+
+    file = io.BytesIO()
+    dedup_storage_interface.download(dst, file)
+
+    assert file.getvalue() == data
+    assert dedup_storage_interface.exists(dst)
+
+
+def test_upload_stream_deduplicates(dedup_storage_interface, tmp_path):
+    """Test that chunks shared between uploads are only stored once."""
+    data = _random_bytes(64 * 1024)
+    edited = data[:30000] + b"inserted" + data[30000:]
+
+    dedup_storage_interface.upload_stream(
+        io.BytesIO(data), os.path.join(tmp_path, "first.tar")
+    )
+    first_chunks = len(_chunk_files(tmp_path))
+
+    dedup_storage_interface.upload_stream(
+        io.BytesIO(edited), os.path.join(tmp_path, "second.tar")
+    )
+    second_chunks = len(_chunk_files(tmp_path))
+
+    assert 0 < second_chunks - first_chunks <= 2
+
+    file = io.BytesIO()
+    dedup_storage_interface.download(os.path.join(tmp_path, "second.tar"), file)
+
+    assert file.getvalue() == edited
+
+
+def test_delete_collects_unreferenced_chunks(dedup_storage_interface, tmp_path):
+    """Test that deleting a recipe only deletes the chunks no longer referenced."""
+    data = _random_bytes(64 * 1024)
+    edited = data[:30000] + b"inserted" + data[30000:]
+
+    dedup_storage_interface.upload_stream(
+        io.BytesIO(data), os.path.join(tmp_path, "first.tar")
+    )
+    first_chunks = len(_chunk_files(tmp_path))
+
+    dedup_storage_interface.upload_stream(
+        io.BytesIO(edited), os.path.join(tmp_path, "second.tar")
+    )
+    dedup_storage_interface.delete(os.path.join(tmp_path, "first.tar"))
+
+    assert not os.path.exists(os.path.join(tmp_path, "first.tar"))
+    assert 0 < len(_chunk_files(tmp_path)) <= first_chunks + 2
+
+    file = io.BytesIO()
+    dedup_storage_interface.download(os.path.join(tmp_path, "second.tar"), file)
+
+    assert file.getvalue() == edited
+
+    dedup_storage_interface.delete(os.path.join(tmp_path, "second.tar"))
+
+    assert _chunk_files(tmp_path) == []
+
+
+class _InterleavedReader(io.BytesIO):
+    """A reader that calls a function once, part way through the stream."""
+
+    def __init__(self, data, after, callback):
+        super().__init__(data)
+        self.after = after
+        self.callback = callback
+
+    def read(self, size=-1):
+        if self.callback and self.tell() >= self.after:
+            callback, self.callback = self.callback, None
+            callback()
+
+        return super().read(size)
+
+
+def test_upload_stream_interleaved_delete(dedup_storage_interface, tmp_path):
+    """Test that deleting a recipe while another stream reuses its chunks never
+    collects the chunks the stream has already skipped."""
+    data = _random_bytes(64 * 1024)
+    first = os.path.join(tmp_path, "first.tar")
+    second = os.path.join(tmp_path, "second.tar")
+
+    dedup_storage_interface.upload_stream(io.BytesIO(data), first)
+    dedup_storage_interface.upload_stream(
+        _InterleavedReader(
+            data,
+            after=32 * 1024,
+            callback=lambda: dedup_storage_interface.delete(first),
+        ),
+        second,
+    )
+
+    file = io.BytesIO()
+    dedup_storage_interface.download(second, file)
+
+    assert file.getvalue() == data
+
+    dedup_storage_interface.delete(second)
+
+    assert _chunk_files(tmp_path) == []
+
+
+def test_upload_stream_failure_releases_chunks(dedup_storage_interface, tmp_path):
+    """Test that the chunks referenced by a failed upload are released again."""
+    data = _random_bytes(64 * 1024)
+    first = os.path.join(tmp_path, "first.tar")
+
+    def fail():
+        raise OSError("stream failed")
+
+    dedup_storage_interface.upload_stream(io.BytesIO(data), first)
+
+    with pytest.raises(OSError):
+        dedup_storage_interface.upload_stream(
+            _InterleavedReader(data, after=32 * 1024, callback=fail),
+            os.path.join(tmp_path, "second.tar"),
+        )
+
+    dedup_storage_interface.delete(first)
+
+    assert _chunk_files(tmp_path) == []
+
+
+def test_index_is_persisted(dedup_storage_interface, tmp_path):
+    """Test that a new interface instance picks up the stored chunk index."""
+    data = _random_bytes(16 * 1024)
+    dst = os.path.join(tmp_path, "backup.tar")
+
+    dedup_storage_interface.upload_stream(io.BytesIO(data), dst)
+
+    interface = DeduplicatingStorageInterface(
+        config=dedup_storage_interface.config.model_dump(),
+    )
+    interface.delete(dst)
+
+    assert _chunk_files(tmp_path) == []
+
+
+def test_retention(dedup_storage_interface, tmp_path):
+    """Test that retention deletes the oldest recipes along with their chunks."""
+    backups = os.path.join(tmp_path, "backups")
+    os.makedirs(backups)
+
+    for i in range(3):
+        dst = os.path.join(backups, "backup_%s.tar" % i)
+        dedup_storage_interface.upload_stream(io.BytesIO(_random_bytes(8192, i)), dst)
+        os.utime(dst, (i, i))
+
+    dedup_storage_interface.retention(backups, RetentionConfig(count=1))
+
+    assert os.listdir(backups) == ["backup_2.tar"]
+
+    file = io.BytesIO()
+    dedup_storage_interface.download(os.path.join(backups, "backup_2.tar"), file)
+
+    assert file.getvalue() == _random_bytes(8192, 2)
+
+
+def test_retention_saves_index_once(dedup_storage_interface, tmp_path):
+    """Test that retention garbage collects chunks, and stores the index, once for
+    all of the recipes it deletes."""
+    backups = os.path.join(tmp_path, "backups")
+    os.makedirs(backups)
+
+    for i in range(4):
+        dst = os.path.join(backups, "backup_%s.tar" % i)
+        dedup_storage_interface.upload_stream(io.BytesIO(_random_bytes(8192, i)), dst)
+
+    with patch.object(
+        dedup_storage_interface,
+        "_save_index",
+        wraps=dedup_storage_interface._save_index,
+    ) as mock_save_index:
+        dedup_storage_interface.retention(backups, RetentionConfig(count=1))
+
+    assert os.listdir(backups) == ["backup_3.tar"]
+    assert mock_save_index.call_count == 1
+
+    dedup_storage_interface.delete(os.path.join(backups, "backup_3.tar"))
+
+    assert _chunk_files(tmp_path) == []
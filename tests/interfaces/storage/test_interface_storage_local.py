@@ -1,3 +1,5 @@
+import errno
+import io
 import os
 from unittest.mock import patch
 
@@ -95,6 +97,59 @@ def test_upload_progress(local_storage_interface, tmp_path):
         assert file.read() == file_data
 
 
+def test_upload_stream(local_storage_interface, tmp_path):
+    """Test that a stream of unknown size can be uploaded to the local filesystem."""
+    file_data = b"test data" * 10
+    file_dst = os.path.join(tmp_path, "uploaded_file")
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 25):
+        local_storage_interface.upload_stream(io.BytesIO(file_data), file_dst)
+
+    with open(file_dst, "rb") as file:
+        assert file.read() == file_data
+
+
+def test_upload_stream_iterable(local_storage_interface, tmp_path):
+    """Test that an iterable of chunks is uploaded concurrently in order."""
+    chunks = [os.urandom(size) for size in [10, 40, 3, 77, 1]]
+    file_dst = os.path.join(tmp_path, "uploaded_file")
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 16):
+        with patch("backup.settings.BACKUP_UPLOAD_CONCURRENCY", 4):
+            local_storage_interface.upload_stream((chunk for chunk in chunks), file_dst)
+
+    with open(file_dst, "rb") as file:
+        assert file.read() == b"".join(chunks)
+
+
+def test_upload_stream_error(local_storage_interface, tmp_path):
+    """Test that a stream that fails while being read leaves no partial file."""
+    file_dst = os.path.join(tmp_path, "uploaded_file")
+
+    def chunks():
+        yield b"x" * 50
+        raise RuntimeError("stream failed")
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 16):
+        with pytest.raises(RuntimeError):
+            local_storage_interface.upload_stream(chunks(), file_dst)
+
+    assert not os.path.exists(file_dst)
+
+
+def test_download(local_storage_interface, tmp_path):
+    """Test that a file can be downloaded from the local filesystem."""
+    path = os.path.join(tmp_path, "test_file")
+
+    with open(path, "wb") as file:
+        file.write(b"test data")
+
+    file = io.BytesIO()
+    local_storage_interface.download(path, file)
+
+    assert file.getvalue() == b"test data"
+
+
 def test_delete(local_storage_interface, tmp_path):
     """Test that a file can be deleted from the local filesystem."""
     path = os.path.join(tmp_path, "test_file")
@@ -122,3 +177,63 @@ def test_list(local_storage_interface, tmp_path):
             file.write("test data")
 
     assert local_storage_interface.list(tmp_path) == list(reversed(file_paths))
+
+
+@pytest.mark.parametrize(
+    "unsupported",
+    [[], ["copy_file_range"], ["copy_file_range", "sendfile"]],
+)
+def test_upload_zero_copy(local_storage_interface, tmp_path, unsupported):
+    """Test that files on disk are copied in concurrent chunks with each of the
+    copy methods, falling back when a method isn't supported."""
+    file_path = os.path.join(tmp_path, "test_file")
+    file_data = os.urandom(1000)
+    file_dst = os.path.join(tmp_path, "uploaded_file")
+
+    with open(file_path, "wb") as file:
+        file.write(file_data)
+
+    def unsupported_method(*args, **kwargs):
+        raise OSError(errno.EXDEV, "unsupported")
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 64):
+        with patch("backup.settings.BACKUP_UPLOAD_CONCURRENCY", 4):
+            with patch("os.pread", wraps=os.pread) as pread_mock:
+                for method in unsupported:
+                    patch("os.%s" % method, unsupported_method).start()
+
+                try:
+                    with open(file_path, "rb") as file:
+                        local_storage_interface.upload(file, len(file_data), file_dst)
+                finally:
+                    patch.stopall()
+
+    with open(file_dst, "rb") as file:
+        assert file.read() == file_data
+
+    assert pread_mock.called == (len(unsupported) == 2)
+
+
+def test_upload_file_object(local_storage_interface, tmp_path):
+    """Test that file-like objects without a file descriptor are uploaded."""
+    file_data = os.urandom(1000)
+    file_dst = os.path.join(tmp_path, "uploaded_file")
+
+    with patch("backup.settings.BACKUP_UPLOAD_CHUNK_SIZE", 64):
+        with patch("backup.settings.BACKUP_UPLOAD_CONCURRENCY", 4):
+            local_storage_interface.upload(io.BytesIO(file_data), 1000, file_dst)
+
+    with open(file_dst, "rb") as file:
+        assert file.read() == file_data
+
+
+def test_upload_truncated_source(local_storage_interface, tmp_path):
+    """Test that an error is raised when the file is smaller than its given size."""
+    file_path = os.path.join(tmp_path, "test_file")
+
+    with open(file_path, "wb") as file:
+        file.write(b"test data")
+
+    with pytest.raises(OSError):
+        with open(file_path, "rb") as file:
+            local_storage_interface.upload(file, 100, os.path.join(tmp_path, "dst"))
@@ -2,7 +2,11 @@ import pydantic
 import pytest
 
 from backup.config.models import BaseInterfaceConfig, StorageInterfaceConfig
-from tests.fixtures.interfaces import MockBackupInterface, MockStorageInterface
+from tests.fixtures.interfaces import (
+    MockBackupInterface,
+    MockDirectoryBackupInterface,
+    MockStorageInterface,
+)
 
 
 def test_interface_backup_no_storage():
@@ -38,3 +42,43 @@ def test_interface_backup_with_storage():
         storage=storage,
     )
     assert interface.storage == storage
+
+
+def _directory_interface(names, concurrency):
+    return MockDirectoryBackupInterface(
+        {
+            "interface": "tests.fixtures.interfaces.MockDirectoryBackupInterface",
+            "concurrency": concurrency,
+            "directories": [
+                {"src": "/%s" % name, "dest": "backups", "name": name} for name in names
+            ],
+        },
+        storage=None,
+    )
+
+
+def test_interface_backup_directories_concurrent():
+    """Test that directories are backed up on a pool of worker threads."""
+    names = ["dir%s" % i for i in range(8)]
+    interface = _directory_interface(names, concurrency=4)
+
+    interface.backup()
+
+    assert sorted(interface.backed_up) == names
+    assert all(name.startswith("backup-directory") for name in interface.threads)
+
+
+def test_interface_backup_directories_errors_isolated():
+    """Test that a directory failing doesn't stop the other directories from being
+    backed up, and that the failure is raised once all directories are done."""
+    for concurrency in [1, 3]:
+        interface = _directory_interface(
+            ["dir0", "fail1", "dir2", "fail3", "dir4"], concurrency=concurrency
+        )
+
+        with pytest.raises(RuntimeError) as exc_info:
+            interface.backup()
+
+        assert sorted(interface.backed_up) == ["dir0", "dir2", "dir4"]
+        assert "2 of 5 directories" in str(exc_info.value)
+        assert isinstance(exc_info.value.__cause__, ValueError)
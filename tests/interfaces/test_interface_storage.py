@@ -50,3 +50,28 @@ def test_interface_storage_default_retention(mock_storage, mock_retention_config
 
     mock_storage.delete.assert_any_call("backup4")
     mock_storage.delete.assert_any_call("backup5")
+
+
+def test_interface_storage_walk_retention(mock_storage, mock_retention_config):
+    """Test that retention keeps the most recent backups of an unsorted walk."""
+    mock_storage.walk = MagicMock()
+    mock_storage.walk.return_value = iter(
+        [
+            "backup_20240102.tar.gz",
+            "backup_20240105.tar.gz",
+            "backup_20240101.tar.gz",
+            "backup_20240104.tar.zst",
+            "backup_20240103.tar.gz",
+        ]
+    )
+    mock_storage.retention(
+        path="/test/backup",
+        config=mock_retention_config,
+    )
+
+    mock_storage.list.assert_not_called()
+
+    assert [c.args[0] for c in mock_storage.delete.call_args_list] == [
+        "backup_20240101.tar.gz",
+        "backup_20240102.tar.gz",
+    ]
@@ -31,12 +31,17 @@ def test_get_client(azure_key_vault_interface):
         "backup.interfaces.vault.azure.DefaultAzureCredential"
     ) as mock_credential:
         with patch("backup.interfaces.vault.azure.SecretClient") as mock_secret_client:
-            client = azure_key_vault_interface.get_client()
+            with patch(
+                "backup.interfaces.vault.azure.get_transport"
+            ) as mock_get_transport:
+                client = azure_key_vault_interface.get_client()
 
     mock_credential.assert_called_once()
+    mock_get_transport.assert_called_once_with("https://test.vault.azure.net/")
     mock_secret_client.assert_called_once_with(
         vault_url="https://test.vault.azure.net/",
         credential=mock_credential.return_value,
+        transport=mock_get_transport.return_value,
     )
 
     assert client == mock_secret_client.return_value
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from backup.streams import IterableReader, Pipe, as_reader, pipeline
+
+
+def test_pipe_read_write():
+    """Test that data written to a pipe can be read back in order."""
+    pipe = Pipe(capacity=1024)
+    pipe.write(b"hello ")
+    pipe.write(b"world")
+    pipe.close()
+
+    assert pipe.read(3) == b"hel"
+    assert pipe.read() == b"lo world"
+    assert pipe.read() == b""
+
+
+def test_pipe_readinto():
+    """Test that data written to a pipe can be read straight into a buffer."""
+    pipe = Pipe(capacity=1024)
+    pipe.write(b"hello ")
+    pipe.write(b"world")
+    pipe.close()
+
+    buffer = bytearray(8)
+
+    assert pipe.readinto(buffer) == 8
+    assert buffer == b"hello wo"
+    assert pipe.readinto(buffer) == 3
+    assert buffer[:3] == b"rld"
+    assert pipe.readinto(buffer) == 0
+
+
+def test_iterable_reader():
+    """Test that an iterable of bytes objects can be read as a file."""
+    reader = IterableReader(iter([b"hello", b"", b" ", b"world"]))
+    buffer = bytearray(4)
+
+    assert reader.read(3) == b"hel"
+    assert reader.readinto(buffer) == 4
+    assert buffer == b"lo w"
+    assert reader.read() == b"orld"
+    assert reader.read() == b""
+
+
+def test_as_reader():
+    """Test that file-like objects are returned as is, and iterables are wrapped."""
+    pipe = Pipe()
+
+    assert as_reader(pipe) is pipe
+    assert isinstance(as_reader([b"data"]), IterableReader)
+
+
+def test_pipe_bounded_capacity():
+    """Test that writes block while the pipe is at capacity."""
+    pipe = Pipe(capacity=4)
+    pipe.write(b"1234")
+
+    written = threading.Event()
+
+    def write():
+        pipe.write(b"5678")
+        written.set()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+
+    assert not written.wait(timeout=0.1)
+    assert pipe.read(4) == b"1234"
+    assert written.wait(timeout=1)
+
+    thread.join()
+
+
+def test_pipe_read_larger_than_capacity():
+    """Test that a read larger than the capacity of the pipe doesn't deadlock."""
+    result = pipeline(
+        producer=lambda pipe: [pipe.write(b"x" * 10) for _ in range(10)],
+        consumer=lambda pipe: pipe.read(100),
+        capacity=10,
+    )
+
+    assert result == b"x" * 100
+
+
+def test_pipe_abort():
+    """Test that writing to an aborted pipe raises an error."""
+    pipe = Pipe(capacity=4)
+    pipe.abort()
+
+    with pytest.raises(BrokenPipeError):
+        pipe.write(b"data")
+
+
+def test_pipeline_producer_error():
+    """Test that an error raised by the producer is raised from the pipeline."""
+
+    def producer(pipe):
+        pipe.write(b"data")
+        raise RuntimeError("producer failed")
+
+    def consumer(pipe):
+        while pipe.read(2):
+            pass
+
+    with pytest.raises(RuntimeError, match="producer failed"):
+        pipeline(producer=producer, consumer=consumer)
+
+
+def test_pipeline_consumer_error():
+    """Test that an error raised by the consumer unblocks the producer."""
+
+    def producer(pipe):
+        while True:
+            pipe.write(b"data")
+
+    def consumer(pipe):
+        pipe.read(4)
+        raise RuntimeError("consumer failed")
+
+    with pytest.raises(RuntimeError, match="consumer failed"):
+        pipeline(producer=producer, consumer=consumer, capacity=8)
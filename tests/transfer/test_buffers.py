@@ -0,0 +1,64 @@
+import io
+from unittest.mock import MagicMock
+
+from backup.transfer.buffers import BufferPool, readinto
+
+
+def test_buffer_pool_reuse():
+    """Test that released buffers are reused, and counted as hits."""
+    pool = BufferPool(buffer_size=16, max_buffers=2)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    allocated = [first.obj, second.obj]
+
+    assert len(first) == 16
+    assert (pool.hits, pool.misses) == (0, 2)
+
+    pool.release(first)
+    pool.release(second)
+    third = pool.acquire()
+
+    assert any(third.obj is data for data in allocated)
+    assert (pool.hits, pool.misses) == (1, 2)
+
+
+def test_buffer_pool_max_buffers():
+    """Test that buffers released past the maximum are freed."""
+    pool = BufferPool(buffer_size=16, max_buffers=1)
+    buffers = [pool.acquire() for _ in range(3)]
+
+    for buffer in buffers:
+        pool.release(buffer)
+
+    assert len(pool._buffers) == 1
+
+
+def test_buffer_pool_preallocate():
+    """Test that preallocated buffers are handed out as hits."""
+    pool = BufferPool(buffer_size=16, max_buffers=2, preallocate=2)
+
+    pool.acquire()
+    pool.acquire()
+    pool.acquire()
+
+    assert (pool.hits, pool.misses) == (2, 1)
+
+
+def test_readinto():
+    """Test that a buffer is filled from a file with readinto."""
+    buffer = memoryview(bytearray(8))
+
+    assert readinto(io.BytesIO(b"abcdefghij"), buffer) == 8
+    assert bytes(buffer) == b"abcdefgh"
+
+
+def test_readinto_short_reads():
+    """Test that short reads are repeated until the file is exhausted, for files
+    that only support read."""
+    file = MagicMock(spec=["read"])
+    file.read.side_effect = [b"abc", b"de", b""]
+    buffer = memoryview(bytearray(8))
+
+    assert readinto(file, buffer) == 5
+    assert bytes(buffer[:5]) == b"abcde"
@@ -0,0 +1,62 @@
+import pytest
+
+from backup.interfaces.storage.azure import AzureBlobStorageInterface
+from backup.transfer.chunks import CHUNK_ALIGNMENT, get_chunk_size
+
+MiB = 1024 * 1024
+GiB = 1024 * MiB
+
+
+def test_get_chunk_size_small_file():
+    """Test that small files are uploaded in chunks of the minimum size."""
+    assert get_chunk_size(
+        10 * MiB, workers=20, min_size=4 * MiB, max_size=200 * MiB
+    ) == (4 * MiB)
+
+
+def test_get_chunk_size_splits_across_workers():
+    """Test that files are split into several aligned chunks for every worker."""
+    chunk_size = get_chunk_size(
+        10 * GiB + 1, workers=20, min_size=4 * MiB, max_size=200 * MiB
+    )
+
+    assert 4 * MiB < chunk_size < 200 * MiB
+    assert chunk_size % CHUNK_ALIGNMENT == 0
+    assert -(-(10 * GiB + 1) // chunk_size) == 80
+
+
+def test_get_chunk_size_large_file():
+    """Test that large files are uploaded in chunks of the maximum size."""
+    assert get_chunk_size(1024 * GiB, workers=4, min_size=MiB, max_size=200 * MiB) == (
+        200 * MiB
+    )
+
+
+def test_get_chunk_size_max_chunks():
+    """Test that the chunk size grows past the maximum to stay within the backend
+    limit on the number of chunks."""
+    file_size = 20 * 1024 * GiB
+    chunk_size = get_chunk_size(
+        file_size,
+        workers=20,
+        min_size=4 * MiB,
+        max_size=200 * MiB,
+        max_chunks=AzureBlobStorageInterface.max_chunks,
+        max_chunk_size=AzureBlobStorageInterface.max_chunk_size,
+    )
+
+    assert chunk_size > 200 * MiB
+    assert -(-file_size // chunk_size) <= AzureBlobStorageInterface.max_chunks
+
+
+def test_get_chunk_size_max_chunk_size():
+    """Test that the maximum size is capped by the largest chunk the backend accepts."""
+    assert get_chunk_size(GiB, workers=1, max_size=GiB, max_chunk_size=100 * MiB) == (
+        100 * MiB
+    )
+
+
+def test_get_chunk_size_exceeds_limits():
+    """Test that files too large for the backend limits raise a value error."""
+    with pytest.raises(ValueError):
+        get_chunk_size(1001, workers=1, max_chunks=10, max_chunk_size=100)
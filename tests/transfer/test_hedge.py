@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from backup.transfer.hedge import LatencyTracker, call_with_hedge
+
+
+def test_latency_tracker():
+    """Test that the hedging delay is the percentile latency scaled to the size."""
+    tracker = LatencyTracker(percentile=90, min_samples=10)
+
+    for i in range(1, 10):
+        tracker.record(i, 100)
+
+    assert tracker.get_delay(100) is None
+
+    tracker.record(10, 100)
+
+    assert tracker.get_delay(100) == 10
+    assert tracker.get_delay(50) == 5
+
+
+def test_call_with_hedge_no_delay():
+    """Test that a call without a delay is never hedged."""
+    assert call_with_hedge(lambda: "primary", lambda: "hedge", delay=None) == "primary"
+
+
+def test_call_with_hedge_fast():
+    """Test that a fast call doesn't start the hedged call."""
+    hedged = []
+
+    assert call_with_hedge(lambda: "primary", lambda: hedged.append(1), 5) == "primary"
+    assert hedged == []
+
+
+def test_call_with_hedge_slow():
+    """Test that a slow call is hedged, and the hedged call's result is returned."""
+    stalled = threading.Event()
+
+    try:
+        assert call_with_hedge(stalled.wait, lambda: "hedge", delay=0.01) == "hedge"
+    finally:
+        stalled.set()
+
+
+def test_call_with_hedge_primary_error():
+    """Test that a hedged call succeeding hides the error of a slow call."""
+    stalled = threading.Event()
+
+    def primary():
+        stalled.wait()
+        raise ConnectionError("connection reset")
+
+    def hedge():
+        stalled.set()
+        return "hedge"
+
+    assert call_with_hedge(primary, hedge, delay=0.01) == "hedge"
+
+
+def test_call_with_hedge_both_errors():
+    """Test that the error of the first call is raised when both calls fail."""
+    stalled = threading.Event()
+
+    def primary():
+        stalled.wait()
+        raise ConnectionError("connection reset")
+
+    def hedge():
+        stalled.set()
+        raise TimeoutError("timed out")
+
+    with pytest.raises(ConnectionError):
+        call_with_hedge(primary, hedge, delay=0.01)
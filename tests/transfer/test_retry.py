@@ -0,0 +1,71 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from backup.transfer.retry import call_with_retry, get_delay
+
+
+def test_get_delay():
+    """Test that delays grow exponentially, up to the maximum delay."""
+    with patch("backup.transfer.retry.random.uniform", side_effect=lambda a, b: b):
+        assert [get_delay(attempt, 1.0, 5.0) for attempt in range(5)] == [
+            1.0,
+            2.0,
+            4.0,
+            5.0,
+            5.0,
+        ]
+
+
+def test_call_with_retry_transient_error():
+    """Test that a transient error is retried until the call succeeds."""
+    fn = MagicMock(side_effect=[ConnectionError(), ConnectionError(), "result"])
+
+    result = call_with_retry(
+        fn,
+        args=(1,),
+        retryable=lambda exc: isinstance(exc, ConnectionError),
+        retries=5,
+        delay=0,
+    )
+
+    assert result == "result"
+    assert fn.call_count == 3
+
+
+def test_call_with_retry_permanent_error():
+    """Test that an error that isn't retryable is raised immediately."""
+    fn = MagicMock(side_effect=ValueError())
+
+    with pytest.raises(ValueError):
+        call_with_retry(
+            fn,
+            retryable=lambda exc: isinstance(exc, ConnectionError),
+            retries=5,
+            delay=0,
+        )
+
+    assert fn.call_count == 1
+
+
+def test_call_with_retry_exhausted():
+    """Test that the last error is raised once the retries have run out."""
+    fn = MagicMock(side_effect=ConnectionError())
+
+    with pytest.raises(ConnectionError):
+        call_with_retry(fn, retryable=lambda exc: True, retries=3, delay=0)
+
+    assert fn.call_count == 4
+
+
+def test_call_with_retry_cancelled():
+    """Test that a cancelled call stops retrying without waiting out its delay."""
+    cancelled = threading.Event()
+    cancelled.set()
+    fn = MagicMock(side_effect=ConnectionError())
+
+    with pytest.raises(ConnectionError):
+        call_with_retry(fn, retryable=lambda exc: True, retries=3, cancelled=cancelled)
+
+    assert fn.call_count == 1
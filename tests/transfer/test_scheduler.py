@@ -0,0 +1,148 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from backup.transfer.scheduler import UploadScheduler
+
+
+def test_scheduler_memory_limit():
+    """Test that the scheduler never holds more chunks in flight than its budget."""
+    lock = threading.Lock()
+    in_flight = []
+    uploaded = []
+
+    def upload(offset, size):
+        with lock:
+            in_flight.append(size)
+            assert sum(in_flight) <= 300
+
+        time.sleep(0.01)
+
+        with lock:
+            in_flight.remove(size)
+            uploaded.append(offset)
+
+    with UploadScheduler(workers=8, memory_limit=300) as scheduler:
+        for offset in range(0, 1000, 100):
+            scheduler.submit(100, upload, offset, 100)
+
+    assert sorted(uploaded) == list(range(0, 1000, 100))
+    assert scheduler.peak == 300
+    assert scheduler.buffered == 0
+
+
+def test_scheduler_reserve():
+    """Test that the chunk being read counts against the budget once it's reserved,
+    and is submitted into its reservation without blocking again."""
+    lock = threading.Lock()
+    held = []
+
+    def upload(size):
+        time.sleep(0.01)
+
+        with lock:
+            held.remove(size)
+
+    with UploadScheduler(workers=8, memory_limit=300) as scheduler:
+        for _ in range(10):
+            scheduler.reserve(100)
+
+            # the chunk is read into memory once room for it has been reserved.
+
+            with lock:
+                held.append(100)
+                assert sum(held) <= 300
+
+            scheduler.submit(100, upload, 100)
+
+        scheduler.reserve(100)
+        scheduler.unreserve()
+
+    assert held == []
+    assert scheduler.peak == 300
+    assert scheduler.buffered == 0
+
+
+def test_scheduler_oversized_chunk():
+    """Test that a chunk larger than the budget is still uploaded, on its own."""
+    uploaded = []
+
+    with UploadScheduler(workers=2, memory_limit=10) as scheduler:
+        scheduler.submit(50, uploaded.append, 1)
+        scheduler.submit(50, uploaded.append, 2)
+
+    assert uploaded == [1, 2]
+    assert scheduler.peak == 50
+
+
+def test_scheduler_error():
+    """Test that the first failed chunk stops the producer and is raised on close."""
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        raise RuntimeError("upload failed")
+
+    scheduler = UploadScheduler(workers=1, memory_limit=10)
+    scheduler.submit(10, fail)
+    started.wait()
+
+    with pytest.raises(RuntimeError):
+        for _ in range(10):
+            scheduler.submit(10, lambda: None)
+
+    with pytest.raises(RuntimeError):
+        scheduler.close()
+
+
+def test_scheduler_producer_error():
+    """Test that an error raised by the producer is raised instead of chunk errors."""
+    with pytest.raises(ValueError):
+        with UploadScheduler(workers=1, memory_limit=10) as scheduler:
+            scheduler.submit(10, lambda: None)
+            raise ValueError("producer failed")
+
+
+def test_scheduler_retry():
+    """Test that chunks failing with a transient error are retried."""
+    attempts = []
+
+    def upload():
+        attempts.append(1)
+
+        if len(attempts) < 3:
+            raise ConnectionError("connection reset")
+
+    with patch("backup.settings.BACKUP_UPLOAD_RETRY_DELAY", 0):
+        with UploadScheduler(
+            workers=1,
+            memory_limit=10,
+            retryable=lambda exc: isinstance(exc, ConnectionError),
+        ) as scheduler:
+            scheduler.submit(10, upload)
+
+    assert len(attempts) == 3
+
+
+def test_scheduler_error_skips_pending():
+    """Test that chunks that haven't started when a chunk fails are never uploaded."""
+    uploaded = []
+
+    def fail():
+        raise RuntimeError("upload failed")
+
+    scheduler = UploadScheduler(workers=1, memory_limit=100)
+    scheduler.submit(10, fail)
+
+    for i in range(5):
+        try:
+            scheduler.submit(10, uploaded.append, i)
+        except RuntimeError:
+            break
+
+    with pytest.raises(RuntimeError):
+        scheduler.close()
+
+    assert uploaded == []
@@ -0,0 +1,61 @@
+import pytest
+
+from backup import settings, transport
+
+
+@pytest.fixture(autouse=True)
+def sessions():
+    """Fixture for closing the shared sessions created by each test."""
+    yield
+
+    transport.close_sessions()
+
+
+def test_get_session_shared():
+    """Test that clients of the same host share a single session."""
+    session = transport.get_session("https://account.blob.core.windows.net")
+
+    assert transport.get_session("https://ACCOUNT.blob.core.windows.net/") is session
+    assert transport.get_session("https://other.blob.core.windows.net") is not session
+
+
+def test_get_session_pool_size(monkeypatch):
+    """Test that the connection pool of a session is sized from the settings, and
+    that retries are left to the azure sdk."""
+    monkeypatch.setattr(settings, "BACKUP_HTTP_POOL_SIZE", 24)
+
+    session = transport.get_session("https://account.blob.core.windows.net")
+    adapter = session.get_adapter("https://account.blob.core.windows.net/container")
+
+    assert isinstance(adapter, transport.KeepAliveHTTPAdapter)
+    assert adapter._pool_maxsize == 24
+    assert adapter.max_retries.total is False
+
+
+def test_get_session_block_size():
+    """Test that pooled connections send request bodies in larger blocks."""
+    session = transport.get_session("https://account.blob.core.windows.net")
+    adapter = session.get_adapter("https://account.blob.core.windows.net/container")
+    pool = adapter.poolmanager.connection_from_url(
+        "https://account.blob.core.windows.net/container"
+    )
+
+    assert pool.conn_kw["blocksize"] == transport.BLOCK_SIZE
+
+
+def test_get_transport(monkeypatch):
+    """Test that every transport uses the shared session, without owning it."""
+    monkeypatch.setattr(settings, "BACKUP_HTTP_CONNECTION_TIMEOUT", 5)
+    monkeypatch.setattr(settings, "BACKUP_HTTP_READ_TIMEOUT", 30)
+
+    first = transport.get_transport("https://test.vault.azure.net/")
+    second = transport.get_transport("https://test.vault.azure.net/")
+
+    assert first is not second
+    assert first.session is second.session
+    assert first.connection_config.timeout == 5
+    assert first.connection_config.read_timeout == 30
+
+    first.close()
+
+    assert transport.get_session("https://test.vault.azure.net/") is first.session